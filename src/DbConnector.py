@@ -1,24 +1,78 @@
 # DbConnector.py
 from pymongo import MongoClient
-from pathlib import Path
-from dotenv import load_dotenv
+from pymongo import read_preferences
 from os import getenv
+import logging
+from env import load_env
+
+logger = logging.getLogger("mongofilm")
+
+
+def settings(HOST=None, DATABASE=None, USER=None, PASSWORD=None, PORT=None):
+    """Connection settings: the arguments given, else the environment / .env, else the defaults."""
+    load_env()
+    return (
+        HOST or getenv("HOSTNAME") or "127.0.0.1",
+        DATABASE or getenv("DATABASE") or "mongofilm",
+        # sanitize empty strings to None
+        USER or getenv("USERNAME") or None,
+        PASSWORD or getenv("PASSWORD") or None,
+        PORT or getenv("PORT") or "27017"
+    )
+
+
+def build_uri(host, database, user=None, password=None, port="27017"):
+    load_env()
+    # MONGO_URI overrides the single-host URI (e.g. a mongos list for a sharded cluster)
+    if getenv("MONGO_URI"):
+        return getenv("MONGO_URI")
+    if user and password:
+        return f"mongodb://{user}:{password}@{host}:{port}/{database}"
+    return f"mongodb://{host}:{port}/"
+
+READ_MODES = {
+    "primary": read_preferences.Primary,
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest
+}
+
+
+def parse_tags(tags):
+    """Tag set from "name:value" pairs, e.g. "nodeType:ANALYTICS,dc:east"."""
+    return dict(pair.split(":", 1) for pair in tags.split(",") if pair) if tags else {}
+
+
+def analytics_read_preference(mode=None, tags=None, max_staleness=None):
+    """
+    Read preference of the analytical connections, from the arguments or the
+    ANALYTICS_READ_PREFERENCE (default secondaryPreferred), ANALYTICS_TAGS and
+    MAX_STALENESS_SECONDS settings. Tagged members are tried first, then any
+    eligible member. maxStalenessSeconds must be at least 90 (-1: no limit).
+    """
+    load_env()
+    mode = mode or getenv("ANALYTICS_READ_PREFERENCE") or "secondaryPreferred"
+    if mode not in READ_MODES:
+        raise ValueError(f"Unknown read preference {mode!r}; expected one of {', '.join(READ_MODES)}")
+    if mode == "primary":
+        return read_preferences.Primary()
+    tags = parse_tags(tags if tags is not None else getenv("ANALYTICS_TAGS"))
+    if max_staleness is None:
+        max_staleness = int(getenv("MAX_STALENESS_SECONDS") or -1)
+    return READ_MODES[mode](tag_sets=[tags, {}] if tags else None, max_staleness=max_staleness)
 
-# load .env from project root (parent of this file)
-load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
 
 class DbConnector:
     def __init__(self,
-                 HOST=getenv("HOSTNAME") or "127.0.0.1",
-                 DATABASE=getenv("DATABASE") or "mongofilm",
-                 USER=getenv("USERNAME") or None,
-                 PASSWORD=getenv("PASSWORD") or None,
-                 PORT=getenv("PORT") or "27017"):
-        # sanitize empty strings to None
-        if USER == "":
-            USER = None
-        if PASSWORD == "":
-            PASSWORD = None
+                 HOST=None,
+                 DATABASE=None,
+                 USER=None,
+                 PASSWORD=None,
+                 PORT=None,
+                 quiet=False,
+                 analytics=False):
+        HOST, DATABASE, USER, PASSWORD, PORT = settings(HOST, DATABASE, USER, PASSWORD, PORT)
 
         # Ensure database name is a string
         if not isinstance(DATABASE, str) or DATABASE.strip() == "":
@@ -27,27 +81,54 @@ class DbConnector:
         self.host = HOST
         self.database_name = DATABASE
         self.port = PORT
+        # quiet: send the connection banners to the log instead of stdout
+        self.quiet = quiet
+        # analytics: reads follow analytics_read_preference(); writes always go to the primary
+        self.analytics = analytics
 
-        if USER and PASSWORD:
-            uri = f"mongodb://{USER}:{PASSWORD}@{self.host}:{self.port}/{self.database_name}"
-        else:
-            uri = f"mongodb://{self.host}:{self.port}/"
+        uri = build_uri(self.host, self.database_name, USER, PASSWORD, self.port)
 
         try:
             self.client = MongoClient(uri)
             # access database object
-            self.db = self.client[self.database_name]
+            read_preference = analytics_read_preference() if analytics else None
+            self.db = self.client.get_database(self.database_name, read_preference=read_preference)
         except Exception as e:
-            print("❌ ERROR: Failed to connect to db:", e)
+            logger.error("Failed to connect to db: %s", e)
             self.client = None
             self.db = None
             raise RuntimeError("Could not connect to MongoDB: " + str(e))
 
-        print("✅ Connected to database:", self.db.name)
-        print("-----------------------------------------------\n")
+        if self.quiet:
+            logger.info("Connected to database: %s", self.db.name)
+        else:
+            print("✅ Connected to database:", self.db.name)
+            print("-----------------------------------------------\n")
+
+    def serving_node(self):
+        """host:port of the member this connection's reads are routed to."""
+        return self.db.command("hello", read_preference=self.db.read_preference).get("me")
 
     def close_connection(self):
         if self.client:
             self.client.close()
-            print("\n-----------------------------------------------")
-            print("Connection to %s-db is closed" % self.db.name)
+            if self.quiet:
+                logger.info("Connection to %s-db is closed", self.db.name)
+            else:
+                print("\n-----------------------------------------------")
+                print("Connection to %s-db is closed" % self.db.name)
+
+
+def main():
+    primary = DbConnector(quiet=True)
+    analytics = DbConnector(quiet=True, analytics=True)
+    try:
+        print(f"Ingestion reads/writes: {primary.serving_node()} ({primary.db.read_preference.mongos_mode})")
+        print(f"Analytical reads:       {analytics.serving_node()} ({analytics.db.read_preference.document})")
+    finally:
+        analytics.close_connection()
+        primary.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# async_queries.py
+import asyncio
+import time
+from pymongo import AsyncMongoClient
+from DbConnector import build_uri, settings, analytics_read_preference
+import ratings_schema
+import budgets
+from categorical import Dictionary
+import query1, query2, query3, query4, query5, query6, query7, query8, query9, query10
+
+
+class AsyncQueryService:
+    """
+    Coroutine versions of the task_*/query_* reports, built on pymongo's async
+    client and sharing the pipelines of the synchronous modules. Methods return
+    plain data (no printing or CSV export). At most `max_concurrency`
+    aggregations run against the server at the same time.
+    """
+
+    def __init__(self,
+                 max_concurrency=8,
+                 HOST=None,
+                 DATABASE=None,
+                 USER=None,
+                 PASSWORD=None,
+                 PORT=None,
+                 *,
+                 max_time_ms=budgets.DEFAULT_MAX_TIME_MS):
+        HOST, DATABASE, USER, PASSWORD, PORT = settings(HOST, DATABASE, USER, PASSWORD, PORT)
+        self.client = AsyncMongoClient(build_uri(HOST, DATABASE, USER, PASSWORD, PORT))
+        # report-only service: reads are routed like DbConnector(analytics=True)
+        self.db = self.client.get_database(DATABASE, read_preference=analytics_read_preference())
+        self.limiter = asyncio.Semaphore(max_concurrency)
+        # server-side budget of every aggregation (see budgets.py)
+        self.max_time_ms = max_time_ms
+        self.compact_ratings = None
+        self.dictionary = None
+
+    async def aggregate(self, collection, pipeline, **kwargs):
+        kwargs.setdefault("maxTimeMS", self.max_time_ms)
+        kwargs.setdefault("comment", budgets.comment_for(f"async:{collection}"))
+        async with self.limiter:
+            cursor = await self.db[collection].aggregate(pipeline, **kwargs)
+            return await cursor.to_list(None)
+
+    async def ratings_pipeline(self, pipeline):
+        """Translate a ratings pipeline for the stored layout (see ratings_schema.py)."""
+        if self.compact_ratings is None:
+            sample = await self.db.ratings.find_one({}, {"_id": 0, "u": 1})
+            self.compact_ratings = bool(sample) and "u" in sample
+        return ratings_schema.translate(None, pipeline, self.compact_ratings)
+
+    async def categorical(self):
+        """The value <-> code dictionary of the encoded categorical fields (see categorical.py)."""
+        if self.dictionary is None:
+            # like Dictionary.load: empty until categorical.encode has finished
+            state = await self.db.load_state.find_one({"_id": "categorical"}) or {}
+            entries = []
+            if state.get("done"):
+                entries = await self.db.dictionary.find({}, {"_id": 0, "field": 1, "code": 1, "value": 1}).to_list(None)
+            self.dictionary = Dictionary(entries)
+        return self.dictionary
+
+    async def query_top_directors(self, min_movies=5, median="exact"):
+        director_job = (await self.categorical()).code("job", "Director")
+        movies = await self.aggregate("movies", query1.build_pipeline(director_job))
+        # the Python-side reduction is CPU bound: keep it off the event loop
+        return await asyncio.to_thread(query1.summarize_directors, movies, min_movies, director_job, median)
+
+    async def query_actor_pairs_costarring(self, min_movies=3):
+        movies = await self.aggregate("movies", query2.build_pipeline())
+        return await asyncio.to_thread(query2.count_actor_pairs, movies, min_movies)
+
+    async def query_top_actors_by_genre_breadth(self, min_movies=10, top_n=10, example_genres=5):
+        return await self.aggregate("movies", query3.build_pipeline(min_movies, top_n, example_genres))
+
+    async def task_4_top_collections(self, top_n=10, min_movies=3, median="exact"):
+        return await self.aggregate("movies", query4.build_pipeline(top_n, min_movies, median))
+
+    async def task_5_median_runtime_by_decade_genre(self, genre_mask=0, median="exact"):
+        return await self.aggregate("movies", query5.build_pipeline(genre_mask, median))
+
+    async def task_6_female_proportion_by_decade(self, top_cast=5):
+        return await self.aggregate("movies", query6.build_pipeline(top_cast))
+
+    async def task_7_top_noir_movies(self, top_n=20, min_votes=50):
+        return await self.aggregate("movies", query7.build_pipeline(top_n, min_votes))
+
+    async def task_8_top_director_actor_pairs(self, min_collabs=3, top_n=20, min_votes=100):
+        director_job = (await self.categorical()).code("job", "Director")
+        return await self.aggregate("movies", query8.build_pipeline(min_collabs, top_n, min_votes, director_job))
+
+    async def task_9_top_original_languages(self, top_n=10, country="US", country_name="United States of America", exclude_language="en"):
+        d = await self.categorical()
+        pipeline = query9.build_pipeline(top_n, d.code("country", country), country_name, d.code("language", exclude_language))
+        return d.decode_rows(await self.aggregate("movies", pipeline), {"original_language": "language"})
+
+    async def task_10_user_stats_optimized(self, top_n=10, min_ratings_for_variance=20, example_genres=5, bucketed=False):
+        pipeline = query10.build_pipeline(top_n, min_ratings_for_variance, example_genres, bucketed)
+        if bucketed:
+            docs = await self.aggregate("user_ratings", pipeline, allowDiskUse=True)
+        else:
+            docs = await self.aggregate("ratings", await self.ratings_pipeline(pipeline), allowDiskUse=True)
+        return docs[0] if docs else {"top_genre_diverse": [], "top_variance": []}
+
+    async def close(self):
+        await self.client.close()
+
+
+async def run_all():
+    service = AsyncQueryService()
+    try:
+        reports = {
+            "query1": service.query_top_directors(),
+            "query3": service.query_top_actors_by_genre_breadth(),
+            "query4": service.task_4_top_collections(),
+            "query5": service.task_5_median_runtime_by_decade_genre(),
+            "query6": service.task_6_female_proportion_by_decade(),
+            "query7": service.task_7_top_noir_movies(),
+            "query8": service.task_8_top_director_actor_pairs(),
+            "query9": service.task_9_top_original_languages()
+        }
+        start = time.time()
+        results = await asyncio.gather(*reports.values())
+        print(f"{len(results)} reports in {time.time() - start:.2f}s")
+        for name, rows in zip(reports, results):
+            print(f"   • {name}: {len(rows)} rows")
+    finally:
+        await service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_all())
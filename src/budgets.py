@@ -0,0 +1,87 @@
+# budgets.py
+import uuid
+from pymongo import ReadPreference
+from pymongo.errors import OperationFailure
+from report import logger
+
+# server-side time limit (maxTimeMS) of tasks without their own
+DEFAULT_MAX_TIME_MS = 120_000
+
+DEFAULT_BATCH_SIZE = 1000
+
+# error code of QueryExceededMemoryLimitNoDiskUseAllowed
+QUERY_MEMORY_LIMIT = 292
+
+# stages that hold their whole input before emitting (spill to disk only with allowDiskUse)
+BLOCKING_STAGES = {"$group", "$sort", "$bucket", "$bucketAuto", "$facet", "$setWindowFields", "$sortByCount"}
+
+
+def comment_for(name):
+    """Unique aggregate comment: shows up in currentOp, the profiler and slow-query logs."""
+    return f"mongofilm:{name}:{uuid.uuid4().hex[:12]}"
+
+
+def running_ops(db, comment, read_preference):
+    pipeline = [{"$currentOp": {"allUsers": True}}, {"$match": {"command.comment": comment}}]
+    admin = db.client.get_database("admin", read_preference=read_preference)
+    return list(admin.aggregate(pipeline))
+
+
+def kill(db, comment):
+    """
+    Best-effort killOp of the operations tagged with `comment`, on the member
+    the reads were routed to and on the primary. Returns the killed op ids.
+    """
+    killed = []
+    targets = [db.read_preference] + ([ReadPreference.PRIMARY] if db.read_preference != ReadPreference.PRIMARY else [])
+    for read_preference in targets:
+        admin = db.client.get_database("admin", read_preference=read_preference)
+        try:
+            for op in running_ops(db, comment, read_preference):
+                admin.command("killOp", op=op["opid"], read_preference=read_preference)
+                killed.append(op["opid"])
+        except OperationFailure as e:
+            logger.warning("Could not cancel %s: %s", comment, e)
+    return killed
+
+
+def winning_plans(explain):
+    """Every winningPlan in an explain document (aggregation, sharded or not)."""
+    if isinstance(explain, dict):
+        if "winningPlan" in explain:
+            yield explain["winningPlan"]
+        for value in explain.values():
+            yield from winning_plans(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from winning_plans(value)
+
+
+def plan_stages(plan):
+    """(stage, index name) of every node of a query plan tree."""
+    plan = plan.get("queryPlan", plan)
+    yield plan.get("stage"), plan.get("indexName")
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from plan_stages(child)
+
+
+def explain_cost(db, collection, pipeline):
+    """
+    Pre-run cost estimate from the query planner (nothing is executed): how
+    the first stage reads the collection, its size and the blocking stages
+    and joins the rest of the pipeline adds.
+    """
+    explain = db.command("explain", {"aggregate": collection, "pipeline": pipeline, "cursor": {}},
+                         verbosity="queryPlanner", read_preference=db.read_preference)
+    stages = [s for plan in winning_plans(explain) for s in plan_stages(plan)]
+    names = {stage for stage, _ in stages}
+    operators = [next(iter(stage)) for stage in pipeline]
+    return {
+        "collection": collection,
+        "documents": db[collection].estimated_document_count(),
+        "access": "COLLSCAN" if "COLLSCAN" in names else ("IXSCAN" if "IXSCAN" in names else ", ".join(sorted(filter(None, names)))),
+        "indexes": sorted({index for _, index in stages if index}),
+        "blocking_stages": sum(op in BLOCKING_STAGES for op in operators),
+        "lookups": operators.count("$lookup")
+    }
@@ -0,0 +1,184 @@
+# categorical.py
+import time
+from collections import Counter
+from pymongo import UpdateOne
+from report import logger
+
+# dictionary field -> where its values live: (collection, array field or None, value field)
+FIELDS = {
+    "language": [("movies", None, "original_language")],
+    "country": [("movies", "production_countries", "iso_3166_1"), ("movies", "production_companies", "origin_country")],
+    "company": [("movies", "production_companies", "name")],
+    "job": [("movies", "crew", "job"), ("credits", None, "job")],
+    "department": [("movies", "crew", "department"), ("credits", None, "department")]
+}
+
+
+class Dictionary:
+    """
+    value <-> code per dictionary field, read from the `dictionary` collection.
+    Without encoded data it is empty and code()/decode() return values as they
+    are, so callers work on both layouts.
+    """
+
+    def __init__(self, entries=()):
+        self.codes = {}
+        self.values = {}
+        for e in entries:
+            self.codes.setdefault(e["field"], {})[e["value"]] = e["code"]
+            self.values.setdefault(e["field"], {})[e["code"]] = e["value"]
+
+    @classmethod
+    def load(cls, db):
+        """The stored dictionary, or an empty one until encode() has finished."""
+        if not is_encoded(db):
+            return cls()
+        return cls(db.dictionary.find({}, {"_id": 0, "field": 1, "code": 1, "value": 1}))
+
+    @property
+    def encoded(self):
+        return bool(self.codes)
+
+    def code(self, field, value):
+        """Code of a value; -1 (matches nothing) for values absent from the data."""
+        if not self.encoded or value is None:
+            return value
+        return self.codes.get(field, {}).get(value, -1)
+
+    def decode(self, field, code):
+        if not self.encoded or code is None:
+            return code
+        return self.values.get(field, {}).get(code, code)
+
+    def decode_rows(self, rows, columns):
+        """Decode `columns` ({column: dictionary field}) of result rows in place."""
+        if self.encoded:
+            for row in rows:
+                for column, field in columns.items():
+                    if column in row:
+                        row[column] = self.decode(field, row[column])
+        return rows
+
+
+def is_encoded(db):
+    return bool((db.load_state.find_one({"_id": "categorical"}) or {}).get("done"))
+
+
+def stored_codes(db):
+    """{field: {value: code}} of the dictionary collection, finished or not."""
+    codes = {field: {} for field in FIELDS}
+    for e in db.dictionary.find({}, {"_id": 0, "field": 1, "code": 1, "value": 1}):
+        codes.setdefault(e["field"], {})[e["value"]] = e["code"]
+    return codes
+
+
+def count_values(db):
+    """Occurrences of every value of every dictionary field."""
+    counts = {field: Counter() for field in FIELDS}
+    projection = {"_id": 0}
+    for field, places in FIELDS.items():
+        for collection, array, name in places:
+            if collection == "movies":
+                projection[f"{array}.{name}" if array else name] = 1
+
+    for movie in db.movies.find({}, projection):
+        for field, places in FIELDS.items():
+            for collection, array, name in places:
+                if collection != "movies":
+                    continue
+                items = (movie.get(array) or []) if array else [movie]
+                counts[field].update(item.get(name) for item in items if item.get(name) is not None)
+
+    # credits also hold the cast rows ("Actor" / "Acting"), which movie crews do not
+    for field in ("job", "department"):
+        for row in db.credits.aggregate([{"$group": {"_id": f"${field}", "n": {"$sum": 1}}}]):
+            if row["_id"] is not None and row["_id"] not in counts[field]:
+                counts[field][row["_id"]] = row["n"]
+    return counts
+
+
+def encode_value(codes, value):
+    return None if value is None else codes.get(value, value)
+
+
+def encode_movie(movie, codes):
+    """$set document replacing the categorical strings of one movie by their codes."""
+    update = {}
+    for field, places in FIELDS.items():
+        for collection, array, name in places:
+            if collection != "movies":
+                continue
+            if array is None:
+                if name in movie:
+                    update[name] = encode_value(codes[field], movie[name])
+            elif movie.get(array):
+                items = update.get(array, movie[array])
+                update[array] = [{**item, name: encode_value(codes[field], item.get(name))} if name in item else item
+                                 for item in items]
+    return update
+
+
+def collection_sizes(db, names=("movies", "credits")):
+    sizes = {}
+    for name in names:
+        stats = db.command("collStats", name)
+        sizes[name] = (stats.get("size", 0), stats.get("totalIndexSize", 0))
+    return sizes
+
+
+def encode(db, batch_size=1000):
+    """
+    Replace the categorical strings of movies and credits by small integer
+    codes (most frequent value = 0) and store the dictionaries in the
+    `dictionary` collection. load_state "categorical" is marked done last:
+    readers ignore the dictionary until then, and an interrupted run is
+    redone with the codes already stored (values that are codes already are
+    left alone; new values get the next codes). Skipped once done.
+    """
+    if is_encoded(db):
+        logger.info("Categorical fields already encoded")
+        return Dictionary.load(db)
+
+    start = time.time()
+    before = collection_sizes(db)
+    counts = count_values(db)
+    codes = stored_codes(db)
+    entries = []
+    for field, c in counts.items():
+        for value, n in c.most_common():
+            if isinstance(value, str) and value not in codes[field]:
+                codes[field][value] = len(codes[field])
+                entries.append({"field": field, "code": codes[field][value], "value": value, "count": n})
+
+    if entries:
+        db.dictionary.insert_many(entries)
+    db.dictionary.create_index([("field", 1), ("code", 1)], unique=True)
+    db.dictionary.create_index([("field", 1), ("value", 1)], unique=True)
+
+    # movies: embedded arrays, re-encoded client-side in one pass
+    projection = {"_id": 1, **{(array or name): 1 for places in FIELDS.values() for c, array, name in places if c == "movies"}}
+    ops, updated = [], 0
+    for movie in db.movies.find({}, projection):
+        update = encode_movie(movie, codes)
+        if update:
+            ops.append(UpdateOne({"_id": movie["_id"]}, {"$set": update}))
+        if len(ops) >= batch_size:
+            updated += db.movies.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.movies.bulk_write(ops, ordered=False).modified_count
+
+    # credits: flat fields with small dictionaries, re-encoded server-side
+    def lookup(field):
+        values = [v for v, _ in sorted(codes[field].items(), key=lambda kv: kv[1])]
+        return {"$cond": [{"$eq": [{"$type": f"${field}"}, "string"]}, {"$indexOfArray": [values, f"${field}"]}, f"${field}"]}
+    db.credits.update_many({}, [{"$set": {"job": lookup("job"), "department": lookup("department")}}])
+
+    db.load_state.update_one({"_id": "categorical"}, {"$set": {"done": True}}, upsert=True)
+
+    after = collection_sizes(db)
+    for name in before:
+        logger.info("%s: data %.1f -> %.1f MiB, indexes %.1f -> %.1f MiB", name,
+                    before[name][0] / 2**20, after[name][0] / 2**20, before[name][1] / 2**20, after[name][1] / 2**20)
+    logger.info("Encoded %s values, %s movies in %.2fs", f"{sum(len(v) for v in codes.values()):,}", f"{updated:,}", time.time() - start)
+    return Dictionary.load(db)
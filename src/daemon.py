@@ -0,0 +1,138 @@
+# daemon.py
+import argparse
+import json
+import socket
+import socketserver
+import sys
+import time
+from os import getenv
+from pathlib import Path
+from report import render, export_csv
+
+SOCKET = Path(__file__).resolve().parent.parent / "dat" / "mongofilm.sock"
+RESULTS = Path(__file__).resolve().parent.parent / "results"
+
+
+def socket_path():
+    return Path(getenv("QUERY_SOCKET") or SOCKET)
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON request per line: {"task": name, "params": {...}} -> {"rows": [...]},
+    or {"describe": [names]} -> {"params": {name: [parameter names]}}; failures
+    reply {"error": ...}.
+    """
+
+    def handle(self):
+        from registry import REGISTRY
+        for line in self.rfile:
+            start = time.time()
+            try:
+                request = json.loads(line)
+                names = request["describe"] if "describe" in request else [request["task"]]
+                unknown = [name for name in names if name not in REGISTRY]
+                if unknown:
+                    reply = {"error": f"Unknown task(s) {', '.join(map(repr, unknown))}"}
+                elif "describe" in request:
+                    reply = {"params": {name: list(REGISTRY[name].params) for name in names}}
+                else:
+                    rows = self.server.engine.run(request["task"], **request.get("params", {}))
+                    reply = {"rows": rows, "elapsed": time.time() - start}
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reply, default=str, ensure_ascii=False) + "\n").encode())
+
+
+def serve(path=None):
+    """
+    Keep one QueryEngine (connected client, compiled pipelines) alive and
+    answer requests on a Unix socket, one at a time. Results are not cached:
+    the daemon outlives reloads, so every request reads the current data.
+    """
+    from registry import QueryEngine
+    from report import logger, configure_logging
+    configure_logging()
+    path = Path(path or socket_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+
+    engine = QueryEngine(quiet=True, export=False, cache_results=False)
+    engine.db.command("ping")
+    try:
+        with socketserver.UnixStreamServer(str(path), QueryHandler) as server:
+            server.engine = engine
+            logger.info("Serving queries on %s", path)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        path.unlink(missing_ok=True)
+
+
+def send(message, path=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path or socket_path()))
+        sock.sendall((json.dumps(message) + "\n").encode())
+        reply = json.loads(sock.makefile("rb").readline())
+    if "error" in reply:
+        raise RuntimeError(reply["error"])
+    return reply
+
+
+def request(task, params=None, path=None):
+    """Rows of `task` computed by a running daemon."""
+    return send({"task": task, "params": params or {}}, path)["rows"]
+
+
+def task_params(tasks, path=None):
+    """{task: parameter names} of registered tasks, from the daemon's registry."""
+    return send({"describe": list(tasks)}, path)["params"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Warm query daemon: `serve` starts it, any other arguments are tasks to run through it.")
+    parser.add_argument("tasks", nargs="+", help="`serve`, or registered task names")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    parser.add_argument("--no-export", action="store_true", help="do not write results/<task>.csv")
+    parser.add_argument("--socket", help=f"socket path (default: QUERY_SOCKET or {SOCKET})")
+    args = parser.parse_args()
+
+    if args.tasks == ["serve"]:
+        serve(args.socket)
+        return
+
+    for pair in args.overrides:
+        if "=" not in pair:
+            parser.error(f"--set expects name=value, got {pair!r}")
+    overrides = dict(pair.partition("=")[::2] for pair in args.overrides)
+    try:
+        names = task_params(args.tasks, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit(f"No query daemon on {args.socket or socket_path()}; start one with `python src/daemon.py serve`")
+    except RuntimeError as e:
+        sys.exit(str(e))
+    # like registry.py: every override must fit some task, each task gets the ones it has
+    for key in overrides:
+        if not any(key in names[task] for task in args.tasks):
+            sys.exit(f"No given task has a parameter {key!r}")
+
+    for task in args.tasks:
+        params = {k: v for k, v in overrides.items() if k in names[task]}
+        try:
+            rows = request(task, params, args.socket)
+        except RuntimeError as e:
+            print(f"{task}: {e}", file=sys.stderr)
+            continue
+        print(f"\n{task}")
+        print("-" * 80)
+        render(rows, args.format)
+        if not args.no_export:
+            export_csv(rows, RESULTS / f"{task}.csv")
+
+
+if __name__ == "__main__":
+    main()
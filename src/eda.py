@@ -18,6 +18,7 @@
 # %%
 from pathlib import Path
 import polars as pl
+from quality import RuleSet
 
 pl.Config.set_tbl_cols(-1)
 pl.Config.set_tbl_rows(-1)
@@ -32,6 +33,9 @@ csvs["keywords"] = pl.read_csv(dat / "origin" / "keywords.csv")
 csvs["ratings"] = pl.read_csv(dat / "origin" / "ratings.csv")
 csvs["links"] = pl.read_csv(dat / "origin" / "links.csv")
 
+# the cleaning rules live in quality.py, shared with the loader; each RuleSet counts its rejects
+rules = {file: RuleSet(file) for file in csvs.keys()}
+
 def summary(df):
     print(pl.DataFrame({
         "column": df.columns,
@@ -68,7 +72,7 @@ summary(csvs["movies"])
 # In addition, by looking at the numeric fields, we can disclose that the values are adequate (no negative budget, no negative vote count vote_average goes from 0-10, etc.). We also check that status does not have an unknown option that we could default the nulls to and found no data to clean in original_title.
 
 # %%
-csvs["movies"] = csvs["movies"].drop_nulls(["adult", "budget", "original_language", "overview", "popularity", "revenue", "runtime", "status", "title", "video", "vote_average", "vote_count"])
+csvs["movies"] = rules["movies"].apply(csvs["movies"], kinds=["not_null"])
 summary(csvs["movies"])
 print(csvs["movies"]["status"].unique())
 
@@ -78,14 +82,15 @@ print(csvs["movies"]["status"].unique())
 # Though similar, in title and poster_path we decided to keep repeated entries because, while not common, it could be the case that two different movies have the same title or image.
 
 # %%
-csvs["movies"] = csvs["movies"].drop_nulls(["imdb_id"]).unique(subset=["id"]).unique(subset=["imdb_id"])
+csvs["movies"] = rules["movies"].apply(csvs["movies"], kinds=["unique"])
 summary(csvs["movies"])
 
 # %% [markdown]
 # Next up is release_date, which will have its data changed to datetime as we deem it more appropiate. In this conversion we will also drop invalid dates and null entries.
 
 # %%
-csvs["movies"] = csvs["movies"].with_columns(pl.col("release_date").str.strptime(pl.Date, format="%Y-%m-%d", strict=False)).drop_nulls(["release_date"])
+csvs["movies"] = rules["movies"].apply(csvs["movies"], kinds=["valid_date"])
+csvs["movies"] = csvs["movies"].with_columns(pl.col("release_date").str.strptime(pl.Date, format="%Y-%m-%d", strict=False))
 summary(csvs["movies"])
 
 # %% [markdown]
@@ -97,12 +102,6 @@ summary(csvs["movies"])
 # %%
 from ast import literal_eval as parse
 
-def is_json(string):
-    try:
-        return isinstance(parse(string), (list, dict))
-    except Exception:
-        return False
-
 json_cols = [
     "belongs_to_collection",
     "genres",
@@ -111,11 +110,8 @@ json_cols = [
     "spoken_languages"
 ]
 
+csvs["movies"] = rules["movies"].apply(csvs["movies"], kinds=["is_json"])
 for col in json_cols:
-    csvs["movies"] = csvs["movies"].filter(
-        pl.col(col).is_null() |
-        pl.col(col).map_elements(is_json, return_dtype=pl.Boolean)
-    )
     print(csvs["movies"][col].drop_nulls().head(1))
 summary(csvs["movies"])
 
@@ -149,7 +145,7 @@ summary(csvs["credits"])
 # In this case, there are not null values and all the IDs are positive, but we need to eliminate the repeats.
 
 # %%
-csvs["credits"] = csvs["credits"].unique(subset=["id"])
+csvs["credits"] = rules["credits"].apply(csvs["credits"], kinds=["unique"])
 summary(csvs["credits"])
 
 # %% [markdown]
@@ -161,11 +157,7 @@ json_cols = [
     "crew"
 ]
 
-for col in json_cols:
-    csvs["credits"] = csvs["credits"].filter(
-        pl.col(col).is_null() |
-        pl.col(col).map_elements(is_json, return_dtype=pl.Boolean)
-    )
+csvs["credits"] = rules["credits"].apply(csvs["credits"], kinds=["is_json"])
 summary(csvs["credits"])
 
 for col in json_cols:
@@ -192,12 +184,7 @@ summary(csvs["keywords"])
 # The keywords CSV is very similar, so we will continue by doing the same procedure
 
 # %%
-csvs["keywords"] = csvs["keywords"].unique(subset=["id"])
-
-csvs["keywords"] = csvs["keywords"].filter(
-    pl.col("keywords").is_null() |
-    pl.col("keywords").map_elements(is_json, return_dtype=pl.Boolean)
-)
+csvs["keywords"] = rules["keywords"].apply(csvs["keywords"], kinds=["unique", "is_json"])
 summary(csvs["keywords"])
 
 print("----- keywords -----")
@@ -223,7 +210,7 @@ summary(csvs["ratings"])
 # We can see that this dataset contains a large amount of data, but it seems to be of good quality. There are no null values and all of the numbers seem to be appropiate (all of them positive, ratings from 0 to 5...) but the IDs are repeated. We will not remove entries indiscriminately, though, as the unique identifier for each entry is userId - movieId. We have to check if that subset is repeated.
 
 # %%
-csvs["ratings"] = csvs["ratings"].unique(subset=["userId", "movieId"])
+csvs["ratings"] = rules["ratings"].apply(csvs["ratings"], kinds=["not_null", "in_range", "unique"])
 summary(csvs["ratings"])
 
 # %% [markdown]
@@ -237,9 +224,9 @@ summary(csvs["links"])
 
 # %% [markdown]
 # There are some null values, so we will delete those entries. We will also delete repeated TMDB IDs.
-#
-csvs["links"] = csvs["links"].drop_nulls()
-csvs["links"] = csvs["links"].unique(subset=["tmdbId"])
+
+# %%
+csvs["links"] = rules["links"].apply(csvs["links"], kinds=["not_null", "unique"])
 summary(csvs["links"])
 
 # %% [markdown]
@@ -247,9 +234,9 @@ summary(csvs["links"])
 
 # %%
 
-csvs["movies"] = csvs["movies"].join(csvs["credits"].select("id"), on="id", how="semi").join(csvs["links"].select(pl.col("tmdbId").alias("id")), on="id", how="semi")
-csvs["credits"] = csvs["credits"].join(csvs["movies"].select("id"), on="id", how="semi")
-csvs["links"] = csvs["links"].join(csvs["movies"].select(pl.col("id").alias("tmdbId")), on="tmdbId", how="semi")
+csvs["movies"] = rules["movies"].apply(csvs["movies"], {"credits": csvs["credits"]["id"], "links": csvs["links"]["tmdbId"]}, kinds=["references"])
+csvs["credits"] = rules["credits"].apply(csvs["credits"], {"movies": csvs["movies"]["id"]}, kinds=["references"])
+csvs["links"] = rules["links"].apply(csvs["links"], {"movies": csvs["movies"]["id"]}, kinds=["references"])
 
 for file in ["movies", "credits", "links"]:
     print("----- " + file + " -----")
@@ -259,11 +246,17 @@ for file in ["movies", "credits", "links"]:
 # Also, ratings' ID points to the movieID and keywords' ID points to tmdbID, so we will remove both ratings and keywords which point to non-existent movies.
 
 # %%
-csvs["ratings"] = csvs["ratings"].join(csvs["links"].select("movieId"), on="movieId", how="semi")
-csvs["keywords"] = csvs["keywords"].join(csvs["links"].select(pl.col("tmdbId").alias("id")), on="id", how="semi")
+csvs["ratings"] = rules["ratings"].apply(csvs["ratings"], {"links": csvs["links"]["movieId"]}, kinds=["references"])
+csvs["keywords"] = rules["keywords"].apply(csvs["keywords"], {"links": csvs["links"]["tmdbId"]}, kinds=["references"])
 summary(csvs["ratings"])
 summary(csvs["keywords"])
 
+# %% [markdown]
+# These are the rows each cleaning rule removed:
+
+# %%
+print(pl.DataFrame([row for rule_set in rules.values() for row in rule_set.report()]))
+
 # %% [markdown]
 # Finally, we will write the datasets to disk in new, clean CSVs
 
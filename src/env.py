@@ -0,0 +1,13 @@
+# env.py
+from pathlib import Path
+
+_env_loaded = False
+
+
+def load_env():
+    """Load .env from the project root (parent of this file), once, on first use."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / ".env")
+        _env_loaded = True
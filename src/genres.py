@@ -0,0 +1,99 @@
+# genres.py
+import time
+from report import logger
+
+# bits 0..30 keep every mask a positive int32
+MAX_BITS = 31
+
+
+def mask_expr(bits):
+    """Expression OR-ing the bit of every genre name of a movie (duplicates count once)."""
+    return {
+        "$reduce": {
+            "input": {"$setUnion": [{"$ifNull": ["$genres.name", []]}]},
+            "initialValue": 0,
+            "in": {
+                "$bitOr": ["$$value", {
+                    "$switch": {
+                        "branches": [{"case": {"$eq": ["$$this", name]}, "then": 1 << bit} for name, bit in bits.items()],
+                        "default": 0
+                    }
+                }]
+            }
+        }
+    }
+
+
+def popcount_expr(field, bits=MAX_BITS):
+    """Number of set bits of an int field: the number of distinct genres in a mask."""
+    return {"$add": [
+        {"$cond": [{"$eq": [{"$bitAnd": [field, 1 << i]}, 0]}, 0, 1]}
+        for i in range(bits)
+    ]}
+
+
+def union_expr(array):
+    """OR of an array of masks, e.g. the genre_mask of every movie a user rated."""
+    return {"$reduce": {"input": {"$ifNull": [array, []]}, "initialValue": 0, "in": {"$bitOr": ["$$value", "$$this"]}}}
+
+
+def decode_stages(mask_field, as_field):
+    """
+    Stages replacing a mask with the sorted genre names it holds, via the
+    genres lookup collection. Meant for the last few rows of a pipeline.
+    """
+    return [
+        {
+            "$lookup": {
+                "from": "genres",
+                "let": {"mask": f"${mask_field}"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$ne": [{"$bitAnd": ["$$mask", "$mask"]}, 0]}}},
+                    {"$sort": {"name": 1}},
+                    {"$project": {"_id": 0, "name": 1}}
+                ],
+                "as": as_field
+            }
+        },
+        {"$set": {as_field: f"${as_field}.name"}}
+    ]
+
+
+def assign_bits(db):
+    """One bit per distinct genre, in TMDB genre id order."""
+    genres = list(db.movies.aggregate([
+        {"$unwind": "$genres"},
+        {"$group": {"_id": "$genres.name", "tmdb_id": {"$min": "$genres.id"}}},
+        {"$sort": {"tmdb_id": 1, "_id": 1}}
+    ]))
+    if len(genres) > MAX_BITS:
+        raise ValueError(f"{len(genres)} genres do not fit in a {MAX_BITS}-bit genre_mask")
+    return {g["_id"]: bit for bit, g in enumerate(genres)}
+
+
+def build(db):
+    """
+    (Re)build the genres lookup collection (bit, name, mask) and store the
+    genre_mask of every movie with one server-side update.
+    """
+    start = time.time()
+    bits = assign_bits(db)
+    db.genres.drop()
+    if bits:
+        db.genres.insert_many([{"_id": bit, "name": name, "mask": 1 << bit} for name, bit in bits.items()])
+    result = db.movies.update_many({}, [{"$set": {"genre_mask": mask_expr(bits) if bits else 0}}])
+    logger.info("genre_mask: %d genres, %s movies in %.2fs", len(bits), f"{result.modified_count:,}", time.time() - start)
+    return bits
+
+
+def mask_for(db, names):
+    """Mask of the given genre names (for $bitsAllSet / $bitsAnySet filters)."""
+    found = {g["name"]: g["mask"] for g in db.genres.find({"name": {"$in": list(names)}})}
+    missing = set(names) - set(found)
+    if missing:
+        raise ValueError(f"Unknown genre(s): {', '.join(sorted(missing))}")
+    return sum(found.values())
+
+
+def names_of(db, mask):
+    return [g["name"] for g in db.genres.find().sort("name", 1) if mask & g["mask"]]
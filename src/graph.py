@@ -0,0 +1,349 @@
+# graph.py
+from pathlib import Path
+import json
+import time
+import numpy as np
+from report import logger, configure_logging
+
+CAST = 1
+DIRECTOR = 2
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / "dat" / "graph"
+
+# bumped whenever the cached arrays change meaning; older caches are rebuilt
+CACHE_VERSION = 2
+
+
+def gather(offsets, rows):
+    """Positions of all CSR entries of `rows`, concatenated in row order."""
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows].astype(np.int64)
+    lengths = offsets[rows + 1].astype(np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(total, dtype=np.int64) + shift
+
+
+def to_csr(rows, cols, roles, n_rows):
+    """Sort edges by (row, col) and build offsets/indices/roles arrays."""
+    order = np.lexsort((cols, rows))
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets, cols[order].astype(np.int32), roles[order]
+
+
+class CollaborationGraph:
+    """
+    Person-movie bipartite graph in CSR form (both directions), built from the
+    movies collection. Edges are labelled CAST or DIRECTOR and weighted by how
+    many times the person is credited so in the movie. Arrays are cached as
+    .npy files and memory-mapped on load; names and titles go to a JSON side
+    file. Missing vote averages are NaN.
+    """
+
+    ARRAYS = [
+        "person_ids", "movie_ids",
+        "person_offsets", "person_movies", "person_roles", "person_weights",
+        "movie_offsets", "movie_people", "movie_roles", "movie_weights",
+        "movie_votes", "movie_vote_counts", "movie_revenue"
+    ]
+
+    def __init__(self, arrays, names, titles):
+        for key in self.ARRAYS:
+            setattr(self, key, arrays[key])
+        self.names = names
+        self.titles = titles
+
+    @classmethod
+    def build(cls, db, cache_dir=DEFAULT_CACHE):
+        """Stream the movies collection once and write the CSR arrays to cache_dir."""
+        logger.info("Building collaboration graph...")
+        start = time.time()
+
+        edge_people, edge_movies, edge_roles = [], [], []
+        movie_ids, votes, vote_counts, revenue, titles = [], [], [], [], []
+        names = {}
+
+        from categorical import Dictionary
+        director_job = Dictionary.load(db).code("job", "Director")
+
+        cursor = db.movies.find(
+            {},
+            {"_id": 0, "tmdbId": 1, "title": 1, "vote_average": 1, "vote_count": 1, "revenue": 1,
+             "cast.id": 1, "cast.name": 1, "crew.id": 1, "crew.name": 1, "crew.job": 1}
+        )
+        for m, movie in enumerate(cursor):
+            movie_ids.append(movie["tmdbId"])
+            titles.append(movie.get("title"))
+            votes.append(movie.get("vote_average") if movie.get("vote_average") is not None else np.nan)
+            vote_counts.append(movie.get("vote_count") or 0)
+            revenue.append(movie.get("revenue") or 0)
+            for actor in movie.get("cast") or []:
+                names.setdefault(actor["id"], actor.get("name"))
+                edge_people.append(actor["id"])
+                edge_movies.append(m)
+                edge_roles.append(CAST)
+            for member in movie.get("crew") or []:
+                if member.get("job") == director_job:
+                    names.setdefault(member["id"], member.get("name"))
+                    edge_people.append(member["id"])
+                    edge_movies.append(m)
+                    edge_roles.append(DIRECTOR)
+
+        edge_people = np.asarray(edge_people, dtype=np.int64)
+        edge_movies = np.asarray(edge_movies, dtype=np.int64)
+        edge_roles = np.asarray(edge_roles, dtype=np.uint8)
+
+        # one edge per (person, movie, role); repeated credits become its weight
+        key, weights = np.unique(np.stack([edge_people, edge_movies, edge_roles.astype(np.int64)], axis=1),
+                                 axis=0, return_counts=True)
+        edge_people, edge_movies, edge_roles = key[:, 0], key[:, 1], key[:, 2].astype(np.uint8)
+        edge_weights = weights.astype(np.uint16)
+
+        person_ids = np.unique(edge_people)
+        edge_person_idx = np.searchsorted(person_ids, edge_people)
+
+        arrays = {"person_ids": person_ids, "movie_ids": np.asarray(movie_ids, dtype=np.int64)}
+        arrays["person_offsets"], arrays["person_movies"], arrays["person_roles"] = \
+            to_csr(edge_person_idx, edge_movies, edge_roles, len(person_ids))
+        _, _, arrays["person_weights"] = to_csr(edge_person_idx, edge_movies, edge_weights, len(person_ids))
+        arrays["movie_offsets"], arrays["movie_people"], arrays["movie_roles"] = \
+            to_csr(edge_movies, edge_person_idx, edge_roles, len(movie_ids))
+        _, _, arrays["movie_weights"] = to_csr(edge_movies, edge_person_idx, edge_weights, len(movie_ids))
+        arrays["movie_votes"] = np.asarray(votes, dtype=np.float32)
+        arrays["movie_vote_counts"] = np.asarray(vote_counts, dtype=np.int32)
+        arrays["movie_revenue"] = np.asarray(revenue, dtype=np.float64)
+
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for key in cls.ARRAYS:
+            np.save(cache_dir / f"{key}.npy", arrays[key])
+        with open(cache_dir / "labels.json", "w", encoding="utf-8") as fh:
+            json.dump({"version": CACHE_VERSION, "names": [names[int(p)] for p in person_ids], "titles": titles}, fh)
+
+        logger.info("   ✓ %s people, %s movies, %s edges in %.2fs",
+                    f"{len(person_ids):,}", f"{len(movie_ids):,}", f"{len(edge_roles):,}", time.time() - start)
+        return cls.load(cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir=DEFAULT_CACHE):
+        cache_dir = Path(cache_dir)
+        arrays = {key: np.load(cache_dir / f"{key}.npy", mmap_mode="r") for key in cls.ARRAYS}
+        with open(cache_dir / "labels.json", encoding="utf-8") as fh:
+            labels = json.load(fh)
+        return cls(arrays, labels["names"], labels["titles"])
+
+    @classmethod
+    def load_or_build(cls, db, cache_dir=DEFAULT_CACHE, rebuild=False):
+        labels = Path(cache_dir) / "labels.json"
+        if not rebuild and labels.exists():
+            with open(labels, encoding="utf-8") as fh:
+                if json.load(fh).get("version") == CACHE_VERSION:
+                    return cls.load(cache_dir)
+        return cls.build(db, cache_dir)
+
+    # -- lookups ---------------------------------------------------------
+
+    def index(self, person_id):
+        i = int(np.searchsorted(self.person_ids, person_id))
+        if i >= len(self.person_ids) or self.person_ids[i] != person_id:
+            raise KeyError(f"Unknown person id: {person_id}")
+        return i
+
+    def name(self, person_id):
+        return self.names[self.index(person_id)]
+
+    def movies_of(self, person_id, role=None):
+        """Sorted movie indices of a person (optionally only in one role)."""
+        i = self.index(person_id)
+        lo, hi = self.person_offsets[i], self.person_offsets[i + 1]
+        movies = self.person_movies[lo:hi]
+        if role is not None:
+            movies = movies[self.person_roles[lo:hi] == role]
+        return np.unique(movies)
+
+    def shared_movies(self, person_a, person_b, role_a=None, role_b=None):
+        return np.intersect1d(self.movies_of(person_a, role_a), self.movies_of(person_b, role_b), assume_unique=True)
+
+    def pair_count(self, person_a, person_b, role_a=None, role_b=None):
+        """Number of movies where both people are credited (in the given roles)."""
+        return len(self.shared_movies(person_a, person_b, role_a, role_b))
+
+    def _co_counts(self, i, role=None, other_role=None, movie_mask=None):
+        """Person indices sharing movies with person index i, with shared-film counts."""
+        lo, hi = self.person_offsets[i], self.person_offsets[i + 1]
+        movies = self.person_movies[lo:hi]
+        if role is not None:
+            movies = movies[self.person_roles[lo:hi] == role]
+        if movie_mask is not None:
+            movies = movies[movie_mask[movies]]
+        movies = np.unique(movies).astype(np.int64)
+        pos = gather(self.movie_offsets, movies)
+        owners = np.repeat(movies, self.movie_offsets[movies + 1] - self.movie_offsets[movies])
+        people = self.movie_people[pos].astype(np.int64)
+        if other_role is not None:
+            keep = self.movie_roles[pos] == other_role
+            people, owners = people[keep], owners[keep]
+        # a person can hold several roles in one movie: count each movie once
+        n_people = len(self.person_ids)
+        people = np.unique(owners * n_people + people) % n_people
+        others, counts = np.unique(people, return_counts=True)
+        keep = others != i
+        return others[keep], counts[keep]
+
+    def top_collaborators(self, person_id, k=10, role=None, other_role=None):
+        """[(person_id, name, shared_films)] sorted by shared films descending."""
+        others, counts = self._co_counts(self.index(person_id), role, other_role)
+        order = np.lexsort((others, -counts))[:k]
+        return [(int(self.person_ids[o]), self.names[o], int(c)) for o, c in zip(others[order], counts[order])]
+
+    def neighbourhood(self, person_id, hops=1):
+        """Person ids reachable within `hops` co-credit steps (excluding the person)."""
+        start = self.index(person_id)
+        seen = np.zeros(len(self.person_ids), dtype=bool)
+        seen[start] = True
+        frontier = np.array([start], dtype=np.int64)
+        for _ in range(hops):
+            movies = np.unique(self.person_movies[gather(self.person_offsets, frontier)])
+            people = np.unique(self.movie_people[gather(self.movie_offsets, movies)])
+            frontier = people[~seen[people]]
+            if len(frontier) == 0:
+                break
+            seen[frontier] = True
+        seen[start] = False
+        return self.person_ids[np.flatnonzero(seen)]
+
+    def _pair_blocks(self, role, other_role, movie_mask=None, codes=None, max_pairs=2**24):
+        """
+        (keys, movies, weights) of every co-credit, for blocks of movies with
+        at most ~max_pairs of them: key = a * n + b for a credited in `role`
+        and b in `other_role` (person indices, or their `codes`), weight = the
+        rows the pipelines' $unwind of both credit arrays produce for the pair
+        in that movie. With one role each unordered pair appears once, a < b,
+        plus a person's pairs with their own repeated credits.
+        """
+        n_movies = len(self.movie_ids)
+        n = len(self.person_ids) if codes is None else int(codes.max()) + 1
+        movies = np.arange(n_movies) if movie_mask is None else np.flatnonzero(movie_mask)
+        lengths = np.diff(self.movie_offsets)
+        owners = np.repeat(np.arange(n_movies), lengths)
+        n_a = np.bincount(owners[self.movie_roles == role], minlength=n_movies)[movies]
+        n_b = np.bincount(owners[self.movie_roles == other_role], minlength=n_movies)[movies]
+        ends = np.cumsum(n_a * n_b)
+        cuts = np.searchsorted(ends, np.arange(max_pairs, ends[-1] if len(ends) else 0, max_pairs), side="right")
+
+        for lo, hi in zip(np.r_[0, cuts], np.r_[cuts, len(movies)]):
+            block = movies[lo:hi]
+            if len(block) == 0:
+                continue
+            pos = gather(self.movie_offsets, block)
+            local = np.repeat(np.arange(len(block)), lengths[block])
+            people = self.movie_people[pos].astype(np.int64)
+            roles = self.movie_roles[pos]
+            weights = self.movie_weights[pos].astype(np.int64)
+            a, b = roles == role, roles == other_role
+
+            # partners of every `role` credit: the `other_role` credits of its movie
+            b_offsets = np.zeros(len(block) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(local[b], minlength=len(block)), out=b_offsets[1:])
+            a_local = local[a]
+            fan = b_offsets[a_local + 1] - b_offsets[a_local]
+            q = gather(b_offsets, a_local)
+            left, right = np.repeat(people[a], fan), people[b][q]
+            pair_movies = block[np.repeat(a_local, fan)]
+            w_a = np.repeat(weights[a], fan)
+            w = w_a * weights[b][q]
+            if role == other_role:
+                # a person's repeated credits pair up with each other, C(w, 2) times
+                same = left == right
+                w = np.where(same, w_a * (w_a - 1) // 2, w)
+                keep = ((left < right) | same) & (w > 0)
+                left, right, pair_movies, w = left[keep], right[keep], pair_movies[keep], w[keep]
+            if codes is not None:
+                left, right = codes[left], codes[right]
+            yield left * n + right, pair_movies, w
+
+    def top_pairs(self, role, other_role, min_count=3, movie_mask=None, by_name=False, max_pairs=2**24):
+        """
+        Pairs credited together at least min_count times, person a in `role`
+        and b in `other_role`, counted like the $unwind/$group of the exact
+        queries: one per row combination, self-pairs included. by_name groups
+        people by name (as query8 groups by crew.name / cast.name). Returns
+        dicts with a, b (person ids, or names), count, mean_vote (missing
+        votes skipped, None if all are), mean_revenue and the pair's movie
+        indices, by count descending. The pair expansion is vectorized per
+        block of movies.
+        """
+        if by_name:
+            lookup = {}
+            codes = np.array([lookup.setdefault(name, len(lookup)) for name in self.names], dtype=np.int64)
+            labels = list(lookup)
+        else:
+            codes, labels = None, [int(p) for p in self.person_ids]
+        n = len(labels)
+        votes = np.asarray(self.movie_votes, dtype=np.float64)
+        voted = np.isfinite(votes)
+        votes = np.where(voted, votes, 0.0)
+        revenue = np.asarray(self.movie_revenue, dtype=np.float64)
+
+        parts = []
+        for keys, movies, w in self._pair_blocks(role, other_role, movie_mask, codes, max_pairs):
+            keys, inverse = np.unique(keys, return_inverse=True)
+            parts.append((keys, *(np.bincount(inverse, x, minlength=len(keys))
+                                  for x in (w, w * voted[movies], w * votes[movies], w * revenue[movies]))))
+        if not parts:
+            return []
+        keys, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        count, n_voted, vote_sum, revenue_sum = (
+            np.bincount(inverse, np.concatenate([p[i] for p in parts]), minlength=len(keys)) for i in range(1, 5))
+        keep = count >= min_count
+        keys, count, n_voted, vote_sum, revenue_sum = keys[keep], count[keep], n_voted[keep], vote_sum[keep], revenue_sum[keep]
+
+        # second pass: the movies of the kept pairs only
+        hit_keys, hit_movies = [], []
+        for block_keys, movies, _ in self._pair_blocks(role, other_role, movie_mask, codes, max_pairs):
+            hit = np.isin(block_keys, keys)
+            hit_keys.append(block_keys[hit])
+            hit_movies.append(movies[hit])
+        pair_movies = np.unique(np.concatenate(hit_keys) * len(self.movie_ids) + np.concatenate(hit_movies))
+        bounds = np.searchsorted(pair_movies // len(self.movie_ids), np.r_[keys, n * n])
+        pair_movies = pair_movies % len(self.movie_ids)
+
+        order = np.lexsort((keys, -count))
+        return [{
+            "a": labels[int(keys[i] // n)],
+            "b": labels[int(keys[i] % n)],
+            "count": int(count[i]),
+            "mean_vote": float(vote_sum[i] / n_voted[i]) if n_voted[i] else None,
+            "mean_revenue": float(revenue_sum[i] / count[i]),
+            "movies": pair_movies[bounds[i]:bounds[i + 1]]
+        } for i in order]
+
+    def has_votes(self):
+        """Mask of the movies with a vote_average."""
+        return np.isfinite(self.movie_votes)
+
+
+def main():
+    from DbConnector import DbConnector
+    configure_logging()
+    connection = DbConnector()
+    try:
+        graph = CollaborationGraph.load_or_build(connection.db, rebuild=True)
+        person = int(graph.person_ids[np.argmax(np.diff(graph.person_offsets))])
+        start = time.time()
+        top = graph.top_collaborators(person, k=5)
+        hood = graph.neighbourhood(person, hops=2)
+        print(f"\nMost credited person: {graph.name(person)} ({person})")
+        for pid, name, count in top:
+            print(f"   • {name}: {count} films")
+        print(f"   • 2-hop neighbourhood: {len(hood):,} people")
+        print(f"Lookups in {(time.time() - start) * 1000:.1f} ms")
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
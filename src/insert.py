@@ -1,172 +1,493 @@
 from pathlib import Path
 from DbConnector import DbConnector
 import pandas as pd
-from ast import literal_eval
+from report import logger, configure_logging, ProgressReporter
+import ratings_schema
+import rating_buckets
+import genres
+import categorical
+import trends
+from rating_stats import RatingSummary
+import sharding
+import movie_parsing
+import verify
+import quality
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect, OperationFailure
+from datetime import datetime, timezone
+import tempfile
 import time
 
 class MovieInserter:
-    def __init__(self):
-        print("Conecting to MongoDB...")
+    def __init__(self, slim_movies=False, compact_ratings=False, bucketed_ratings=False, shard_strategy=None, workers=1, streaming=False, validate=False, encode_categoricals=False, timeseries_ratings=False):
+        logger.info("Conecting to MongoDB...")
+        # ingestion always runs against the primary (analytical reads may go to secondaries)
         self.connection = DbConnector()
         self.db = self.connection.db
         self.batch_size = 1000
         self.chunk_size = 5000
-        
-    def to_json(self, x):
-        try:
-            return literal_eval(x) if pd.notnull(x) else None
-        except:
-            return None
+        # routed (zoned) ratings loads checkpoint every this many chunks (see sharding.ZoneRouter)
+        self.checkpoint_chunks = 20
+        # seconds between progress lines (see report.ProgressReporter)
+        self.progress_interval = 10.0
+        # drop cast/crew from movie documents once people/credits hold them
+        self.slim_movies = slim_movies
+        # store ratings with short keys / int32 / half-stars / dates (see ratings_schema.py)
+        self.compact_ratings = compact_ratings
+        # also build user_ratings/movie_ratings buckets (see rating_buckets.py)
+        self.bucketed_ratings = bucketed_ratings
+        # None (unsharded), "hashed" or "zoned" ratings sharding (see sharding.py)
+        self.shard_strategy = shard_strategy
+        self.router = None
+        # transient failures (network blip, failover) are retried this many times per batch
+        self.max_retries = 5
+        # keep ratings whose movieId has no tmdbId in ratings_unmapped (else they are dropped)
+        self.quarantine_unmapped = True
+        # processes parsing/inserting movies and credits (see movie_parsing.py)
+        self.workers = workers
+        # merge-join movies/credits/keywords chunk by chunk instead of in memory
+        self.streaming = streaming
+        # apply the quality.py cleaning rules before loading (every loader)
+        self.validate = validate
+        self.rule_sets = {}
+        # replace language/country/company/job/department strings by dictionary codes (see categorical.py)
+        self.encode_categoricals = encode_categoricals
+        # also copy ratings into the ratings_ts time-series collection (see trends.py)
+        self.timeseries_ratings = timeseries_ratings
     
     def insert_batch(self, collection_name, records, start_idx=0):
         total = len(records)
-        inserted = 0
+        progress = ProgressReporter(collection_name, start_idx + total, self.progress_interval, initial=start_idx)
         
         for i in range(0, total, self.batch_size):
             batch = records[i:i+self.batch_size]
             self.db[collection_name].insert_many(batch)
-            inserted += len(batch)
-            print(f"{start_idx + inserted:,}/{start_idx + total:,}", end='\r', flush=True)
+            progress.update(len(batch))
         
-        print(f"{start_idx + inserted:,}/{start_idx + total:,}")
-        return inserted
+        return progress.finish()
     
     def insert_movies(self, movies_path, credits_path, keywords_path):
-        print("\nReading files")
+        if self.workers > 1:
+            return self.insert_movies_parallel(movies_path, credits_path, keywords_path)
+        if self.streaming:
+            return self.insert_movies_streaming(movies_path, credits_path, keywords_path)
+        
+        logger.info("Reading files")
         start_time = time.time()
         
         movies = pd.read_csv(movies_path)
-        print(f"{len(movies):,} películas leídas")
+        logger.info("%s películas leídas", f"{len(movies):,}")
         
         credits = pd.read_csv(credits_path)
-        credits["cast"] = credits["cast"].apply(self.to_json)
-        credits["crew"] = credits["crew"].apply(self.to_json)
-        print(f"{len(credits):,} credits leídos")
+        logger.info("%s credits leídos", f"{len(credits):,}")
         
         keywords = pd.read_csv(keywords_path)
-        keywords["keywords"] = keywords["keywords"].apply(self.to_json)
-        print(f"{len(keywords):,} keywords leídos")
+        logger.info("%s keywords leídos", f"{len(keywords):,}")
         
-        json_cols = ["genres", "production_companies", "production_countries",
-                     "spoken_languages", "belongs_to_collection"]
+        if self.validate:
+            frames = self.clean_frames({"movies": movies, "credits": credits, "keywords": keywords})
+            movies, credits, keywords = frames["movies"], frames["credits"], frames["keywords"]
         
-        for col in json_cols:
-            if col in movies.columns:
-                movies[col] = movies[col].apply(self.to_json)
+        movie_parsing.parse_columns(credits, movie_parsing.CREDIT_JSON_COLS)
+        movie_parsing.parse_columns(keywords, movie_parsing.KEYWORD_JSON_COLS)
+        movie_parsing.parse_columns(movies, movie_parsing.MOVIE_JSON_COLS)
         
-        merged = movies.merge(credits, on="id", how="left") \
-                       .merge(keywords, on="id", how="left")
+        merged = movie_parsing.merge_movies(movies, credits, keywords)
+        logger.info("Merged data: %s documentos", f"{len(merged):,}")
         
-        merged = merged.rename(columns={'id': 'tmdbId'})
-        print(f"Merged data: {len(merged):,} documentos")
+        self.insert_people_and_credits(credits)
+        if self.slim_movies:
+            merged = merged.drop(columns=["cast", "crew"])
         
-        print("\nInsert in MongoDB...")
+        logger.info("Insert in MongoDB...")
         movies_records = merged.to_dict(orient="records")
         total_inserted = self.insert_batch("movies", movies_records, 0)
+        self.record_count("movies", total_inserted)
         
         elapsed = time.time() - start_time
-        print(f"\niNSERTED: {total_inserted:,} documents in {elapsed:.2f}s")
+        logger.info("iNSERTED: %s documents in %.2fs", f"{total_inserted:,}", elapsed)
         
         # Liberar memoria
         del merged, movies, credits, keywords, movies_records
         return total_inserted
     
-    def insert_ratings(self, ratings_path, links_path):
+    def insert_movies_parallel(self, movies_path, credits_path, keywords_path):
+        """
+        Parse, merge and insert movies and credits in `self.workers` processes,
+        one id partition each. Workers insert their own documents; only counts
+        and the people maps come back to be deduplicated and inserted here.
+        """
+        logger.info("Parsing and inserting movies with %d workers", self.workers)
         start_time = time.time()
+        paths = {"movies": movies_path, "credits": credits_path, "keywords": keywords_path}
         
-        links = pd.read_csv(links_path, usecols=["movieId", "tmdbId"])
-        movieLens_to_tmdb = dict(zip(links['movieId'], links['tmdbId']))
-        print(f"{len(movieLens_to_tmdb):,} mapping charged")
-        del links
+        # the rules run on the whole frames in this process, before the id split
+        results = movie_parsing.run_partitions(
+            movie_parsing.load_partition, paths, self.workers,
+            clean=self.clean_frames if self.validate else None,
+            slim_movies=self.slim_movies, batch_size=self.batch_size
+        )
         
-        print("\nInserting ratings")
-        total_inserted = 0
+        people = {}
+        for _, _, partial in results:
+            people.update(partial)
+        self.record_count("people", self.insert_batch("people", list(people.values()), 0))
+        self.record_count("credits", sum(n for _, n, _ in results))
         
-        for chunk in pd.read_csv(ratings_path, chunksize=self.chunk_size):
-            chunk['tmdbId'] = chunk['movieId'].map(movieLens_to_tmdb)
-            
-            records = chunk.to_dict(orient="records")
-            
-            for i in range(0, len(records), self.batch_size):
-                batch = records[i:i+self.batch_size]
-                self.db.ratings.insert_many(batch)
-                total_inserted += len(batch)
-                print(f"{total_inserted:,} ratings inserted", end='\r', flush=True)
+        total_inserted = sum(count for count, _, _ in results)
+        self.record_count("movies", total_inserted)
+        elapsed = time.time() - start_time
+        logger.info("iNSERTED: %s documents in %.2fs", f"{total_inserted:,}", elapsed)
+        return total_inserted
+    
+    def insert_movies_streaming(self, movies_path, credits_path, keywords_path):
+        """
+        Memory-bounded movies load: the three CSVs are merge-joined on id
+        (unsorted inputs are first spilled as sorted runs to a temp dir) and
+        movie and credit documents are inserted batch by batch as they come.
+        Only the people map, one entry per person, grows with the data.
+        """
+        logger.info("Streaming movies, credits and keywords")
+        start_time = time.time()
+        paths = {"movies": movies_path, "credits": credits_path, "keywords": keywords_path}
+        movies = ProgressReporter("movies", interval=self.progress_interval)
+        credits = ProgressReporter("credits", interval=self.progress_interval)
+        people = {}
+        movie_batch, credit_batch = [], []
+        
+        rules, refs = {}, {}
+        if self.validate:
+            ids = lambda path: pd.read_csv(path, usecols=["id"])["id"].to_numpy()
+            rules = {source: self.rule_set(source) for source in paths}
+            refs = {"movies": {"credits": ids(credits_path)}, "credits": {"movies": ids(movies_path)}}
+        
+        with tempfile.TemporaryDirectory(prefix="mongofilm_") as spill_dir:
+            for movie_id, rows in movie_parsing.stream_merge(paths, spill_dir, self.chunk_size, rules=rules, refs=refs):
+                credit = rows.get("credits")
+                if credit:
+                    credit_batch.extend(movie_parsing.credit_rows(movie_id, credit["cast"], credit["crew"], people))
+                if "movies" in rows:
+                    doc = movie_parsing.movie_document(rows)
+                    if self.slim_movies:
+                        del doc["cast"], doc["crew"]
+                    movie_batch.append(doc)
+                
+                if len(movie_batch) >= self.batch_size:
+                    self.db.movies.insert_many(movie_batch)
+                    movies.update(len(movie_batch))
+                    movie_batch = []
+                if len(credit_batch) >= self.batch_size:
+                    self.db.credits.insert_many(credit_batch)
+                    credits.update(len(credit_batch))
+                    credit_batch = []
+        
+        if movie_batch:
+            self.db.movies.insert_many(movie_batch)
+            movies.update(len(movie_batch))
+        if credit_batch:
+            self.db.credits.insert_many(credit_batch)
+            credits.update(len(credit_batch))
+        self.record_count("credits", credits.finish())
+        self.record_count("people", self.insert_batch("people", list(people.values()), 0))
+        if self.validate:
+            self.log_quality(["movies", "credits", "keywords"])
+        
+        total_inserted = movies.finish()
+        self.record_count("movies", total_inserted)
+        elapsed = time.time() - start_time
+        logger.info("iNSERTED: %s documents in %.2fs", f"{total_inserted:,}", elapsed)
+        return total_inserted
+    
+    def insert_people_and_credits(self, credits):
+        """
+        Normalize the parsed cast/crew arrays into a `people` collection
+        (id, name, gender) and a slim `credits` collection
+        (tmdbId, person_id, role, job, order, department).
+        """
+        logger.info("Building people and credits")
+        people, credit_records = movie_parsing.people_and_credits(credits)
+        
+        logger.info("%s people, %s credits", f"{len(people):,}", f"{len(credit_records):,}")
+        self.record_count("people", self.insert_batch("people", list(people.values()), 0))
+        self.record_count("credits", self.insert_batch("credits", credit_records, 0))
+        return len(people), len(credit_records)
+    
+    def rule_set(self, dataset, **kwargs):
+        if dataset not in self.rule_sets:
+            self.rule_sets[dataset] = quality.RuleSet(dataset, **kwargs)
+        return self.rule_sets[dataset]
+    
+    def check(self, dataset, frame, refs=None, **kwargs):
+        """Rows of a pandas frame/chunk passing the quality rules of `dataset`."""
+        return frame[self.rule_set(dataset, **kwargs).mask(frame, refs)]
+    
+    def clean_frames(self, frames):
+        """The movies, credits and keywords frames with the rows passing their quality rules."""
+        movies = self.check("movies", frames["movies"], {"credits": frames["credits"]["id"]})
+        credits = self.check("credits", frames["credits"], {"movies": movies["id"]})
+        keywords = self.check("keywords", frames["keywords"])
+        self.log_quality(["movies", "credits", "keywords"])
+        return {"movies": movies, "credits": credits, "keywords": keywords}
+    
+    def log_quality(self, datasets):
+        """Log the rejects per rule of `datasets` and keep them in load_state."""
+        for name in datasets:
+            self.rule_sets[name].log()
+        self.db.load_state.update_one(
+            {"_id": "quality"},
+            {"$set": {name: self.rule_sets[name].rejects for name in datasets}},
+            upsert=True
+        )
+    
+    def record_count(self, collection, rows):
+        """Keep the loader's own document count in load_state for verify.py."""
+        self.db.load_state.update_one(
+            {"_id": collection},
+            {"$set": {"rows": rows, "updated": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+    
+    def insert_ratings(self, ratings_path, links_path):
+        start_time = time.time()
+        
+        tmdb_lookup = ratings_schema.TmdbLookup.from_csv(links_path)
+        logger.info("%s mapping charged", f"{len(tmdb_lookup):,}")
+        summary = RatingSummary(tmdb_lookup.max_tmdb_id())
+        
+        user_field = ratings_schema.field("userId", self.compact_ratings)
+        movie_field = ratings_schema.field("movieId", self.compact_ratings)
+        # unique keys first: replays of a chunk after a crash become no-ops, and the
+        # keyed upserts of write_ratings are index lookups instead of collection scans
+        keys = [("ratings", user_field, movie_field)]
+        if self.quarantine_unmapped:
+            keys.append(("ratings_unmapped", "userId", "movieId"))
+        for collection, user, movie in keys:
+            try:
+                self.db[collection].create_index([(user, 1), (movie, 1)], unique=True)
+            except OperationFailure as e:
+                raise RuntimeError(f"Unique ({user}, {movie}) index on {collection} not created: {e}; "
+                                   "the keyed upserts would scan the whole collection") from e
+        
+        state = self.db.load_state.find_one({"_id": "ratings"}) or {}
+        if state.get("done"):
+            # the last load finished: this is a reload, not a resume
+            self.db.load_state.delete_one({"_id": "ratings"})
+            state = {}
+        resume_after = state.get("chunk", -1)
+        if resume_after >= 0:
+            logger.info("Resuming ratings after chunk %s (%s rows committed)", f"{resume_after:,}", f"{state.get('rows', 0):,}")
+        
+        logger.info("Inserting ratings")
+        progress = ProgressReporter("ratings", interval=self.progress_interval)
+        rows = 0
+        unmapped = 0
+        
+        for chunk_id, chunk in enumerate(pd.read_csv(ratings_path, chunksize=self.chunk_size)):
+            if self.validate:
+                # uniqueness is enforced by the keyed upserts, the links semi-join by tmdb_lookup
+                chunk = self.check("ratings", chunk, skip=("unique", "references"))
+            # epoch seconds -> BSON date, so time ranges can use the timestamp indexes
+            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], unit="s")
+            chunk, rejected = tmdb_lookup.split(chunk)
+            summary.add(chunk["tmdbId"], chunk["rating"])
+            rows += len(chunk)
+            unmapped += len(rejected)
+            # committed before the crash: only needed for the rating summary
+            if chunk_id <= resume_after:
+                continue
+            if len(rejected) and self.quarantine_unmapped:
+                self.write_ratings(rejected.to_dict(orient="records"), collection="ratings_unmapped")
+            if self.compact_ratings:
+                chunk = ratings_schema.to_compact(chunk)
+
+            if self.router:
+                # zone workers keep writing while the next chunks are read; the
+                # checkpoint waits for them, so it is only taken every few chunks
+                progress.update(self.router.insert(chunk))
+                if (chunk_id + 1) % self.checkpoint_chunks:
+                    continue
+                self.router.drain()
+            else:
+                records = chunk.to_dict(orient="records")
+                for i in range(0, len(records), self.batch_size):
+                    progress.update(self.write_ratings(records[i:i+self.batch_size], user_field, movie_field))
+
+            self.db.load_state.update_one(
+                {"_id": "ratings"},
+                {"$set": {"chunk": chunk_id, "rows": rows, "unmapped": unmapped, "updated": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        
+        if self.router:
+            self.router.close()
+        total_inserted = progress.finish()
+        self.db.load_state.update_one({"_id": "ratings"}, {"$set": {"done": True}}, upsert=True)
+        if self.validate:
+            self.log_quality(["ratings"])
+        if unmapped:
+            where = "quarantined in ratings_unmapped" if self.quarantine_unmapped else "dropped"
+            logger.info("%s ratings without a tmdbId %s", f"{unmapped:,}", where)
         
-        print(f"{total_inserted:,} ratings inserted")
+        logger.info("Writing per-movie rating summaries")
+        summary.write(self.db)
         
         elapsed = time.time() - start_time
-        print(f"\nRatings inserted: {total_inserted:,} documents in {elapsed:.2f}s")
+        logger.info("Ratings inserted: %s documents in %.2fs", f"{total_inserted:,}", elapsed)
         return total_inserted
     
+    def write_ratings(self, records, user_field="userId", movie_field="movieId", collection="ratings"):
+        """
+        Idempotent, retryable write of one batch: upserts keyed on (userId, movieId)
+        with $setOnInsert, so a batch replayed after a failure adds no duplicates.
+        """
+        ops = [
+            UpdateOne({user_field: r[user_field], movie_field: r[movie_field]}, {"$setOnInsert": r}, upsert=True)
+            for r in records
+        ]
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.db[collection].bulk_write(ops, ordered=False)
+                return len(records)
+            except AutoReconnect as e:
+                if attempt == self.max_retries:
+                    raise
+                wait = min(2 ** attempt, 30)
+                logger.warning("Ratings batch failed (%s); retrying in %ss", e, wait)
+                time.sleep(wait)
+    
+    def prepare_sharding(self, ratings_path):
+        """Shard ratings before the load; zoned sharding also routes inserts per shard."""
+        max_user_id = None
+        if self.shard_strategy == "zoned":
+            max_user_id = int(pd.read_csv(ratings_path, usecols=["userId"])["userId"].max())
+        bounds = sharding.shard_ratings(self.db, self.shard_strategy, self.compact_ratings, max_user_id)
+        if bounds:
+            user_field = ratings_schema.field("userId", self.compact_ratings)
+            movie_field = ratings_schema.field("movieId", self.compact_ratings)
+            write = lambda records: self.write_ratings(records, user_field, movie_field)
+            self.router = sharding.ZoneRouter(write, bounds, user_field)
+    
     def create_indexes(self):
         start_time = time.time()
         
         self.db.movies.create_index("tmdbId", unique=True)
         
-        self.db.ratings.create_index("tmdbId")
+        f = lambda name: ratings_schema.field(name, self.compact_ratings)
         
-        self.db.ratings.create_index("userId")
+        self.db.ratings.create_index(f("tmdbId"))
         
-        self.db.ratings.create_index("movieId")
+        self.db.ratings.create_index(f("userId"))
         
-        self.db.ratings.create_index([("tmdbId", 1), ("rating", -1)])
+        self.db.ratings.create_index(f("movieId"))
         
-        elapsed = time.time() - start_time
-        print(f"Index created in {elapsed:.2f}s")
-    
-    def verify_insertion(self):
+        self.db.ratings.create_index([(f("tmdbId"), 1), (f("rating"), -1)])
         
-        movies_count = self.db.movies.count_documents({})
-        ratings_count = self.db.ratings.count_documents({})
-
-        sample_movie = self.db.movies.find_one(
-            {"cast": {"$exists": True, "$ne": None}},
-            {"title": 1, "tmdbId": 1, "cast": {"$slice": 2}, "_id": 0}
-        )
+        self.db.ratings.create_index(f("timestamp"))
         
-        if sample_movie:
-            print(f"\nMovie example:")
-            print(f"    • Tittle: {sample_movie.get('title')}")
-            print(f"    • tmdbId: {sample_movie.get('tmdbId')}")
-            if sample_movie.get('cast'):
-                print(f"    • Cast (first 2): {len(sample_movie['cast'])} actors")
+        self.db.ratings.create_index([(f("tmdbId"), 1), (f("timestamp"), 1)])
         
-        sample_rating = self.db.ratings.find_one(
-            {"tmdbId": {"$exists": True}},
-            {"userId": 1, "movieId": 1, "tmdbId": 1, "rating": 1, "_id": 0}
-        )
+        self.db.movies.create_index([("rating_stats.mean", -1)])
+        
+        self.db.movies.create_index([("genres.name", 1), ("rating_stats.mean", -1)])
+        
+        # equality filters on the (dictionary-encoded) categorical fields: query1, query8, query9
+        self.db.movies.create_index([("crew.job", 1), ("vote_count", 1)])
+        
+        self.db.movies.create_index("original_language")
+        
+        # one per $or branch of query9, so the $or can be answered from indexes
+        self.db.movies.create_index("production_countries.iso_3166_1")
+        
+        self.db.movies.create_index("production_countries.name")
+        
+        self.db.movies.create_index("production_companies.origin_country")
         
-        if sample_rating:
-            print(f"\nRating example:")
-            print(f"    • userId: {sample_rating.get('userId')}")
-            print(f"    • movieId (MovieLens): {sample_rating.get('movieId')}")
-            print(f"    • tmdbId: {sample_rating.get('tmdbId')}")
-            print(f"    • rating: {sample_rating.get('rating')}")
+        self.db.people.create_index("id", unique=True)
         
-        ratings_with_tmdb = self.db.ratings.count_documents({"tmdbId": {"$exists": True, "$ne": None}})
-        coverage = (ratings_with_tmdb / ratings_count * 100) if ratings_count > 0 else 0
+        self.db.credits.create_index([("person_id", 1), ("tmdbId", 1)])
         
-        print(f"\nIntegrity of relations:")
-        print(f"    • Ratings with tmdbId: {ratings_with_tmdb:,} ({coverage:.2f}%)")
+        self.db.credits.create_index([("tmdbId", 1), ("role", 1), ("order", 1)])
+        
+        self.db.credits.create_index([("job", 1), ("person_id", 1)])
+        
+        elapsed = time.time() - start_time
+        logger.info("Index created in %.2fs", elapsed)
+    
+    def verify_insertion(self):
+        """Metadata counts vs. load counters plus sampled integrity checks (see verify.py)."""
+        result = verify.verify(self.db, compact=self.compact_ratings)
+        counts = {row["collection"]: row["count"] for row in result["counts"]}
+        
+        logger.info("Collections:")
+        for row in result["counts"]:
+            loaded = "" if row["loaded"] is None else f" (loaded {row['loaded']:,})"
+            logger.info("    • %s: %s%s", row['collection'], f"{row['count']:,}", loaded)
+        
+        logger.info("Integrity of relations (sampled):")
+        for row in result["samples"]:
+            logger.info("    • %s.%s: %s/%s (95%% CI %.2f%% - %.2f%%)", row['collection'], row['check'],
+                        f"{row['passed']:,}", f"{row['sampled']:,}", 100 * row['ci_low'], 100 * row['ci_high'])
+        logger.info("    • Ratings without tmdbId (not loaded): %s", f"{result['unmapped_ratings']:,}")
         
         return {
-            "movies": movies_count,
-            "ratings": ratings_count,
-            "ratings_with_tmdb": ratings_with_tmdb,
-            "coverage": coverage
+            **counts,
+            "ratings_unmapped": result["unmapped_ratings"],
+            "samples": result["samples"]
         }
     
+    def start_load(self):
+        """
+        Checkpoints of the previous run decide what is loaded again. A load
+        that finished (or never got going) starts fresh; an interrupted one
+        keeps its movies phase if that completed, else rolls back its partial
+        movies/people/credits, whose plain inserts are not keyed.
+        """
+        movies = self.db.load_state.find_one({"_id": "movies"}) or {}
+        ratings = self.db.load_state.find_one({"_id": "ratings"}) or {}
+        if ratings.get("done") or not movies.get("started"):
+            self.db.load_state.delete_many({"_id": {"$in": ["movies", "ratings", "categorical"]}})
+        elif not movies.get("done"):
+            logger.info("Rolling back the interrupted movies load")
+            for name in ("movies", "people", "credits", "dictionary"):
+                self.db[name].delete_many({})
+            self.db.load_state.delete_many({"_id": {"$in": ["ratings", "categorical"]}})
+        else:
+            logger.info("Resuming: movies phase already loaded (%s movies)", f"{movies.get('rows', 0):,}")
+            return True
+        self.db.load_state.update_one(
+            {"_id": "movies"},
+            {"$set": {"started": datetime.now(timezone.utc)}, "$unset": {"done": ""}},
+            upsert=True
+        )
+        return False
+    
     def run(self, data_path):
-        print("Inserting data")
+        logger.info("Inserting data")
         total_start = time.time()
         
         try:
-            movies_count = self.insert_movies(
-                data_path / "movies.csv",
-                data_path / "credits.csv",
-                data_path / "keywords.csv"
-            )
+            if self.timeseries_ratings:
+                trends.check_server(self.db)
+            
+            if self.start_load():
+                movies_count = self.db.load_state.find_one({"_id": "movies"}).get("rows", 0)
+            else:
+                movies_count = self.insert_movies(
+                    data_path / "movies.csv",
+                    data_path / "credits.csv",
+                    data_path / "keywords.csv"
+                )
+                
+                genres.build(self.db)
+                
+                if self.encode_categoricals:
+                    logger.info("Encoding categorical fields")
+                    categorical.encode(self.db)
+                
+                self.db.load_state.update_one({"_id": "movies"}, {"$set": {"done": True}})
+            
+            if self.shard_strategy:
+                self.prepare_sharding(data_path / "ratings.csv")
             
             ratings_count = self.insert_ratings(
                 data_path / "ratings.csv",
@@ -175,6 +496,14 @@ class MovieInserter:
             
             self.create_indexes()
             
+            if self.bucketed_ratings:
+                logger.info("Building rating buckets")
+                rating_buckets.build(self.db)
+            
+            if self.timeseries_ratings:
+                logger.info("Building the ratings time series")
+                trends.build_timeseries(self.db)
+            
             stats = self.verify_insertion()
             
             total_elapsed = time.time() - total_start
@@ -191,6 +520,7 @@ class MovieInserter:
         self.connection.close_connection()
 
 def main():
+    configure_logging()
     data_path = Path(__file__).resolve().parent.parent / "dat" / "clean"
     
     inserter = MovieInserter()
@@ -0,0 +1,190 @@
+# keywords.py
+from pathlib import Path
+import json
+import re
+import time
+import numpy as np
+from pymongo import InsertOne
+from graph import gather, to_csr
+from report import logger
+
+DEFAULT_CACHE = Path(__file__).resolve().parent.parent / "dat" / "keywords"
+
+
+class KeywordIndex:
+    """
+    Inverted index over the movie keywords: keyword -> sorted tmdbId posting
+    list, plus symmetric keyword co-occurrence counts, both in CSR form.
+    Arrays are cached as .npy files and memory-mapped on load; keyword names
+    go to a JSON side file. build() also persists both to collections.
+    """
+
+    ARRAYS = [
+        "keyword_ids", "offsets", "postings",
+        "pair_offsets", "pair_partners", "pair_counts"
+    ]
+
+    def __init__(self, arrays, names):
+        for key in self.ARRAYS:
+            setattr(self, key, arrays[key])
+        self.names = names
+
+    @classmethod
+    def build(cls, db, cache_dir=DEFAULT_CACHE, min_pair_count=2, batch_size=1000):
+        """Read the movie keywords once, then index and count pairs in one vectorized pass."""
+        logger.info("Building keyword index")
+        start = time.time()
+
+        edge_keywords, edge_movies, names = [], [], {}
+        for movie in db.movies.find({"keywords.0": {"$exists": True}}, {"_id": 0, "tmdbId": 1, "keywords": 1}):
+            for keyword in movie["keywords"]:
+                names.setdefault(keyword["id"], keyword.get("name"))
+                edge_keywords.append(keyword["id"])
+                edge_movies.append(movie["tmdbId"])
+
+        # one edge per (keyword, movie), sorted by keyword then tmdbId
+        edges = np.unique(np.stack([np.asarray(edge_keywords, dtype=np.int64),
+                                    np.asarray(edge_movies, dtype=np.int64)], axis=1).reshape(-1, 2), axis=0)
+        keyword_ids, k = np.unique(edges[:, 0], return_inverse=True)
+        movie_ids, m = np.unique(edges[:, 1], return_inverse=True)
+        n = len(keyword_ids)
+
+        arrays = {"keyword_ids": keyword_ids}
+        arrays["offsets"], postings, _ = to_csr(k, m, m, n)
+        arrays["postings"] = movie_ids[postings].astype(np.int32)
+
+        # co-occurrence: every edge paired with every other edge of its movie
+        movie_offsets, movie_keywords, _ = to_csr(m, k, k, len(movie_ids))
+        owners = np.repeat(np.arange(len(movie_ids)), np.diff(movie_offsets))
+        left = np.repeat(movie_keywords, np.diff(movie_offsets)[owners]).astype(np.int64)
+        right = movie_keywords[gather(movie_offsets, owners)].astype(np.int64)
+        keep = left != right
+        pairs, counts = np.unique(left[keep] * n + right[keep], return_counts=True)
+        keep = counts >= min_pair_count
+        pairs, counts = pairs[keep], counts[keep]
+        arrays["pair_offsets"], arrays["pair_partners"], arrays["pair_counts"] = \
+            to_csr(pairs // n, pairs % n, counts.astype(np.int32), n)
+
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for key in cls.ARRAYS:
+            np.save(cache_dir / f"{key}.npy", arrays[key])
+        with open(cache_dir / "names.json", "w", encoding="utf-8") as fh:
+            json.dump([names[int(i)] for i in keyword_ids], fh)
+
+        index = cls.load(cache_dir)
+        index.persist(db, batch_size)
+        logger.info("%s keywords, %s postings, %s pairs in %.2fs",
+                    f"{n:,}", f"{len(edges):,}", f"{len(pairs) // 2:,}", time.time() - start)
+        return index
+
+    @classmethod
+    def load(cls, cache_dir=DEFAULT_CACHE):
+        cache_dir = Path(cache_dir)
+        arrays = {key: np.load(cache_dir / f"{key}.npy", mmap_mode="r") for key in cls.ARRAYS}
+        with open(cache_dir / "names.json", encoding="utf-8") as fh:
+            names = json.load(fh)
+        return cls(arrays, names)
+
+    @classmethod
+    def load_or_build(cls, db, cache_dir=DEFAULT_CACHE, rebuild=False):
+        if not rebuild and (Path(cache_dir) / "names.json").exists():
+            return cls.load(cache_dir)
+        return cls.build(db, cache_dir)
+
+    def persist(self, db, batch_size=1000):
+        """
+        keyword_index: {_id: keyword id, name, df, movies}; keyword_pairs: one
+        document per unordered pair (a < b) with its count.
+        """
+        for name, docs in (("keyword_index", self._index_documents()), ("keyword_pairs", self._pair_documents())):
+            db[name].drop()
+            ops = []
+            for doc in docs:
+                ops.append(InsertOne(doc))
+                if len(ops) >= batch_size:
+                    db[name].bulk_write(ops, ordered=False)
+                    ops = []
+            if ops:
+                db[name].bulk_write(ops, ordered=False)
+        db.keyword_index.create_index("name")
+        db.keyword_pairs.create_index([("a", 1), ("count", -1)])
+        db.keyword_pairs.create_index([("b", 1), ("count", -1)])
+
+    def _index_documents(self):
+        for i, keyword_id in enumerate(self.keyword_ids):
+            movies = self.postings[self.offsets[i]:self.offsets[i + 1]]
+            yield {"_id": int(keyword_id), "name": self.names[i], "df": len(movies), "movies": movies.tolist()}
+
+    def _pair_documents(self):
+        for i, keyword_id in enumerate(self.keyword_ids):
+            lo, hi = self.pair_offsets[i], self.pair_offsets[i + 1]
+            for j, count in zip(self.pair_partners[lo:hi], self.pair_counts[lo:hi]):
+                if j > i:
+                    yield {"a": int(keyword_id), "b": int(self.keyword_ids[j]),
+                           "names": [self.names[i], self.names[j]], "count": int(count)}
+
+    # -- lookups ---------------------------------------------------------
+
+    def index(self, keyword_id):
+        i = int(np.searchsorted(self.keyword_ids, keyword_id))
+        if i >= len(self.keyword_ids) or self.keyword_ids[i] != keyword_id:
+            raise KeyError(f"Unknown keyword id: {keyword_id}")
+        return i
+
+    def matching(self, pattern):
+        """Keyword indices whose name matches a regex (case-insensitive)."""
+        regex = re.compile(pattern, re.IGNORECASE)
+        return np.array([i for i, name in enumerate(self.names) if name and regex.search(name)], dtype=np.int64)
+
+    def movies_of(self, keywords):
+        """Sorted tmdbIds tagged with any of the given keyword indices (union of postings)."""
+        return np.unique(self.postings[gather(self.offsets, np.asarray(keywords, dtype=np.int64))])
+
+    def search(self, any_of, all_of=()):
+        """
+        tmdbIds tagged with a keyword matching `any_of` and, for every pattern
+        in `all_of`, with a keyword matching it too (posting-list intersection).
+        """
+        hits = self.movies_of(self.matching(any_of))
+        for pattern in all_of:
+            hits = np.intersect1d(hits, self.movies_of(self.matching(pattern)), assume_unique=True)
+        return hits
+
+    def co_occurring(self, keyword_id, k=10):
+        """[(keyword_id, name, movies tagged with both)] by count descending."""
+        i = self.index(keyword_id)
+        lo, hi = self.pair_offsets[i], self.pair_offsets[i + 1]
+        partners, counts = self.pair_partners[lo:hi], self.pair_counts[lo:hi]
+        order = np.lexsort((partners, -counts))[:k]
+        return [(int(self.keyword_ids[j]), self.names[j], int(c)) for j, c in zip(partners[order], counts[order])]
+
+
+def main():
+    import argparse
+    from DbConnector import DbConnector
+    from report import configure_logging
+    parser = argparse.ArgumentParser(description="Keyword inverted index and co-occurrence counts.")
+    parser.add_argument("pattern", nargs="?", default=r"\bnoir\b", help="keyword regex to look up")
+    parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+    configure_logging()
+
+    connection = DbConnector()
+    try:
+        index = KeywordIndex.load_or_build(connection.db, rebuild=args.rebuild)
+        start = time.time()
+        matches = index.matching(args.pattern)
+        hits = index.movies_of(matches)
+        print(f"\n{len(matches)} keywords matching {args.pattern!r}: {len(hits):,} movies "
+              f"({(time.time() - start) * 1000:.1f} ms)")
+        for i in matches[:10]:
+            print(f"   • {index.names[i]}")
+            for _, name, count in index.co_occurring(int(index.keyword_ids[i]), k=5):
+                print(f"       - {name}: {count}")
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# movie_parsing.py
+from concurrent.futures import ProcessPoolExecutor
+from ast import literal_eval
+from itertools import groupby
+from pathlib import Path
+import csv
+import heapq
+import os
+import time
+import numpy as np
+import pandas as pd
+
+MOVIE_JSON_COLS = ["genres", "production_companies", "production_countries",
+                   "spoken_languages", "belongs_to_collection"]
+CREDIT_JSON_COLS = ["cast", "crew"]
+KEYWORD_JSON_COLS = ["keywords"]
+
+
+def to_json(x):
+    try:
+        return literal_eval(x) if pd.notnull(x) else None
+    except:
+        return None
+
+
+def parse_columns(frame, cols):
+    for col in cols:
+        if col in frame.columns:
+            frame[col] = frame[col].apply(to_json)
+    return frame
+
+
+def merge_movies(movies, credits, keywords):
+    merged = movies.merge(credits, on="id", how="left") \
+                   .merge(keywords, on="id", how="left")
+    return merged.rename(columns={'id': 'tmdbId'})
+
+
+def people_and_credits(credits):
+    """
+    Normalize parsed cast/crew arrays into people (id -> {id, name, gender})
+    and slim credit records (tmdbId, person_id, role, job, order, department).
+    """
+    people = {}
+    credit_records = []
+
+    for tmdb_id, cast, crew in zip(credits["id"], credits["cast"], credits["crew"]):
+        credit_records.extend(credit_rows(tmdb_id, cast, crew, people))
+
+    return people, credit_records
+
+
+def credit_rows(tmdb_id, cast, crew, people):
+    """Credit records of one movie; new cast/crew members are added to `people`."""
+    records = []
+    for member in cast or []:
+        people.setdefault(member["id"], {"id": member["id"], "name": member.get("name"), "gender": member.get("gender")})
+        records.append({
+            "tmdbId": tmdb_id,
+            "person_id": member["id"],
+            "role": "cast",
+            "job": "Actor",
+            "order": member.get("order"),
+            "department": "Acting"
+        })
+    for member in crew or []:
+        people.setdefault(member["id"], {"id": member["id"], "name": member.get("name"), "gender": member.get("gender")})
+        records.append({
+            "tmdbId": tmdb_id,
+            "person_id": member["id"],
+            "role": "crew",
+            "job": member.get("job"),
+            "order": None,
+            "department": member.get("department")
+        })
+    return records
+
+
+# -- streaming merge-join -----------------------------------------------------
+
+SOURCES = {
+    "movies": MOVIE_JSON_COLS,
+    "credits": CREDIT_JSON_COLS,
+    "keywords": KEYWORD_JSON_COLS
+}
+
+
+def scan_csv(path, chunk_size=100000):
+    """
+    (dtypes, sorted) of a CSV in one chunked pass: the dtype of every column
+    over the whole file and whether its id column is non-decreasing. A column
+    keeps its dtype if every chunk with values agrees; ints widen to floats,
+    anything else mixed becomes object, and missing values make ints floats
+    and bools objects. Chunked readers given these dtypes parse every chunk
+    alike, and like one pd.read_csv of the whole file.
+    """
+    dtypes, gaps, last, ordered = {}, set(), None, True
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        for column, dtype in chunk.dtypes.items():
+            # an all-missing chunk reads as float whatever the column holds
+            if chunk[column].isna().all():
+                gaps.add(column)
+                continue
+            seen = dtypes.setdefault(column, dtype)
+            if seen != dtype:
+                numeric = all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in (seen, dtype))
+                dtypes[column] = np.dtype("float64") if numeric else np.dtype(object)
+        ids = chunk["id"]
+        if not ids.is_monotonic_increasing or (last is not None and len(ids) and ids.iloc[0] < last):
+            ordered = False
+        if len(ids):
+            last = ids.iloc[-1]
+    for column in gaps:
+        dtype = dtypes.get(column)
+        if dtype is None or pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = np.dtype("float64")
+        elif pd.api.types.is_bool_dtype(dtype):
+            dtypes[column] = np.dtype(object)
+    return dtypes, ordered
+
+
+def sorted_runs(path, spill_dir, dtypes, ordered=False, chunk_size=5000):
+    """
+    Paths of id-sorted runs covering one CSV: the file itself when it is
+    already sorted, else one spilled CSV per chunk, each sorted by id
+    (the first pass of an external sort).
+    """
+    if ordered:
+        return [Path(path)]
+    spill_dir = Path(spill_dir)
+    spill_dir.mkdir(parents=True, exist_ok=True)
+    runs = []
+    for i, chunk in enumerate(pd.read_csv(path, chunksize=chunk_size, dtype=dtypes)):
+        run = spill_dir / f"{Path(path).stem}_{i:05d}.csv"
+        chunk.sort_values("id", kind="stable").to_csv(run, index=False)
+        runs.append(run)
+    return runs
+
+
+def merge_files(runs, out):
+    """Merge id-sorted CSV runs into one, row text untouched; ties keep run order."""
+    # cast/crew cells are far longer than the csv module's default field limit
+    csv.field_size_limit(2**31 - 1)
+    files = [open(run, newline="", encoding="utf-8") for run in runs]
+    try:
+        readers = [csv.reader(fh) for fh in files]
+        header = [next(reader) for reader in readers][0]
+        key = header.index("id")
+        with open(out, "w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(header)
+            writer.writerows(heapq.merge(*readers, key=lambda row: float(row[key])))
+    finally:
+        for fh in files:
+            fh.close()
+
+
+def merge_runs(runs, spill_dir, name, fan_in=16):
+    """
+    The later passes of the external sort: spilled runs are merged `fan_in`
+    at a time until at most `fan_in` are left, so open files and read
+    buffers stay bounded however many runs the first pass wrote.
+    """
+    level = 0
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i:i + fan_in]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            out = Path(spill_dir) / f"{name}_m{level}_{i // fan_in:05d}.csv"
+            merge_files(group, out)
+            for run in group:
+                run.unlink()
+            merged.append(out)
+        runs = merged
+        level += 1
+    return runs
+
+
+def iter_rows(path, source, json_cols, dtypes, buffer_rows=500, rules=None, refs=None):
+    """
+    (id, source, row) for every row of a sorted run, JSON columns parsed.
+    With `rules` (a quality.RuleSet) rows failing a rule are dropped first.
+    """
+    for chunk in pd.read_csv(path, chunksize=buffer_rows, dtype=dtypes):
+        if rules is not None:
+            chunk = chunk[rules.mask(chunk, refs)].copy()
+        parse_columns(chunk, json_cols)
+        for row in chunk.to_dict(orient="records"):
+            yield int(row["id"]), source, row
+
+
+def stream_merge(paths, spill_dir, chunk_size=5000, buffer_rows=500, rules=None, refs=None, fan_in=16):
+    """
+    Full outer merge-join of movies, credits and keywords on id.
+    Yields (id, {source: row}) in id order. At most `fan_in` sorted runs per
+    source are read at once, each through a `buffer_rows` buffer, so memory
+    and open files do not grow with the input. Duplicate ids within one
+    source keep the first row, like a lookup would. `rules` and `refs` map a
+    source to its quality.RuleSet and the reference ids that RuleSet checks
+    against.
+    """
+    rules, refs = rules or {}, refs or {}
+    streams = []
+    for source, json_cols in SOURCES.items():
+        dtypes, ordered = scan_csv(paths[source])
+        runs = sorted_runs(paths[source], spill_dir, dtypes, ordered, chunk_size)
+        runs = merge_runs(runs, spill_dir, Path(paths[source]).stem, fan_in)
+        for run in runs:
+            streams.append(iter_rows(run, source, json_cols, dtypes, buffer_rows, rules.get(source), refs.get(source)))
+    merged = heapq.merge(*streams, key=lambda item: item[0])
+    for movie_id, group in groupby(merged, key=lambda item: item[0]):
+        rows = {}
+        for _, source, row in group:
+            rows.setdefault(source, row)
+        yield movie_id, rows
+
+
+def movie_document(rows):
+    """The movie document of one merged id, shaped like a merged/renamed row."""
+    doc = {("tmdbId" if k == "id" else k): v for k, v in rows["movies"].items()}
+    credit = rows.get("credits") or {}
+    doc["cast"] = credit.get("cast")
+    doc["crew"] = credit.get("crew")
+    doc["keywords"] = (rows.get("keywords") or {}).get("keywords")
+    return doc
+
+
+# -- multi-process parsing ---------------------------------------------------
+
+def split_partitions(paths, parts, clean=None):
+    """
+    Read every CSV once and split it into `parts` id partitions (id % parts).
+    Workers get their share of the raw frames and only parse that, instead
+    of each one reading and tokenizing the whole files. `clean` maps the
+    whole frames ({source: frame}) to the rows to keep before the split, so
+    rules spanning partitions (unique, references) see every row.
+    """
+    frames = {source: pd.read_csv(path) for source, path in paths.items()}
+    if clean is not None:
+        frames = clean(frames)
+    split = [{} for _ in range(parts)]
+    for source, frame in frames.items():
+        # malformed (non-numeric) ids all land in partition 0
+        part_of = pd.to_numeric(frame["id"], errors="coerce").fillna(0).astype(np.int64) % parts
+        for part in range(parts):
+            split[part][source] = frame[(part_of == part).to_numpy()]
+    return split
+
+
+def parse_partition(frames):
+    movies = parse_columns(frames["movies"].copy(), MOVIE_JSON_COLS)
+    credits = parse_columns(frames["credits"].copy(), CREDIT_JSON_COLS)
+    keywords = parse_columns(frames["keywords"].copy(), KEYWORD_JSON_COLS)
+    return merge_movies(movies, credits, keywords), credits
+
+
+def load_partition(frames, slim_movies=False, batch_size=1000):
+    """
+    Worker: parse and merge one id partition and insert its movies and credits
+    directly. Only the movie and credit counts and the (small) people map go
+    back to the parent.
+    """
+    from DbConnector import DbConnector
+
+    merged, credits = parse_partition(frames)
+    people, credit_records = people_and_credits(credits)
+    if slim_movies:
+        merged = merged.drop(columns=["cast", "crew"])
+
+    connection = DbConnector(quiet=True)
+    try:
+        records = merged.to_dict(orient="records")
+        for i in range(0, len(records), batch_size):
+            connection.db.movies.insert_many(records[i:i+batch_size])
+        for i in range(0, len(credit_records), batch_size):
+            connection.db.credits.insert_many(credit_records[i:i+batch_size])
+    finally:
+        connection.close_connection()
+    return len(records), len(credit_records), people
+
+
+def count_partition(frames):
+    """Benchmark worker: parse and merge only, return the row count."""
+    merged, _ = parse_partition(frames)
+    return len(merged)
+
+
+def run_partitions(worker, paths, workers, clean=None, **kwargs):
+    """Run `worker(frames, **kwargs)` on every id partition (see split_partitions) in a process pool."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(worker, frames, **kwargs) for frames in split_partitions(paths, workers, clean)]
+        return [f.result() for f in futures]
+
+
+def benchmark(paths, worker_counts=None):
+    """Time the parse-and-merge step for increasing worker counts."""
+    worker_counts = worker_counts or [n for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)]
+    baseline = None
+    print(f"{'Workers':7} | {'Rows':8} | {'Time (s)':8} | {'Speedup':7}")
+    print("-" * 40)
+    for workers in worker_counts:
+        start = time.time()
+        rows = sum(run_partitions(count_partition, paths, workers))
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print(f"{workers:7} | {rows:8,} | {elapsed:8.2f} | {baseline / elapsed:6.2f}x")
+
+
+def main():
+    data_path = Path(__file__).resolve().parent.parent / "dat" / "clean"
+    benchmark({
+        "movies": data_path / "movies.csv",
+        "credits": data_path / "credits.csv",
+        "keywords": data_path / "keywords.csv"
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# percentiles.py
+import bisect
+import math
+from report import logger
+
+# "exact": sort the group's values ($push + $sortArray, or a Python list);
+# "approximate": server-side $median/$percentile (MongoDB 7.0+) or a Python TDigest
+METHODS = ("exact", "approximate")
+
+# first server version with the $median / $percentile accumulators
+SERVER_PERCENTILES = (7, 0)
+
+
+def check_method(method):
+    if method not in METHODS:
+        raise ValueError(f"Unknown percentile method {method!r}; expected one of {', '.join(METHODS)}")
+    return method
+
+
+def server_supports(db):
+    return tuple(db.client.server_info()["versionArray"][:2]) >= SERVER_PERCENTILES
+
+
+def resolve(db, method):
+    """`method`, falling back to "exact" on servers without $median."""
+    if check_method(method) == "approximate" and not server_supports(db):
+        logger.warning("$median needs MongoDB %d.%d+; computing exact medians", *SERVER_PERCENTILES)
+        return "exact"
+    return method
+
+
+# -- aggregation pipelines ---------------------------------------------
+
+def exact_expr(values, p=0.5):
+    """
+    p-th percentile of an array expression, linearly interpolated between
+    the closest ranks (the mean of the two middle values for the median).
+    Nulls are ignored; an empty array gives null.
+    """
+    return {
+        "$let": {
+            "vars": {"sorted": {"$sortArray": {
+                "input": {"$filter": {"input": values, "cond": {"$ne": ["$$this", None]}}},
+                "sortBy": 1
+            }}},
+            "in": {
+                "$let": {
+                    "vars": {"rank": {"$multiply": [p, {"$subtract": [{"$size": "$$sorted"}, 1]}]}},
+                    "in": {
+                        "$cond": [
+                            {"$eq": [{"$size": "$$sorted"}, 0]},
+                            None,
+                            {"$add": [
+                                {"$multiply": [{"$arrayElemAt": ["$$sorted", {"$floor": "$$rank"}]},
+                                               {"$subtract": [1, {"$subtract": ["$$rank", {"$floor": "$$rank"}]}]}]},
+                                {"$multiply": [{"$arrayElemAt": ["$$sorted", {"$ceil": "$$rank"}]},
+                                               {"$subtract": ["$$rank", {"$floor": "$$rank"}]}]}
+                            ]}
+                        ]
+                    }
+                }
+            }
+        }
+    }
+
+
+def group_fields(name, input, method="exact", p=0.5):
+    """
+    $group accumulators computing the p-th percentile of `input` as `name`;
+    follow the $group with finish_stages(name, method, p).
+    """
+    if check_method(method) == "approximate":
+        if p == 0.5:
+            return {name: {"$median": {"input": input, "method": "approximate"}}}
+        return {name: {"$percentile": {"input": input, "p": [p], "method": "approximate"}}}
+    return {f"{name}_values": {"$push": input}}
+
+
+def finish_stages(name, method="exact", p=0.5):
+    if method == "approximate":
+        return [] if p == 0.5 else [{"$set": {name: {"$arrayElemAt": [f"${name}", 0]}}}]
+    return [
+        {"$set": {name: exact_expr(f"${name}_values", p)}},
+        {"$unset": f"{name}_values"}
+    ]
+
+
+# -- client side -------------------------------------------------------
+
+def exact(values, p=0.5):
+    """Same interpolation as exact_expr, over a Python sequence."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = p * (len(values) - 1)
+    lo, hi = math.floor(rank), math.ceil(rank)
+    if lo == hi:
+        return values[lo]
+    return values[lo] + (values[hi] - values[lo]) * (rank - lo)
+
+
+class TDigest:
+    """
+    Streaming quantile sketch (merging t-digest): values are buffered and
+    folded into at most ~compression centroids, smallest near the tails.
+    Memory does not grow with the number of values; small inputs (fewer
+    values than centroids) give exact quantiles.
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, weight=1):
+        if value is None:
+            return
+        self.buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        other._compress()
+        self.buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in items)
+        means, weights = [], []
+        done, k_left = 0, self._k(0)
+        mean, weight = items[0]
+        for m, w in items[1:]:
+            if self._k((done + weight + w) / total) - k_left <= 1:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                done += weight
+                k_left = self._k(done / total)
+                mean, weight = m, w
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """Value at quantile q, interpolated between centroid centres."""
+        self._compress()
+        if not self.count:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+        centres, cum = [], 0
+        for w in self.weights:
+            centres.append(cum + w / 2)
+            cum += w
+        target = q * self.count
+        if target <= centres[0]:
+            return self._between(self.min, self.means[0], 0, centres[0], target)
+        if target >= centres[-1]:
+            return self._between(self.means[-1], self.max, centres[-1], self.count, target)
+        i = bisect.bisect_right(centres, target)
+        return self._between(self.means[i - 1], self.means[i], centres[i - 1], centres[i], target)
+
+    @staticmethod
+    def _between(a, b, lo, hi, x):
+        return a if hi == lo else a + (b - a) * (x - lo) / (hi - lo)
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+def accumulator(method="exact"):
+    """A fresh per-group accumulator: a plain list (exact) or a TDigest."""
+    return TDigest() if check_method(method) == "approximate" else []
+
+
+def add(acc, value):
+    if isinstance(acc, TDigest):
+        acc.add(value)
+    elif value is not None:
+        acc.append(value)
+
+
+def percentile(acc, p=0.5):
+    return acc.quantile(p) if isinstance(acc, TDigest) else exact(acc, p)
@@ -0,0 +1,245 @@
+# quality.py
+from ast import literal_eval
+import numpy as np
+import pandas as pd
+import polars as pl
+from report import logger
+
+
+def is_json(string):
+    try:
+        return isinstance(literal_eval(string), (list, dict))
+    except Exception:
+        return False
+
+
+class Rule:
+    """
+    One cleaning rule: a name, the columns it reads and a polars expression
+    that is True for the rows to keep. Rules hold no state; RuleSet does.
+    """
+    kind = "rule"
+
+    def __init__(self, name, columns):
+        self.name = name
+        self.columns = list(columns)
+
+    def expr(self, refs, seen, schema):
+        raise NotImplementedError
+
+
+class NotNull(Rule):
+    kind = "not_null"
+
+    def expr(self, refs, seen, schema):
+        return pl.all_horizontal([pl.col(c).is_not_null() for c in self.columns])
+
+
+class Unique(Rule):
+    """First row per key, across every chunk seen so far by the same RuleSet."""
+    kind = "unique"
+
+    def key(self):
+        return pl.col(self.columns[0]) if len(self.columns) == 1 else pl.struct(self.columns)
+
+    def expr(self, refs, seen, schema):
+        keep = self.key().is_first_distinct()
+        if seen is not None:
+            keep = keep & ~self.key().is_in(seen)
+        return keep
+
+
+class IsJson(Rule):
+    """Null or a Python-literal list/dict (the CSVs use literal syntax, not JSON)."""
+    kind = "is_json"
+
+    def expr(self, refs, seen, schema):
+        col = pl.col(self.columns[0])
+        return col.is_null() | col.map_elements(is_json, return_dtype=pl.Boolean)
+
+
+class ValidDate(Rule):
+    kind = "valid_date"
+
+    def __init__(self, name, columns, fmt="%Y-%m-%d"):
+        super().__init__(name, columns)
+        self.fmt = fmt
+
+    def expr(self, refs, seen, schema):
+        col = pl.col(self.columns[0]).cast(pl.Utf8)
+        return col.str.strptime(pl.Date, format=self.fmt, strict=False).is_not_null()
+
+
+class InRange(Rule):
+    kind = "in_range"
+
+    def __init__(self, name, columns, low, high):
+        super().__init__(name, columns)
+        self.low, self.high = low, high
+
+    def expr(self, refs, seen, schema):
+        return pl.col(self.columns[0]).is_between(self.low, self.high)
+
+
+class References(Rule):
+    """Semi-join: the column value must exist in refs[dataset][ref_column]."""
+    kind = "references"
+
+    def __init__(self, name, columns, dataset, ref_column):
+        super().__init__(name, columns)
+        self.dataset, self.ref_column = dataset, ref_column
+
+    def expr(self, refs, seen, schema):
+        column = self.columns[0]
+        values = to_series(refs[self.dataset]).cast(schema[column], strict=False).drop_nulls()
+        return pl.col(column).is_in(values.unique())
+
+
+def not_null(*columns):
+    return NotNull(f"not_null({', '.join(columns)})", columns)
+
+
+def unique(*columns):
+    return Unique(f"unique({', '.join(columns)})", columns)
+
+
+def json_column(column):
+    return IsJson(f"is_json({column})", [column])
+
+
+def valid_date(column, fmt="%Y-%m-%d"):
+    return ValidDate(f"valid_date({column})", [column], fmt)
+
+
+def in_range(column, low, high):
+    return InRange(f"in_range({column}, {low}, {high})", [column], low, high)
+
+
+def references(column, dataset, ref_column="id"):
+    return References(f"{column} in {dataset}.{ref_column}", [column], dataset, ref_column)
+
+
+# the cleaning of eda.py, in the order it is applied there
+RULES = {
+    "movies": [
+        not_null("adult", "budget", "original_language", "overview", "popularity", "revenue",
+                 "runtime", "status", "title", "video", "vote_average", "vote_count"),
+        not_null("imdb_id"),
+        unique("id"),
+        unique("imdb_id"),
+        valid_date("release_date"),
+        json_column("belongs_to_collection"),
+        json_column("genres"),
+        json_column("production_companies"),
+        json_column("production_countries"),
+        json_column("spoken_languages"),
+        references("id", "credits", "id"),
+        references("id", "links", "tmdbId")
+    ],
+    "credits": [
+        unique("id"),
+        json_column("cast"),
+        json_column("crew"),
+        references("id", "movies", "id")
+    ],
+    "keywords": [
+        unique("id"),
+        json_column("keywords"),
+        references("id", "links", "tmdbId")
+    ],
+    "ratings": [
+        not_null("userId", "movieId", "rating", "timestamp"),
+        in_range("rating", 0.5, 5.0),
+        unique("userId", "movieId"),
+        references("movieId", "links", "movieId")
+    ],
+    "links": [
+        not_null("movieId", "imdbId", "tmdbId"),
+        unique("tmdbId"),
+        references("tmdbId", "movies", "id")
+    ]
+}
+
+
+def to_series(values):
+    """Reference values (a pandas Series, numpy array or polars Series) as a polars Series."""
+    if isinstance(values, pd.Series):
+        return to_polars(values.to_frame("values"), ["values"])["values"]
+    return pl.Series(values)
+
+
+def to_polars(chunk, columns):
+    """The given columns of a pandas chunk as a polars frame (NaN -> null), without pyarrow."""
+    data = {}
+    for c in columns:
+        s = chunk[c]
+        # pandas >= 3 reads text as the "str" dtype, whose missing values are NaN too
+        if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+            data[c] = pl.Series(c, s.astype(object).where(s.notna(), None).tolist(), strict=False)
+        else:
+            data[c] = pl.Series(c, s.to_numpy(), nan_to_null=True)
+    return pl.DataFrame(data)
+
+
+class RuleSet:
+    """
+    The rules of one dataset applied in order, to a whole frame or chunk by
+    chunk. unique() keys are remembered between chunks and every rule keeps a
+    running count of the rows it rejected. References rules are skipped when
+    their dataset is not in `refs`; `skip` drops rules by kind, e.g. unique()
+    where the database already enforces the key.
+    """
+
+    def __init__(self, dataset, rules=None, skip=()):
+        self.dataset = dataset
+        self.rules = [r for r in (rules or RULES[dataset]) if r.kind not in skip]
+        self.rejects = {r.name: 0 for r in self.rules}
+        self.seen = {}
+        self.rows = 0
+
+    def active(self, columns, refs):
+        return [
+            r for r in self.rules
+            if set(r.columns) <= set(columns) and (r.kind != "references" or r.dataset in refs)
+        ]
+
+    def apply(self, df, refs=None, kinds=None):
+        """Rows of a polars frame that pass every rule (or only the rules of `kinds`)."""
+        refs = refs or {}
+        if kinds is None:
+            self.rows += df.height
+        for rule in self.active(df.columns, refs):
+            if kinds is not None and rule.kind not in kinds:
+                continue
+            before = df.height
+            df = df.filter(rule.expr(refs, self.seen.get(rule.name), df.schema))
+            self.rejects[rule.name] += before - df.height
+            if rule.kind == "unique":
+                keys = df.select(rule.key().alias("key"))["key"]
+                old = self.seen.get(rule.name)
+                self.seen[rule.name] = keys if old is None else pl.concat([old, keys])
+        return df
+
+    def mask(self, chunk, refs=None):
+        """Boolean keep-mask for a pandas chunk (used by the loader)."""
+        refs = refs or {}
+        columns = sorted({c for r in self.active(chunk.columns, refs) for c in r.columns})
+        df = to_polars(chunk, columns).with_row_index("_row")
+        kept = self.apply(df, refs)["_row"].to_numpy()
+        keep = np.zeros(len(chunk), dtype=bool)
+        keep[kept] = True
+        return keep
+
+    def report(self):
+        return [
+            {"dataset": self.dataset, "rule": name, "rejected": n}
+            for name, n in self.rejects.items()
+        ]
+
+    def log(self):
+        total = sum(self.rejects.values())
+        logger.info("%s: %s of %s rows rejected", self.dataset, f"{total:,}", f"{self.rows:,}")
+        for name, n in self.rejects.items():
+            if n:
+                logger.info("    • %s: %s", name, f"{n:,}")
+
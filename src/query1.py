@@ -1,73 +1,87 @@
 from pathlib import Path
 from DbConnector import DbConnector
+from report import logger, configure_logging
+from categorical import Dictionary
 import time
-import statistics
+import percentiles
+
+def build_pipeline(director_job="Director"):
+    # director_job is the crew.job value, or its code on dictionary-encoded data (see categorical.py)
+    return [
+        {
+            "$match": {
+                "crew.job": director_job,
+                "revenue": {"$exists": True, "$ne": None},
+                "vote_average": {"$exists": True, "$ne": None}
+            }
+        },
+        {
+            "$project": {
+                "title": 1,
+                "revenue": 1,
+                "vote_average": 1,
+                "crew": {"$filter": {"input": "$crew", "cond": {"$eq": ["$$this.job", director_job]}}}
+            }
+        }
+    ]
+
+def summarize_directors(movies, min_movies=5, director_job="Director", median="exact"):
+    # median: "exact" keeps every revenue, "approximate" a bounded t-digest per director
+    director_dict = {}
+    for movie in movies:
+        for member in movie['crew']:
+            if member.get('job') == director_job:
+                director_name = member.get('name')
+                if director_name not in director_dict:
+                    director_dict[director_name] = {
+                        "movies": 0,
+                        "revenues": percentiles.accumulator(median),
+                        "vote_total": 0
+                    }
+                director_dict[director_name]["movies"] += 1
+                percentiles.add(director_dict[director_name]["revenues"], movie["revenue"])
+                director_dict[director_name]["vote_total"] += movie["vote_average"]
+    
+    results = []
+    for director, data in director_dict.items():
+        if data["movies"] >= min_movies:
+            median_revenue = percentiles.percentile(data["revenues"])
+            avg_vote = data["vote_total"] / data["movies"]
+            results.append({
+                "director": director,
+                "movie_count": data["movies"],
+                "median_revenue": median_revenue,
+                "mean_vote": round(avg_vote, 2)
+            })
+    
+    results.sort(key=lambda x: x["median_revenue"], reverse=True)
+    return results
 
 class DirectorQueryExecutor:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
         
-    def query_top_directors(self, min_movies=5, top_n=10):
+    def query_top_directors(self, min_movies=5, top_n=10, median="exact"):
       
         start_time = time.time()
         
-        movies = list(self.db.movies.aggregate([
-            {
-                "$match": {
-                    "crew": {"$exists": True, "$ne": None},
-                    "revenue": {"$exists": True, "$ne": None},
-                    "vote_average": {"$exists": True, "$ne": None}
-                }
-            },
-            {
-                "$project": {
-                    "title": 1,
-                    "revenue": 1,
-                    "vote_average": 1,
-                    "crew": 1
-                }
-            }
-        ]))
-        
-
-        director_dict = {}
-        for movie in movies:
-            for member in movie['crew']:
-                if member.get('job') == "Director":
-                    director_name = member.get('name')
-                    if director_name not in director_dict:
-                        director_dict[director_name] = {
-                            "movies": [],
-                            "revenues": [],
-                            "vote_averages": []
-                        }
-                    director_dict[director_name]["movies"].append(movie["title"])
-                    director_dict[director_name]["revenues"].append(movie["revenue"])
-                    director_dict[director_name]["vote_averages"].append(movie["vote_average"])
-        
-        print(f"   ⏳ Filtrando directores con ≥ {min_movies} películas...")
-        results = []
-        for director, data in director_dict.items():
-            if len(data["movies"]) >= min_movies:
-                median_revenue = statistics.median(data["revenues"])
-                avg_vote = sum(data["vote_averages"]) / len(data["vote_averages"])
-                results.append({
-                    "director": director,
-                    "movie_count": len(data["movies"]),
-                    "median_revenue": median_revenue,
-                    "mean_vote": round(avg_vote, 2)
-                })
+        director_job = Dictionary.load(self.db).code("job", "Director")
+        movies = list(self.db.movies.aggregate(build_pipeline(director_job)))
         
-        results.sort(key=lambda x: x["median_revenue"], reverse=True)
+        logger.info("Filtrando directores con ≥ %d películas...", min_movies)
+        results = summarize_directors(movies, min_movies, director_job, median)
         
         elapsed = time.time() - start_time
         
-        for i, director in enumerate(results[:top_n], 1):
-            print(f"{i}. {director['director']}")
-            print(f"   • Películas: {director['movie_count']}")
-            print(f"   • Mediana revenue: {director['median_revenue']}")
-            print(f"   • Promedio vote_average: {director['mean_vote']:.2f}")
+        if not self.quiet:
+            for i, director in enumerate(results[:top_n], 1):
+                print(f"{i}. {director['director']}")
+                print(f"   • Películas: {director['movie_count']}")
+                print(f"   • Mediana revenue: {director['median_revenue']}")
+                print(f"   • Promedio vote_average: {director['mean_vote']:.2f}")
         
         return results
     
@@ -80,6 +94,7 @@ class DirectorQueryExecutor:
         self.connection.close_connection()
 
 def main():
+    configure_logging()
     executor = DirectorQueryExecutor()
     try:
         results = executor.query_top_directors(min_movies=5, top_n=10)
@@ -1,100 +1,218 @@
 from pathlib import Path
 from DbConnector import DbConnector
+from report import logger, configure_logging
+from topk import make_sketch, topk_recall, with_ties
 import time
 
+def build_pipeline():
+    return [
+        {
+            "$match": {
+                "cast": {"$exists": True, "$ne": None, "$not": {"$size": 0}},
+                "vote_average": {"$exists": True, "$ne": None}
+            }
+        },
+        {
+            "$project": {
+                "tmdbId": 1,
+                "title": 1,
+                "vote_average": 1,
+                "cast.id": 1,
+                "cast.name": 1
+            }
+        }
+    ]
+
+def count_actor_pairs(movies_with_actors, min_movies=3):
+    actor_pairs = {}
+
+    for movie in movies_with_actors:
+        if not movie.get('cast') or len(movie['cast']) < 2:
+            continue
+
+        actors = movie['cast']
+        vote_avg = movie.get('vote_average', 0)
+        title = movie.get('title', 'Unknown')
+
+        for i in range(len(actors)):
+            for j in range(i + 1, len(actors)):
+                actor1 = actors[i]
+                actor2 = actors[j]
+
+                if actor1['id'] > actor2['id']:
+                    actor1, actor2 = actor2, actor1
+
+                pair_key = (actor1['id'], actor2['id'])
+
+                if pair_key not in actor_pairs:
+                    actor_pairs[pair_key] = {
+                        'actor1_id': actor1['id'],
+                        'actor1_name': actor1['name'],
+                        'actor2_id': actor2['id'],
+                        'actor2_name': actor2['name'],
+                        'movies': [],
+                        'vote_averages': []
+                    }
+
+                actor_pairs[pair_key]['movies'].append(title)
+                actor_pairs[pair_key]['vote_averages'].append(vote_avg)
+
+    results = []
+
+    for pair_key, pair_data in actor_pairs.items():
+        co_appearances = len(pair_data['movies'])
+
+        if co_appearances >= min_movies:
+            avg_vote = sum(pair_data['vote_averages']) / len(pair_data['vote_averages'])
+
+            results.append({
+                'actor1_id': pair_data['actor1_id'],
+                'actor1_name': pair_data['actor1_name'],
+                'actor2_id': pair_data['actor2_id'],
+                'actor2_name': pair_data['actor2_name'],
+                'co_appearances': co_appearances,
+                'average_vote': round(avg_vote, 2),
+                'example_movies': pair_data['movies'][:5]
+            })
+
+    results.sort(key=lambda x: (-x['co_appearances'], x['actor1_name']))
+    return results
+
 class MovieQueryExecutor:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
         
-    def query_actor_pairs_costarring(self, min_movies=3, limit=20):
+    def query_actor_pairs_costarring(self, min_movies=3, limit=20, approximate=False, method="space_saving", epsilon=1e-5, use_graph=False):
         
         start_time = time.time()
 
-        movies_with_actors = list(self.db.movies.aggregate([
-            {
-                "$match": {
-                    "cast": {"$exists": True, "$ne": None, "$not": {"$size": 0}},
-                    "vote_average": {"$exists": True, "$ne": None}
-                }
-            },
-            {
-                "$project": {
-                    "tmdbId": 1,
-                    "title": 1,
-                    "vote_average": 1,
-                    "cast.id": 1,
-                    "cast.name": 1
-                }
-            }
-        ]))
+        if use_graph:
+            results = self.query_actor_pairs_graph(min_movies)
+            self.print_results(results[:limit])
+            return results
+
+        if approximate:
+            results = self.query_actor_pairs_approximate(min_movies, method, epsilon)
+            self.print_results(results[:limit])
+            return results
+
+        movies_with_actors = list(self.db.movies.aggregate(build_pipeline()))
 
-        actor_pairs = {}
+        results = count_actor_pairs(movies_with_actors, min_movies)
         
-        for movie in movies_with_actors:
-            if not movie.get('cast') or len(movie['cast']) < 2:
-                continue
+        display_results = results[:limit]
+        
+        elapsed = time.time() - start_time
+        
+        self.print_results(display_results)
                 
-            actors = movie['cast']
+        return results
+
+    def query_actor_pairs_approximate(self, min_movies=3, method="space_saving", epsilon=1e-5):
+        """
+        Single bounded-memory pass over a movies cursor feeding every actor pair
+        into a heavy-hitter sketch (see topk.py). Reported co_appearances are
+        upper bounds; count_error is the maximum overestimation of each one.
+        min_movies is checked against movies_seen, the films counted while the
+        pair was monitored (a guaranteed lower bound, equal to count - error
+        for space_saving), and average_vote and example_movies cover those films.
+        """
+        sketch = make_sketch(method, epsilon=epsilon)
+
+        cursor = self.db.movies.find(
+            {
+                "cast.1": {"$exists": True},
+                "vote_average": {"$exists": True, "$ne": None}
+            },
+            {"_id": 0, "title": 1, "vote_average": 1, "cast.id": 1, "cast.name": 1}
+        )
+
+        for movie in cursor:
+            actors = sorted(movie['cast'], key=lambda a: a['id'])
             vote_avg = movie.get('vote_average', 0)
             title = movie.get('title', 'Unknown')
-            
+
             for i in range(len(actors)):
                 for j in range(i + 1, len(actors)):
-                    actor1 = actors[i]
-                    actor2 = actors[j]
-                    
-                    if actor1['id'] > actor2['id']:
-                        actor1, actor2 = actor2, actor1
-                    
-                    pair_key = (actor1['id'], actor2['id'])
-                    
-                    if pair_key not in actor_pairs:
-                        actor_pairs[pair_key] = {
-                            'actor1_id': actor1['id'],
-                            'actor1_name': actor1['name'],
-                            'actor2_id': actor2['id'],
-                            'actor2_name': actor2['name'],
-                            'movies': [],
-                            'vote_averages': []
-                        }
-                    
-                    actor_pairs[pair_key]['movies'].append(title)
-                    actor_pairs[pair_key]['vote_averages'].append(vote_avg)
-        
+                    actor1, actor2 = actors[i], actors[j]
+                    payload = sketch.offer((actor1['id'], actor2['id']))
+                    if payload is None:
+                        continue
+                    if not payload:
+                        payload.update(actor1_name=actor1['name'], actor2_name=actor2['name'],
+                                       seen=0, vote_sum=0, movies=[])
+                    payload['seen'] += 1
+                    payload['vote_sum'] += vote_avg
+                    if len(payload['movies']) < 5:
+                        payload['movies'].append(title)
 
         results = []
-        
-        for pair_key, pair_data in actor_pairs.items():
-            co_appearances = len(pair_data['movies'])
-            
-            if co_appearances >= min_movies:
-                avg_vote = sum(pair_data['vote_averages']) / len(pair_data['vote_averages'])
-                
-                results.append({
-                    'actor1_id': pair_data['actor1_id'],
-                    'actor1_name': pair_data['actor1_name'],
-                    'actor2_id': pair_data['actor2_id'],
-                    'actor2_name': pair_data['actor2_name'],
-                    'co_appearances': co_appearances,
-                    'average_vote': round(avg_vote, 2),
-                    'example_movies': pair_data['movies'][:5]
-                })
-        
-        
+        for (actor1_id, actor2_id), count, error, payload in sketch.top():
+            if not payload or payload['seen'] < min_movies:
+                continue
+            results.append({
+                'actor1_id': actor1_id,
+                'actor1_name': payload['actor1_name'],
+                'actor2_id': actor2_id,
+                'actor2_name': payload['actor2_name'],
+                'co_appearances': count,
+                'count_error': error,
+                'movies_seen': payload['seen'],
+                'average_vote': round(payload['vote_sum'] / payload['seen'], 2),
+                'example_movies': payload['movies']
+            })
+
         results.sort(key=lambda x: (-x['co_appearances'], x['actor1_name']))
-        
-        display_results = results[:limit]
-        
-        elapsed = time.time() - start_time
-        
+        logger.info("Sketch %s: %s pares procesados, error máximo ≤ %.1f", method, f"{sketch.n:,}", sketch.error_bound())
+        return results
+
+    def validate_approximate(self, k=20, min_movies=3, method="space_saving", epsilon=1e-5):
+        """Top-k recall of query_actor_pairs_approximate against count_actor_pairs on the same movies."""
+        start = time.time()
+        exact = count_actor_pairs(self.db.movies.aggregate(build_pipeline()), min_movies)[:k]
+        exact_s = time.time() - start
+        start = time.time()
+        approx = with_ties(self.query_actor_pairs_approximate(min_movies, method, epsilon), k, lambda r: r['co_appearances'])
+        key = lambda r: (r['actor1_id'], r['actor2_id'])
+        return {"k": k, "recall": topk_recall(map(key, exact), map(key, approx)),
+                "exact_s": exact_s, "approximate_s": time.time() - start}
+
+    def query_actor_pairs_graph(self, min_movies=3):
+        """
+        Same report computed on the cached CSR collaboration graph (see graph.py)
+        instead of re-reading every cast array from MongoDB.
+        """
+        from graph import CollaborationGraph, CAST
+
+        graph = CollaborationGraph.load_or_build(self.db)
+        # same movies as build_pipeline: only those with a vote_average
+        results = [{
+            'actor1_id': pair['a'],
+            'actor1_name': graph.name(pair['a']),
+            'actor2_id': pair['b'],
+            'actor2_name': graph.name(pair['b']),
+            'co_appearances': pair['count'],
+            'average_vote': round(pair['mean_vote'], 2),
+            'example_movies': [graph.titles[m] for m in pair['movies'][:5]]
+        } for pair in graph.top_pairs(CAST, CAST, min_movies, movie_mask=graph.has_votes())]
+
+        results.sort(key=lambda x: (-x['co_appearances'], x['actor1_name']))
+        return results
+
+    def print_results(self, display_results):
+        if self.quiet:
+            return
         for i, pair in enumerate(display_results, 1):
             print(f"\n{i}. {pair['actor1_name']} & {pair['actor2_name']}")
-            print(f"   • Co-apariciones: {pair['co_appearances']} películas")
+            if 'count_error' in pair:
+                print(f"   • Co-apariciones: {pair['co_appearances']} películas (≤ {pair['count_error']:.0f} de error, {pair['movies_seen']} vistas)")
+            else:
+                print(f"   • Co-apariciones: {pair['co_appearances']} películas")
             print(f"   • Promedio vote_average: {pair['average_vote']:.2f}")
             print(f"   • Películas ejemplo: {', '.join(pair['example_movies'][:3])}")
-                
-        return results
     
     def export_results_to_csv(self, results, output_path):
         import pandas as pd
@@ -107,6 +225,8 @@ class MovieQueryExecutor:
                 'actor2_id': pair['actor2_id'],
                 'actor2_name': pair['actor2_name'],
                 'co_appearances': pair['co_appearances'],
+                'count_error': pair.get('count_error'),
+                'movies_seen': pair.get('movies_seen'),
                 'average_vote': pair['average_vote'],
                 'example_movies': ', '.join(pair['example_movies'][:5])
             })
@@ -118,6 +238,7 @@ class MovieQueryExecutor:
         self.connection.close_connection()
 
 def main():
+    configure_logging()
     executor = MovieQueryExecutor()
     
     try:
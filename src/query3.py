@@ -1,94 +1,107 @@
 from pathlib import Path
 from DbConnector import DbConnector
+import genres
 import time
 
+def build_pipeline(min_movies=10, top_n=10, example_genres=5):
+    return [
+        # movies with cast and at least one genre (see genres.py for genre_mask)
+        {
+            "$match": {
+                "cast": {"$exists": True, "$ne": []},
+                "genre_mask": {"$gt": 0}
+            }
+        },
+
+        {
+            "$unwind": {
+                "path": "$cast",
+                "preserveNullAndEmptyArrays": False
+            }
+        },
+
+        # genre breadth is the OR of the movies' masks: no genre unwind, no string sets
+        {
+            "$group": {
+                "_id": {
+                    "actor_id": "$cast.id",
+                    "actor_name": "$cast.name"
+                },
+                "genre_mask": {"$bitOr": "$genre_mask"},
+                "movie_count": {"$sum": 1}
+            }
+        },
+
+        {
+            "$match": {
+                "movie_count": {"$gte": min_movies}
+            }
+        },
+
+        {
+            "$project": {
+                "_id": 0,
+                "actor_id": "$_id.actor_id",
+                "actor_name": "$_id.actor_name",
+                "genre_mask": 1,
+                "genre_count": genres.popcount_expr("$genre_mask"),
+                "movie_count": 1
+            }
+        },
+
+        {
+            "$sort": {
+                "genre_count": -1,
+                "actor_name": 1
+            }
+        },
+
+        {
+            "$limit": top_n
+        },
+
+        # names only for the rows we report
+        *genres.decode_stages("genre_mask", "all_genres"),
+
+        {
+            "$project": {
+                "actor_name": 1,
+                "actor_id": 1,
+                "genre_count": 1,
+                "movie_count": 1,
+                "example_genres": {"$slice": ["$all_genres", example_genres]},
+                "all_genres": 1
+            }
+        }
+    ]
+
+
 class MovieQueryExecutor:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
         
     def query_top_actors_by_genre_breadth(self, min_movies=10, top_n=10, example_genres=5):
 
         
         start_time = time.time()
         
-        pipeline = [
-            {
-                "$unwind": {
-                    "path": "$cast",
-                    "preserveNullAndEmptyArrays": False
-                }
-            },
-            
-            {
-                "$unwind": {
-                    "path": "$genres",
-                    "preserveNullAndEmptyArrays": False
-                }
-            },
-            
-            {
-                "$group": {
-                    "_id": {
-                        "actor_id": "$cast.id",
-                        "actor_name": "$cast.name"
-                    },
-                    "distinct_genres": {"$addToSet": "$genres.name"},
-                    "movie_count": {"$sum": 1}
-                }
-            },
-            
-            {
-                "$project": {
-                    "_id": 0,
-                    "actor_id": "$_id.actor_id",
-                    "actor_name": "$_id.actor_name",
-                    "genre_count": {"$size": "$distinct_genres"},
-                    "distinct_genres": 1,
-                    "movie_count": 1
-                }
-            },
-            
-            {
-                "$match": {
-                    "movie_count": {"$gte": min_movies}
-                }
-            },
-            
-            {
-                "$sort": {
-                    "genre_count": -1,
-                    "actor_name": 1
-                }
-            },
-            
-            {
-                "$limit": top_n
-            },
-            
-            {
-                "$project": {
-                    "actor_name": 1,
-                    "actor_id": 1,
-                    "genre_count": 1,
-                    "movie_count": 1,
-                    "example_genres": {"$slice": ["$distinct_genres", example_genres]},
-                    "all_genres": "$distinct_genres"
-                }
-            }
-        ]
+        pipeline = build_pipeline(min_movies, top_n, example_genres)
         
         results = list(self.db.movies.aggregate(pipeline))
         
         elapsed = time.time() - start_time
         
         
-        for i, actor in enumerate(results, 1):
-            print(f"\n{i}. {actor['actor_name']}")
-            print(f"   • Actor ID: {actor['actor_id']}")
-            print(f"   • Géneros distintos: {actor['genre_count']}")
-            print(f"   • Películas acreditadas: {actor['movie_count']}")
-            print(f"   • Géneros de ejemplo: {', '.join(actor['example_genres'])}")
+        if not self.quiet:
+            for i, actor in enumerate(results, 1):
+                print(f"\n{i}. {actor['actor_name']}")
+                print(f"   • Actor ID: {actor['actor_id']}")
+                print(f"   • Géneros distintos: {actor['genre_count']}")
+                print(f"   • Películas acreditadas: {actor['movie_count']}")
+                print(f"   • Géneros de ejemplo: {', '.join(actor['example_genres'])}")
             
         
         return results
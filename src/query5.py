@@ -3,163 +3,143 @@ from pathlib import Path
 from DbConnector import DbConnector
 import time
 import csv
+import percentiles
+
+def build_pipeline(genre_mask=0, median="exact"):
+    # genre_mask: only movies having all these genres (genres.mask_for); 0 keeps every movie
+    # median: "exact" (sorted arrays) or "approximate" (server $median, MongoDB 7.0+)
+    head = [{"$match": {"genre_mask": {"$bitsAllSet": genre_mask}}}] if genre_mask else []
+    return head + [
+        # Keep movies with a release_date and runtime
+        {
+            "$addFields": {
+                "release_date_parsed": {
+                    "$cond": [
+                        {"$and": [{"$ne": ["$release_date", None]}, {"$ne": ["$release_date", ""]}]},
+                        {"$dateFromString": {"dateString": "$release_date", "onError": None}},
+                        None
+                    ]
+                },
+                "runtime": {"$ifNull": ["$runtime", None]},
+                # primary genre name: first element's name (if exists)
+                "primary_genre": {
+                    "$let": {
+                        "vars": {
+                            "g": {"$ifNull": ["$genres", []]}
+                        },
+                        "in": {
+                            "$cond": [
+                                {"$gt": [{"$size": "$$g"}, 0]},
+                                {"$arrayElemAt": ["$$g.name", 0]},
+                                None
+                            ]
+                        }
+                    }
+                }
+            }
+        },
+
+        # Filter out docs without parsed release date or runtime or primary_genre
+        {
+            "$match": {
+                "release_date_parsed": {"$ne": None},
+                "runtime": {"$ne": None},
+                "primary_genre": {"$ne": None}
+            }
+        },
+
+        # Compute decade number and label
+        {
+            "$addFields": {
+                "year": {"$year": "$release_date_parsed"}
+            }
+        },
+        {
+            "$addFields": {
+                "decade_num": {"$multiply": [{"$floor": {"$divide": ["$year", 10]}}, 10]},
+                "decade_label": {
+                    "$concat": [
+                        {"$toString": {"$multiply": [{"$floor": {"$divide": ["$year", 10]}}, 10]}},
+                        "s"
+                    ]
+                }
+            }
+        },
+
+        # Group by decade and primary_genre
+        {
+            "$group": {
+                "_id": {"decade_num": "$decade_num", "decade_label": "$decade_label", "primary_genre": "$primary_genre"},
+                "movie_count": {"$sum": 1},
+                **percentiles.group_fields("median_runtime", "$runtime", median)
+            }
+        },
+
+        *percentiles.finish_stages("median_runtime", median),
+
+        # Projection
+        {
+            "$project": {
+                "_id": 0,
+                "decade_num": "$_id.decade_num",
+                "decade_label": "$_id.decade_label",
+                "primary_genre": "$_id.primary_genre",
+                "movie_count": 1,
+                "median_runtime": 1
+            }
+        },
+
+        # Sort by decade ascending, median runtime desc
+        {"$sort": {"decade_num": 1, "median_runtime": -1}}
+    ]
+
 
 class DecadeGenreRuntimeQuery:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
 
-    def task_5_median_runtime_by_decade_genre(self):
+    def task_5_median_runtime_by_decade_genre(self, genre_mask=0, median="exact"):
         """
         By decade and primary genre (first element in genres),
-        compute median runtime and movie count.
+        compute median runtime and movie count, optionally only over movies
+        having all the genres of `genre_mask`.
         Sort by decade ascending then median runtime descending.
         """
-        print("\nTask 5: Median runtime and movie count by decade & primary genre")
-        print("-" * 80)
+        if not self.quiet:
+            print("\nTask 5: Median runtime and movie count by decade & primary genre")
+            print("-" * 80)
         start = time.time()
 
-        pipeline = [
-            # Keep movies with a release_date and runtime
-            {
-                "$addFields": {
-                    "release_date_parsed": {
-                        "$cond": [
-                            {"$and": [{"$ne": ["$release_date", None]}, {"$ne": ["$release_date", ""]}]},
-                            {"$dateFromString": {"dateString": "$release_date", "onError": None}},
-                            None
-                        ]
-                    },
-                    "runtime": {"$ifNull": ["$runtime", None]},
-                    # primary genre name: first element's name (if exists)
-                    "primary_genre": {
-                        "$let": {
-                            "vars": {
-                                "g": {"$ifNull": ["$genres", []]}
-                            },
-                            "in": {
-                                "$cond": [
-                                    {"$gt": [{"$size": "$$g"}, 0]},
-                                    {"$arrayElemAt": ["$$g.name", 0]},
-                                    None
-                                ]
-                            }
-                        }
-                    }
-                }
-            },
-
-            # Filter out docs without parsed release date or runtime or primary_genre
-            {
-                "$match": {
-                    "release_date_parsed": {"$ne": None},
-                    "runtime": {"$ne": None},
-                    "primary_genre": {"$ne": None}
-                }
-            },
-
-            # Compute decade number and label
-            {
-                "$addFields": {
-                    "year": {"$year": "$release_date_parsed"}
-                }
-            },
-            {
-                "$addFields": {
-                    "decade_num": {"$multiply": [{"$floor": {"$divide": ["$year", 10]}}, 10]},
-                    "decade_label": {
-                        "$concat": [
-                            {"$toString": {"$multiply": [{"$floor": {"$divide": ["$year", 10]}}, 10]}},
-                            "s"
-                        ]
-                    }
-                }
-            },
-
-            # Group by decade and primary_genre
-            {
-                "$group": {
-                    "_id": {"decade_num": "$decade_num", "decade_label": "$decade_label", "primary_genre": "$primary_genre"},
-                    "movie_count": {"$sum": 1},
-                    "runtimes": {"$push": "$runtime"}
-                }
-            },
-
-            # Prepare sorted runtimes
-            {
-                "$addFields": {
-                    "sorted_runtimes": {
-                        "$sortArray": {"input": "$runtimes", "sortBy": 1}
-                    },
-                    "n": {"$size": "$runtimes"}
-                }
-            },
-
-            # median calculation
-            {
-                "$addFields": {
-                    "mid": {"$floor": {"$divide": ["$n", 2]}},
-                    "median_runtime": {
-                        "$cond": [
-                            {"$eq": ["$n", 0]},
-                            None,
-                            {
-                                "$cond": [
-                                    {"$eq": [{"$mod": ["$n", 2]}, 1]},
-                                    {"$arrayElemAt": ["$sorted_runtimes", {"$floor": {"$divide": ["$n", 2]}}]},
-                                    {
-                                        "$avg": [
-                                            {"$arrayElemAt": ["$sorted_runtimes", {"$subtract": [{"$floor": {"$divide": ["$n", 2]}}, 1]}]},
-                                            {"$arrayElemAt": ["$sorted_runtimes", {"$floor": {"$divide": ["$n", 2]}}]}
-                                        ]
-                                    }
-                                ]
-                            }
-                        ]
-                    }
-                }
-            },
-
-            # Projection
-            {
-                "$project": {
-                    "_id": 0,
-                    "decade_num": "$_id.decade_num",
-                    "decade_label": "$_id.decade_label",
-                    "primary_genre": "$_id.primary_genre",
-                    "movie_count": 1,
-                    "median_runtime": 1
-                }
-            },
-
-            # Sort by decade ascending, median runtime desc
-            {"$sort": {"decade_num": 1, "median_runtime": -1}}
-        ]
+        pipeline = build_pipeline(genre_mask, percentiles.resolve(self.db, median))
 
         results = list(self.db.movies.aggregate(pipeline))
         elapsed = time.time() - start
 
-        # Print results
-        print(f"\nQuery executed in {elapsed:.2f}s")
-        print(f"Rows: {len(results)}\n")
-        print("=" * 80)
-        header = f"{'Decade':8} | {'Genre':30} | {'Movies':6} | {'Median runtime':13}"
-        print(header)
-        print("-" * 80)
-        for r in results:
-            med = ("{:.1f}".format(r['median_runtime']) if isinstance(r.get('median_runtime'), (int, float)) else "N/A")
-            print(f"{r['decade_label']:8} | {r['primary_genre'][:30]:30} | {r['movie_count']:6,} | {med:13}")
-        print("=" * 80)
-
-        # Export CSV
-        out = Path(__file__).resolve().parent.parent / "results" / "task5_decade_genre_runtime.csv"
-        out.parent.mkdir(exist_ok=True)
-        with open(out, "w", newline="", encoding="utf-8") as fh:
-            w = csv.writer(fh)
-            w.writerow(["decade_num", "decade_label", "primary_genre", "movie_count", "median_runtime"])
+        if not self.quiet:
+            # Print results
+            print(f"\nQuery executed in {elapsed:.2f}s")
+            print(f"Rows: {len(results)}\n")
+            print("=" * 80)
+            header = f"{'Decade':8} | {'Genre':30} | {'Movies':6} | {'Median runtime':13}"
+            print(header)
+            print("-" * 80)
             for r in results:
-                w.writerow([r.get("decade_num"), r.get("decade_label"), r.get("primary_genre"), r.get("movie_count"), r.get("median_runtime")])
-        print(f"\nResults exported to: {out}")
+                med = ("{:.1f}".format(r['median_runtime']) if isinstance(r.get('median_runtime'), (int, float)) else "N/A")
+                print(f"{r['decade_label']:8} | {r['primary_genre'][:30]:30} | {r['movie_count']:6,} | {med:13}")
+            print("=" * 80)
+
+            # Export CSV
+            out = Path(__file__).resolve().parent.parent / "results" / "task5_decade_genre_runtime.csv"
+            out.parent.mkdir(exist_ok=True)
+            with open(out, "w", newline="", encoding="utf-8") as fh:
+                w = csv.writer(fh)
+                w.writerow(["decade_num", "decade_label", "primary_genre", "movie_count", "median_runtime"])
+                for r in results:
+                    w.writerow([r.get("decade_num"), r.get("decade_label"), r.get("primary_genre"), r.get("movie_count"), r.get("median_runtime")])
+            print(f"\nResults exported to: {out}")
 
         return results
 
@@ -5,83 +5,102 @@ import time
 import csv
 import re
 
+# regex to match 'noir' or 'neo-noir' (word boundaries), case-insensitive
+NOIR_PATTERN = r"\b(?:neo-)?noir\b"
+
+def build_pipeline(top_n=20, min_votes=50, pattern=NOIR_PATTERN, tmdb_ids=None, text=True):
+    """
+    tmdb_ids: keyword hits (see keywords.py) matched next to the text regex;
+    with text=False only they are matched, through the tmdbId index.
+    """
+    regex = {"$regex": pattern, "$options": "i"}
+    hits = [{"overview": regex}, {"tagline": regex}] if text else []
+    if tmdb_ids is not None:
+        hits.append({"tmdbId": {"$in": list(tmdb_ids)}})
+
+    return [
+        {
+            "$match": {
+                "vote_count": {"$gte": min_votes},
+                "$or": hits
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "title": 1,
+                "release_date": 1,
+                "vote_average": 1,
+                "vote_count": 1,
+                "year": {
+                    "$cond": [
+                        {"$and": [{"$ne": ["$release_date", None]}, {"$ne": ["$release_date", ""]}]},
+                        {"$year": {"$dateFromString": {"dateString": "$release_date", "onError": None}}},
+                        None
+                    ]
+                }
+            }
+        },
+        {"$sort": {"vote_average": -1, "vote_count": -1}},
+        {"$limit": top_n}
+    ]
+
+
 class NoirSearchQuery:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
 
-    def task_7_top_noir_movies(self, top_n=20):
+    def task_7_top_noir_movies(self, top_n=20, min_votes=50, source="text"):
         """
         Text (or regex) search over overview and tagline for 'noir' or 'neo-noir'
-        (case-insensitive). Filter vote_count >= 50. Return top `top_n` by vote_average.
+        (case-insensitive). Filter vote_count >= min_votes. Return top `top_n` by vote_average.
+        source: "text", "keywords" (movies tagged with a matching keyword, from the
+        keyword inverted index) or "both".
         """
-        print("\nTask 7: Top movies matching 'noir' / 'neo-noir' (vote_count >= 50)")
-        print("-" * 80)
+        if not self.quiet:
+            print(f"\nTask 7: Top movies matching 'noir' / 'neo-noir' (vote_count >= {min_votes})")
+            print("-" * 80)
         start = time.time()
 
-        # regex to match 'noir' or 'neo-noir' (word boundaries), case-insensitive
-        pattern = r"\b(?:neo-)?noir\b"
-        regex = {"$regex": pattern, "$options": "i"}
-
-        pipeline = [
-            {
-                "$match": {
-                    "vote_count": {"$gte": 50},
-                    "$or": [
-                        {"overview": regex},
-                        {"tagline": regex}
-                    ]
-                }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "title": 1,
-                    "release_date": 1,
-                    "vote_average": 1,
-                    "vote_count": 1,
-                    "year": {
-                        "$cond": [
-                            {"$and": [{"$ne": ["$release_date", None]}, {"$ne": ["$release_date", ""]}]},
-                            {"$year": {"$dateFromString": {"dateString": "$release_date", "onError": None}}},
-                            None
-                        ]
-                    }
-                }
-            },
-            {"$sort": {"vote_average": -1, "vote_count": -1}},
-            {"$limit": top_n}
-        ]
+        tmdb_ids = None
+        if source in ("keywords", "both"):
+            from keywords import KeywordIndex
+            tmdb_ids = KeywordIndex.load_or_build(self.db).search(NOIR_PATTERN).tolist()
+        pipeline = build_pipeline(top_n, min_votes, NOIR_PATTERN, tmdb_ids, text=source != "keywords")
 
         results = list(self.db.movies.aggregate(pipeline))
         elapsed = time.time() - start
 
-        print(f"\nQuery executed in {elapsed:.2f}s")
-        print(f"Top {len(results)} matching movies:\n")
-        print("=" * 80)
-        print(f"{'Title':50} | {'Year':4} | {'vote_avg':8} | {'vote_count':10}")
-        print("-" * 80)
-        for r in results:
-            title = (r.get("title") or "")[:50]
-            year = r.get("year") or (r.get("release_date") or "")[:10]
-            print(f"{title:50} | {str(year):4} | {r.get('vote_average'):8} | {r.get('vote_count'):10,}")
-        print("=" * 80)
-
-        # Export CSV
-        out = Path(__file__).resolve().parent.parent / "results" / "task7_noir_top20.csv"
-        out.parent.mkdir(exist_ok=True)
-        with open(out, "w", newline="", encoding="utf-8") as fh:
-            w = csv.DictWriter(fh, fieldnames=["title", "year", "release_date", "vote_average", "vote_count"])
-            w.writeheader()
+        if not self.quiet:
+            print(f"\nQuery executed in {elapsed:.2f}s")
+            print(f"Top {len(results)} matching movies:\n")
+            print("=" * 80)
+            print(f"{'Title':50} | {'Year':4} | {'vote_avg':8} | {'vote_count':10}")
+            print("-" * 80)
             for r in results:
-                w.writerow({
-                    "title": r.get("title"),
-                    "year": r.get("year"),
-                    "release_date": r.get("release_date"),
-                    "vote_average": r.get("vote_average"),
-                    "vote_count": r.get("vote_count")
-                })
-        print(f"\nResults exported to: {out}")
+                title = (r.get("title") or "")[:50]
+                year = r.get("year") or (r.get("release_date") or "")[:10]
+                print(f"{title:50} | {str(year):4} | {r.get('vote_average'):8} | {r.get('vote_count'):10,}")
+            print("=" * 80)
+
+            # Export CSV
+            out = Path(__file__).resolve().parent.parent / "results" / "task7_noir_top20.csv"
+            out.parent.mkdir(exist_ok=True)
+            with open(out, "w", newline="", encoding="utf-8") as fh:
+                w = csv.DictWriter(fh, fieldnames=["title", "year", "release_date", "vote_average", "vote_count"])
+                w.writeheader()
+                for r in results:
+                    w.writerow({
+                        "title": r.get("title"),
+                        "year": r.get("year"),
+                        "release_date": r.get("release_date"),
+                        "vote_average": r.get("vote_average"),
+                        "vote_count": r.get("vote_count")
+                    })
+            print(f"\nResults exported to: {out}")
 
         return results
 
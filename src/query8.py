@@ -1,93 +1,205 @@
 # query8.py
 from pathlib import Path
 from DbConnector import DbConnector
+from report import logger, configure_logging
+from topk import make_sketch, topk_recall, with_ties
+from categorical import Dictionary
+import math
 import time
 import csv
 
+def build_pipeline(min_collabs=3, top_n=20, min_votes=100, director_job="Director"):
+    return [
+        # Consider only movies with sufficient votes and a director (crew.job index)
+        {"$match": {"crew.job": director_job, "vote_count": {"$gte": min_votes}}},
+        # unwind crew and filter for Directors
+        {"$unwind": {"path": "$crew"}},
+        {"$match": {"crew.job": director_job}},
+        # unwind cast
+        {"$unwind": {"path": "$cast"}},
+        # group by director + actor pair
+        {
+            "$group": {
+                "_id": {
+                    "director": "$crew.name",
+                    "actor": "$cast.name"
+                },
+                "films_count": {"$sum": 1},
+                "mean_vote": {"$avg": "$vote_average"},
+                "mean_revenue": {"$avg": {"$ifNull": ["$revenue", 0]}},
+                "titles": {"$push": "$title"}
+            }
+        },
+        # keep pairs with enough collaborations
+        {"$match": {"films_count": {"$gte": min_collabs}}},
+        # sort by mean_vote desc
+        {"$sort": {"mean_vote": -1}},
+        {"$limit": top_n},
+        # project result
+        {
+            "$project": {
+                "_id": 0,
+                "director": "$_id.director",
+                "actor": "$_id.actor",
+                "films_count": 1,
+                "mean_vote": 1,
+                "mean_revenue": 1,
+                "titles": 1
+            }
+        }
+    ]
+
+
 class DirectorActorPairsQuery:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
 
-    def task_8_top_director_actor_pairs(self, min_collabs=3, top_n=20):
+    def task_8_top_director_actor_pairs(self, min_collabs=3, top_n=20, approximate=False, method="space_saving", epsilon=1e-5, use_graph=False, min_votes=100):
         """
-        Among movies with vote_count >= 100, find director-actor pairs that collaborated >= min_collabs times.
+        Among movies with vote_count >= min_votes, find director-actor pairs that collaborated >= min_collabs times.
         Return top_n pairs by mean vote_average. Also include films_count and mean_revenue.
+        With approximate=True the pairs are counted in one streaming pass with a heavy-hitter sketch;
+        with use_graph=True they are read from the cached collaboration graph.
         """
-        print(f"\nTask 8: Director–actor pairs with ≥ {min_collabs} collaborations (vote_count ≥ 100)")
-        print("-" * 80)
+        if not self.quiet:
+            print(f"\nTask 8: Director–actor pairs with ≥ {min_collabs} collaborations (vote_count ≥ {min_votes})")
+            print("-" * 80)
         start = time.time()
 
-        pipeline = [
-            # Consider only movies with sufficient votes
-            {"$match": {"vote_count": {"$gte": 100}}},
-            # unwind crew and filter for Directors
-            {"$unwind": {"path": "$crew"}},
-            {"$match": {"crew.job": "Director"}},
-            # unwind cast
-            {"$unwind": {"path": "$cast"}},
-            # group by director + actor pair
-            {
-                "$group": {
-                    "_id": {
-                        "director": "$crew.name",
-                        "actor": "$cast.name"
-                    },
-                    "films_count": {"$sum": 1},
-                    "mean_vote": {"$avg": "$vote_average"},
-                    "mean_revenue": {"$avg": {"$ifNull": ["$revenue", 0]}},
-                    "titles": {"$push": "$title"}
-                }
-            },
-            # keep pairs with enough collaborations
-            {"$match": {"films_count": {"$gte": min_collabs}}},
-            # sort by mean_vote desc
-            {"$sort": {"mean_vote": -1}},
-            {"$limit": top_n},
-            # project result
-            {
-                "$project": {
-                    "_id": 0,
-                    "director": "$_id.director",
-                    "actor": "$_id.actor",
-                    "films_count": 1,
-                    "mean_vote": 1,
-                    "mean_revenue": 1,
-                    "titles": 1
-                }
-            }
-        ]
+        director_job = Dictionary.load(self.db).code("job", "Director")
+        pipeline = build_pipeline(min_collabs, top_n, min_votes, director_job)
 
-        results = list(self.db.movies.aggregate(pipeline))
+        if use_graph:
+            results = self.graph_director_actor_pairs(min_collabs, top_n, min_votes)
+        elif approximate:
+            results = self.approximate_director_actor_pairs(min_collabs, top_n, method, epsilon, min_votes, director_job)
+        else:
+            results = list(self.db.movies.aggregate(pipeline))
         elapsed = time.time() - start
 
-        print(f"\nQuery executed in {elapsed:.2f}s")
-        print(f"Top {len(results)} director–actor pairs:\n")
-        print("=" * 80)
-        for i, r in enumerate(results, start=1):
-            print(f"{i}. {r['director']} — {r['actor']}")
-            print(f"   • Films together: {r['films_count']}")
-            print(f"   • Mean vote_average: {r['mean_vote']:.3f}")
-            print(f"   • Mean revenue: ${int(r['mean_revenue']):,}")
-            print(f"   • Example titles: {', '.join((r.get('titles') or [])[:5])}")
-            print("-" * 80)
-
-        # Export CSV
-        out = Path(__file__).resolve().parent.parent / "results" / "task8_director_actor_pairs.csv"
-        out.parent.mkdir(exist_ok=True)
-        with open(out, "w", newline="", encoding="utf-8") as fh:
-            w = csv.writer(fh)
-            w.writerow(["rank", "director", "actor", "films_count", "mean_vote", "mean_revenue", "example_titles"])
+        if not self.quiet:
+            print(f"\nQuery executed in {elapsed:.2f}s")
+            print(f"Top {len(results)} director–actor pairs:\n")
+            print("=" * 80)
             for i, r in enumerate(results, start=1):
-                w.writerow([i, r.get("director"), r.get("actor"), r.get("films_count"), r.get("mean_vote"), r.get("mean_revenue"), "; ".join((r.get("titles") or [])[:5])])
-        print(f"\nResults exported to: {out}")
+                print(f"{i}. {r['director']} — {r['actor']}")
+                if "count_error" in r:
+                    print(f"   • Films together: {r['films_count']} (≤ {r['count_error']:.0f} overcount, {r['films_seen']} seen)")
+                else:
+                    print(f"   • Films together: {r['films_count']}")
+                print(f"   • Mean vote_average: {r['mean_vote']:.3f}" if r["mean_vote"] is not None else "   • Mean vote_average: n/a")
+                print(f"   • Mean revenue: ${int(r['mean_revenue']):,}")
+                print(f"   • Example titles: {', '.join((r.get('titles') or [])[:5])}")
+                print("-" * 80)
+
+            # Export CSV
+            out = Path(__file__).resolve().parent.parent / "results" / "task8_director_actor_pairs.csv"
+            out.parent.mkdir(exist_ok=True)
+            with open(out, "w", newline="", encoding="utf-8") as fh:
+                w = csv.writer(fh)
+                w.writerow(["rank", "director", "actor", "films_count", "count_error", "films_seen", "mean_vote", "mean_revenue", "example_titles"])
+                for i, r in enumerate(results, start=1):
+                    w.writerow([i, r.get("director"), r.get("actor"), r.get("films_count"), r.get("count_error"), r.get("films_seen"), r.get("mean_vote"), r.get("mean_revenue"), "; ".join((r.get("titles") or [])[:5])])
+            print(f"\nResults exported to: {out}")
 
         return results
 
+    def graph_director_actor_pairs(self, min_collabs=3, top_n=20, min_votes=100):
+        """
+        Director-actor pairs from the CSR collaboration graph (see graph.py),
+        restricted to movies with vote_count >= min_votes.
+        """
+        from graph import CollaborationGraph, CAST, DIRECTOR
+
+        graph = CollaborationGraph.load_or_build(self.db)
+        mask = graph.movie_vote_counts >= min_votes
+        # grouped by name like the pipeline's $group on crew.name / cast.name
+        results = [{
+            "director": pair["a"],
+            "actor": pair["b"],
+            "films_count": pair["count"],
+            "mean_vote": pair["mean_vote"],
+            "mean_revenue": pair["mean_revenue"],
+            "titles": [graph.titles[m] for m in pair["movies"][:5]]
+        } for pair in graph.top_pairs(DIRECTOR, CAST, min_collabs, movie_mask=mask, by_name=True)]
+
+        # nulls last, as in the pipeline's descending $sort
+        results.sort(key=lambda r: -r["mean_vote"] if r["mean_vote"] is not None else math.inf)
+        return results[:top_n]
+
+    def approximate_director_actor_pairs(self, min_collabs=3, top_n=20, method="space_saving", epsilon=1e-5, min_votes=100, director_job="Director"):
+        """
+        Stream movies (vote_count >= min_votes) and feed every director-actor pair into a
+        heavy-hitter sketch (see topk.py). films_count is an upper bound with at most
+        count_error overestimation. min_collabs is checked against films_seen, the
+        films counted while the pair was monitored (a guaranteed lower bound, equal
+        to films_count - count_error for space_saving); means are over those films.
+        """
+        sketch = make_sketch(method, epsilon=epsilon)
+        cursor = self.db.movies.find(
+            {"vote_count": {"$gte": min_votes}, "crew.job": director_job},
+            {"_id": 0, "title": 1, "vote_average": 1, "revenue": 1, "crew.name": 1, "crew.job": 1, "cast.name": 1}
+        )
+
+        for movie in cursor:
+            directors = [c.get("name") for c in movie.get("crew") or [] if c.get("job") == director_job]
+            for director in directors:
+                for actor in movie.get("cast") or []:
+                    payload = sketch.offer((director, actor.get("name")))
+                    if payload is None:
+                        continue
+                    if not payload:
+                        payload.update(seen=0, votes=0, vote_sum=0, revenue_sum=0, titles=[])
+                    payload["seen"] += 1
+                    # like $avg, a missing vote_average is skipped rather than counted as 0
+                    if movie.get("vote_average") is not None:
+                        payload["votes"] += 1
+                        payload["vote_sum"] += movie["vote_average"]
+                    payload["revenue_sum"] += movie.get("revenue") or 0
+                    if len(payload["titles"]) < 5:
+                        payload["titles"].append(movie.get("title"))
+
+        results = []
+        for (director, actor), count, error, payload in sketch.top():
+            if not payload or payload["seen"] < min_collabs:
+                continue
+            results.append({
+                "director": director,
+                "actor": actor,
+                "films_count": count,
+                "count_error": error,
+                "films_seen": payload["seen"],
+                "mean_vote": payload["vote_sum"] / payload["votes"] if payload["votes"] else None,
+                "mean_revenue": payload["revenue_sum"] / payload["seen"],
+                "titles": payload["titles"]
+            })
+
+        # nulls last, as in the pipeline's descending $sort
+        results.sort(key=lambda r: -r["mean_vote"] if r["mean_vote"] is not None else math.inf)
+        logger.info("Sketch %s: %s pairs streamed, max count error ≤ %.1f", method, f"{sketch.n:,}", sketch.error_bound())
+        return results[:top_n]
+
+    def validate_approximate(self, k=20, min_collabs=3, min_votes=100, method="space_saving", epsilon=1e-5):
+        """Top-k recall of approximate_director_actor_pairs against the exact pipeline."""
+        director_job = Dictionary.load(self.db).code("job", "Director")
+        start = time.time()
+        exact = list(self.db.movies.aggregate(build_pipeline(min_collabs, k, min_votes, director_job), allowDiskUse=True))
+        exact_s = time.time() - start
+        start = time.time()
+        approx = self.approximate_director_actor_pairs(min_collabs, None, method, epsilon, min_votes, director_job)
+        approx = with_ties(approx, k, lambda r: r["mean_vote"])
+        key = lambda r: (r["director"], r["actor"])
+        return {"k": k, "recall": topk_recall(map(key, exact), map(key, approx)),
+                "exact_s": exact_s, "approximate_s": time.time() - start}
+
     def close(self):
         self.connection.close_connection()
 
 def main():
+    configure_logging()
     executor = DirectorActorPairsQuery()
     try:
         executor.task_8_top_director_actor_pairs(min_collabs=3, top_n=20)
@@ -1,79 +1,90 @@
 # query9.py
 from pathlib import Path
 from DbConnector import DbConnector
+from categorical import Dictionary
 import time
 import csv
 
+def build_pipeline(top_n=10, country="US", country_name="United States of America", exclude_language="en"):
+    return [
+        # Match originals not in exclude_language (non-English by default)
+        {"$match": {"original_language": {"$ne": exclude_language}}},
+
+        # At least one production_country of `country` (check by iso_3166_1) OR production_company origin_country == country
+        {"$match": {
+            "$or": [
+                {"production_countries": {"$elemMatch": {"iso_3166_1": country}}},
+                {"production_countries": {"$elemMatch": {"name": country_name}}},
+                {"production_companies": {"$elemMatch": {"origin_country": country}}}
+            ]
+        }},
+
+        # Group by original_language, count and grab an example title
+        {
+            "$group": {
+                "_id": "$original_language",
+                "count": {"$sum": 1},
+                "example_title": {"$first": "$title"}
+            }
+        },
+
+        {"$sort": {"count": -1}},
+        {"$limit": top_n},
+        {
+            "$project": {
+                "_id": 0,
+                "original_language": "$_id",
+                "count": 1,
+                "example_title": 1
+            }
+        }
+    ]
+
+
 class NonEnglishUSProductionQuery:
-    def __init__(self):
-        self.connection = DbConnector()
+    def __init__(self, quiet=False):
+        self.connection = DbConnector(quiet=quiet, analytics=True)
         self.db = self.connection.db
+        # quiet: skip console rendering/CSV export and just return the data
+        self.quiet = quiet
 
-    def task_9_top_original_languages(self, top_n=10):
+    def task_9_top_original_languages(self, top_n=10, country="US", country_name="United States of America", exclude_language="en"):
         """
-        Among movies where original_language != "en" but at least one production company
-        or production country is United States, find top original languages by count.
+        Among movies where original_language != exclude_language but at least one production
+        company or production country is `country` (United States by default), find top original languages by count.
         For each language, return count and one example title.
         """
-        print("\nTask 9: Top original languages (non-en) with US involvement")
-        print("-" * 80)
+        if not self.quiet:
+            print(f"\nTask 9: Top original languages (non-{exclude_language}) with {country} involvement")
+            print("-" * 80)
         start = time.time()
 
-        pipeline = [
-            # Match non-English originals
-            {"$match": {"original_language": {"$ne": "en"}}},
+        # language and country codes are dictionary-encoded once categorical.encode has run
+        d = Dictionary.load(self.db)
+        pipeline = build_pipeline(top_n, d.code("country", country), country_name, d.code("language", exclude_language))
 
-            # At least one production_country of US (check by iso_3166_1) OR production_company origin_country == 'US'
-            {"$match": {
-                "$or": [
-                    {"production_countries": {"$elemMatch": {"iso_3166_1": "US"}}},
-                    {"production_countries": {"$elemMatch": {"name": "United States of America"}}},
-                    {"production_companies": {"$elemMatch": {"origin_country": "US"}}}
-                ]
-            }},
-
-            # Group by original_language, count and grab an example title
-            {
-                "$group": {
-                    "_id": "$original_language",
-                    "count": {"$sum": 1},
-                    "example_title": {"$first": "$title"}
-                }
-            },
-
-            {"$sort": {"count": -1}},
-            {"$limit": top_n},
-            {
-                "$project": {
-                    "_id": 0,
-                    "original_language": "$_id",
-                    "count": 1,
-                    "example_title": 1
-                }
-            }
-        ]
-
-        results = list(self.db.movies.aggregate(pipeline))
+        results = d.decode_rows(list(self.db.movies.aggregate(pipeline)), {"original_language": "language"})
         elapsed = time.time() - start
 
-        print(f"\nQuery executed in {elapsed:.2f}s")
-        print(f"Top {len(results)} original languages:\n")
-        print("=" * 80)
-        print(f"{'Lang':6} | {'Count':6} | {'Example title'}")
-        print("-" * 80)
-        for r in results:
-            print(f"{r['original_language']:6} | {r['count']:6,} | {r['example_title']}")
-        print("=" * 80)
-
-        # Export CSV
-        out = Path(__file__).resolve().parent.parent / "results" / "task9_original_languages_us.csv"
-        out.parent.mkdir(exist_ok=True)
-        with open(out, "w", newline="", encoding="utf-8") as fh:
-            w = csv.writer(fh)
-            w.writerow(["original_language", "count", "example_title"])
+        if not self.quiet:
+            print(f"\nQuery executed in {elapsed:.2f}s")
+            print(f"Top {len(results)} original languages:\n")
+            print("=" * 80)
+            print(f"{'Lang':6} | {'Count':6} | {'Example title'}")
+            print("-" * 80)
             for r in results:
-                w.writerow([r.get("original_language"), r.get("count"), r.get("example_title")])
-        print(f"\nResults exported to: {out}")
+                print(f"{r['original_language']:6} | {r['count']:6,} | {r['example_title']}")
+            print("=" * 80)
+
+            # Export CSV
+            out = Path(__file__).resolve().parent.parent / "results" / "task9_original_languages_us.csv"
+            out.parent.mkdir(exist_ok=True)
+            with open(out, "w", newline="", encoding="utf-8") as fh:
+                w = csv.writer(fh)
+                w.writerow(["original_language", "count", "example_title"])
+                for r in results:
+                    w.writerow([r.get("original_language"), r.get("count"), r.get("example_title")])
+            print(f"\nResults exported to: {out}")
 
         return results
 
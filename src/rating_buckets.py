@@ -0,0 +1,57 @@
+# rating_buckets.py
+import time
+import ratings_schema
+from report import logger
+
+BUCKET_SIZE = 1000
+
+# bucketed collection -> (grouping key, array field, ratings field it is built from)
+LAYOUTS = {
+    "user_ratings": ("userId", "tmdbIds", "tmdbId"),
+    "movie_ratings": ("tmdbId", "userIds", "userId")
+}
+
+
+def build_pipeline(collection, bucket_size=BUCKET_SIZE):
+    """
+    Group the ratings collection into `collection`: one document per key and
+    chunk of at most `bucket_size` ratings, holding parallel arrays of the
+    other id and the rating (chunking keeps hot movies far below 16MB).
+    """
+    key, ids_field, other = LAYOUTS[collection]
+    return [
+        {"$match": {"tmdbId": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": f"${key}",
+                "ids": {"$push": f"${other}"},
+                "ratings": {"$push": "$rating"}
+            }
+        },
+        {"$addFields": {"starts": {"$range": [0, {"$size": "$ids"}, bucket_size]}}},
+        {"$unwind": {"path": "$starts", "includeArrayIndex": "chunk"}},
+        {
+            "$project": {
+                "_id": 0,
+                key: "$_id",
+                "chunk": 1,
+                ids_field: {"$slice": ["$ids", "$starts", bucket_size]},
+                "ratings": {"$slice": ["$ratings", "$starts", bucket_size]}
+            }
+        },
+        {"$addFields": {"count": {"$size": "$ratings"}}},
+        {"$out": collection}
+    ]
+
+
+def build(db, bucket_size=BUCKET_SIZE):
+    """(Re)build user_ratings and movie_ratings from the ratings collection."""
+    counts = {}
+    for collection, (key, _, _) in LAYOUTS.items():
+        start = time.time()
+        pipeline = ratings_schema.translate(db, build_pipeline(collection, bucket_size))
+        db.ratings.aggregate(pipeline, allowDiskUse=True)
+        db[collection].create_index([(key, 1), ("chunk", 1)], unique=True)
+        counts[collection] = db[collection].estimated_document_count()
+        logger.info("%s: %s buckets in %.2fs", collection, f"{counts[collection]:,}", time.time() - start)
+    return counts
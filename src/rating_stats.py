@@ -0,0 +1,113 @@
+# rating_stats.py
+import numpy as np
+from pymongo import UpdateOne
+from report import logger
+
+# histogram bins are half-stars: 0.5, 1.0, ..., 5.0
+BINS = 10
+
+
+class RatingSummary:
+    """
+    Per-movie MovieLens rating summary accumulated chunk by chunk: count,
+    sum, sum of squares and a half-star histogram, in arrays indexed by
+    tmdbId. Each chunk is reduced over its own distinct ids only, so its
+    cost follows the chunk and not the tmdbId range. Written to each movie
+    document as `rating_stats`.
+    """
+
+    def __init__(self, max_tmdb_id):
+        size = int(max_tmdb_id) + 1
+        self.count = np.zeros(size, dtype=np.int64)
+        self.sum = np.zeros(size, dtype=np.float64)
+        self.sumsq = np.zeros(size, dtype=np.float64)
+        self.hist = np.zeros((size, BINS), dtype=np.int64)
+
+    def add(self, tmdb_ids, ratings):
+        """Accumulate one chunk (rows with a missing tmdbId must be dropped first)."""
+        ratings = np.asarray(ratings, dtype=np.float64)
+        # compact the chunk's ids to 0..n-1; ids are distinct, so fancy-indexed += is safe
+        ids, inverse = np.unique(np.asarray(tmdb_ids, dtype=np.int64), return_inverse=True)
+        n = len(ids)
+        self.count[ids] += np.bincount(inverse, minlength=n)
+        self.sum[ids] += np.bincount(inverse, weights=ratings, minlength=n)
+        self.sumsq[ids] += np.bincount(inverse, weights=ratings * ratings, minlength=n)
+        half_stars = np.clip(np.rint(ratings * 2).astype(np.int64), 1, BINS) - 1
+        self.hist[ids] += np.bincount(inverse * BINS + half_stars, minlength=n * BINS).reshape(n, BINS)
+
+    def documents(self):
+        """(tmdbId, rating_stats) for every movie with at least one rating."""
+        for tmdb_id in np.flatnonzero(self.count):
+            n = int(self.count[tmdb_id])
+            mean = self.sum[tmdb_id] / n
+            yield int(tmdb_id), {
+                "count": n,
+                "sum": float(self.sum[tmdb_id]),
+                "sumsq": float(self.sumsq[tmdb_id]),
+                "mean": float(mean),
+                "variance": float(max(self.sumsq[tmdb_id] / n - mean * mean, 0.0)),
+                "hist": self.hist[tmdb_id].tolist()
+            }
+
+    def write(self, db, incremental=False, batch_size=1000):
+        """
+        Store the summary on the movies collection. With incremental=True the
+        counters are added to the existing ones and mean/variance recomputed
+        server-side, so new rating batches can be folded in without a rescan.
+        """
+        ops, written = [], 0
+        for tmdb_id, stats in self.documents():
+            if incremental:
+                ops.append(UpdateOne({"tmdbId": tmdb_id}, merge_stage(stats)))
+            else:
+                ops.append(UpdateOne({"tmdbId": tmdb_id}, {"$set": {"rating_stats": stats}}))
+            if len(ops) >= batch_size:
+                written += db.movies.bulk_write(ops, ordered=False).modified_count
+                ops = []
+        if ops:
+            written += db.movies.bulk_write(ops, ordered=False).modified_count
+        logger.info("rating_stats written to %s movies", f"{written:,}")
+        return written
+
+
+def merge_stage(stats):
+    """Update pipeline adding `stats` counters to the stored ones."""
+    old = lambda f, default: {"$ifNull": [f"$rating_stats.{f}", default]}
+    return [
+        {
+            "$set": {
+                "rating_stats.count": {"$add": [old("count", 0), stats["count"]]},
+                "rating_stats.sum": {"$add": [old("sum", 0), stats["sum"]]},
+                "rating_stats.sumsq": {"$add": [old("sumsq", 0), stats["sumsq"]]},
+                "rating_stats.hist": {
+                    "$map": {
+                        "input": {"$range": [0, BINS]},
+                        "as": "i",
+                        "in": {"$add": [
+                            {"$arrayElemAt": [old("hist", [0] * BINS), "$$i"]},
+                            {"$arrayElemAt": [stats["hist"], "$$i"]}
+                        ]}
+                    }
+                }
+            }
+        },
+        {"$set": {"rating_stats.mean": {"$divide": ["$rating_stats.sum", "$rating_stats.count"]}}},
+        {
+            "$set": {
+                "rating_stats.variance": {
+                    "$max": [0, {"$subtract": [
+                        {"$divide": ["$rating_stats.sumsq", "$rating_stats.count"]},
+                        {"$multiply": ["$rating_stats.mean", "$rating_stats.mean"]}
+                    ]}]
+                }
+            }
+        }
+    ]
+
+
+def top_rated_in_genre(db, genre, min_count=100, limit=10):
+    """Top movies of a genre by MovieLens mean rating: a single indexed movies query."""
+    return list(db.movies.find(
+        {"genres.name": genre, "rating_stats.count": {"$gte": min_count}},
+        {"_id": 0, "tmdbId": 1, "title": 1, "rating_stats.mean": 1, "rating_stats.count": 1}
+    ).sort("rating_stats.mean", -1).limit(limit))
@@ -0,0 +1,159 @@
+# ratings_schema.py
+import numpy as np
+
+# logical field -> stored field in the compact ratings layout
+COMPACT_FIELDS = {
+    "userId": "u",
+    "movieId": "m",
+    "tmdbId": "t",
+    "rating": "r",
+    "timestamp": "ts"
+}
+
+# compact ratings are stored as half-stars (4.5 -> 9)
+RATING_SCALE = 2
+
+
+def to_compact(chunk):
+    """
+    Turn a ratings chunk (userId, movieId, rating, timestamp, tmdbId) into the
+    compact layout. Rows without a tmdbId are dropped; ids and half-star ratings
+    become plain ints, which BSON stores as int32, and the timestamp a date.
+    """
+    import pandas as pd
+    chunk = chunk.dropna(subset=["tmdbId"])
+    return pd.DataFrame({
+        "u": chunk["userId"].astype("int32"),
+        "m": chunk["movieId"].astype("int32"),
+        "t": chunk["tmdbId"].astype("int32"),
+        "r": (chunk["rating"] * RATING_SCALE).round().astype("int8"),
+        "ts": pd.to_datetime(chunk["timestamp"], unit="s")
+    })
+
+
+class TmdbLookup:
+    """
+    movieId -> tmdbId mapping as two sorted typed arrays (from links.csv).
+    Lookups are one searchsorted per chunk; links without a tmdbId are left
+    out, so their ratings come back unmapped instead of as NaN floats.
+    """
+
+    def __init__(self, links):
+        links = links.dropna(subset=["tmdbId"]).sort_values("movieId")
+        self.movie_ids = links["movieId"].to_numpy(dtype=np.int64)
+        self.tmdb_ids = links["tmdbId"].to_numpy(dtype=np.int32)
+
+    @classmethod
+    def from_csv(cls, links_path):
+        import pandas as pd
+        return cls(pd.read_csv(links_path, usecols=["movieId", "tmdbId"]))
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def max_tmdb_id(self):
+        return int(self.tmdb_ids.max()) if len(self.tmdb_ids) else 0
+
+    def lookup(self, movie_ids):
+        """(tmdbIds, found) for an array of movieIds; tmdbIds are 0 where not found."""
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(self.movie_ids):
+            return np.zeros(len(movie_ids), dtype=np.int32), np.zeros(len(movie_ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.movie_ids, movie_ids), len(self.movie_ids) - 1)
+        found = self.movie_ids[pos] == movie_ids
+        return np.where(found, self.tmdb_ids[pos], 0).astype(np.int32), found
+
+    def split(self, chunk):
+        """(mapped chunk with an int32 tmdbId column, unmapped rows)."""
+        tmdb_ids, found = self.lookup(chunk["movieId"].to_numpy())
+        mapped = chunk[found].copy()
+        mapped["tmdbId"] = tmdb_ids[found]
+        return mapped, chunk[~found]
+
+
+def is_compact(db):
+    sample = db.ratings.find_one({}, {"_id": 0, "u": 1, "userId": 1})
+    return bool(sample) and "u" in sample
+
+
+def field(name, compact):
+    return COMPACT_FIELDS[name] if compact else name
+
+
+def expand_stage():
+    """Stage that restores the logical field names (and 0.5-5.0 ratings)."""
+    return {
+        "$project": {
+            "_id": 0,
+            "userId": "$u",
+            "movieId": "$m",
+            "tmdbId": "$t",
+            "rating": {"$divide": ["$r", RATING_SCALE]},
+            "timestamp": "$ts"
+        }
+    }
+
+
+def translate_match(match):
+    translated = {}
+    for key, cond in match.items():
+        if key == "rating" and isinstance(cond, dict):
+            cond = {op: (v * RATING_SCALE if isinstance(v, (int, float)) else v) for op, v in cond.items()}
+        elif key == "rating" and isinstance(cond, (int, float)):
+            cond = cond * RATING_SCALE
+        translated[COMPACT_FIELDS.get(key, key)] = cond
+    return translated
+
+
+def translate(db, pipeline, compact=None):
+    """
+    Run a ratings pipeline written against the logical field names on either
+    layout. Leading $match stages are rewritten to the compact names, so they
+    still use the indexes, and the rest of the pipeline sees logical documents.
+    """
+    if compact is None:
+        compact = is_compact(db)
+    if not compact:
+        return pipeline
+
+    head = []
+    rest = list(pipeline)
+    while rest and "$match" in rest[0]:
+        head.append({"$match": translate_match(rest.pop(0)["$match"])})
+    return head + [expand_stage()] + rest
+
+
+def storage_report(db, collection="ratings"):
+    """collStats summary: document count, average size, data/storage/index size."""
+    stats = db.command("collStats", collection)
+    return {
+        "collection": collection,
+        "count": stats.get("count"),
+        "avg_obj_size": stats.get("avgObjSize"),
+        "size": stats.get("size"),
+        "storage_size": stats.get("storageSize"),
+        "total_index_size": stats.get("totalIndexSize"),
+        "index_sizes": stats.get("indexSizes")
+    }
+
+
+def main():
+    from DbConnector import DbConnector
+    connection = DbConnector()
+    try:
+        r = storage_report(connection.db)
+        layout = "compact" if is_compact(connection.db) else "raw"
+        print(f"ratings ({layout} layout)")
+        print(f"   • Documents: {r['count']:,}")
+        print(f"   • Avg document size: {r['avg_obj_size']} bytes")
+        print(f"   • Data size: {r['size'] / 2**20:,.1f} MiB")
+        print(f"   • Storage size: {r['storage_size'] / 2**20:,.1f} MiB")
+        print(f"   • Index size (working set): {r['total_index_size'] / 2**20:,.1f} MiB")
+        for name, size in (r["index_sizes"] or {}).items():
+            print(f"       - {name}: {size / 2**20:,.1f} MiB")
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# registry.py
+import argparse
+import inspect
+import time
+from pathlib import Path
+from pymongo.errors import ExecutionTimeout, OperationFailure
+from DbConnector import DbConnector
+from report import logger, configure_logging, render, export_csv
+import ratings_schema
+import budgets
+from categorical import Dictionary
+import query1, query2, query3, query4, query5, query6, query7, query8, query9, query10
+import trends
+import similarity
+
+RESULTS = Path(__file__).resolve().parent.parent / "results"
+
+
+class Param:
+    """A typed task parameter; CLI overrides arrive as strings and are parsed with `type`."""
+
+    def __init__(self, name, type=int, default=None, help=""):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.help = help
+
+    def parse(self, value):
+        if value is None or isinstance(value, self.type):
+            return value
+        if self.type is bool:
+            if str(value).lower() in ("1", "true", "yes", "on"):
+                return True
+            if str(value).lower() in ("0", "false", "no", "off"):
+                return False
+            raise ValueError(f"{self.name}: expected a boolean, got {value!r}")
+        try:
+            return self.type(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{self.name}: expected {self.type.__name__}, got {value!r}")
+
+
+class QuerySpec:
+    """
+    One analytical question: a pipeline builder, its typed parameters and
+    where the pipeline runs. Parameters the builder does not take are passed,
+    with the aggregation output, to `reduce(docs, params)`, which shapes the
+    rows to report. `collection` may be a function of the parameters.
+    `encode` ({param: dictionary field}) and `decode` ({column: dictionary
+    field}) translate categorical values to and from their stored codes.
+    `max_time_ms` is the server-side time budget of one run.
+    """
+
+    def __init__(self, name, title, builder, params=(), collection="movies", reduce=None, options=None,
+                 encode=None, decode=None, max_time_ms=budgets.DEFAULT_MAX_TIME_MS):
+        self.name = name
+        self.title = title
+        self.builder = builder
+        self.params = {p.name: p for p in params}
+        self.collection = collection
+        self.reduce = reduce
+        self.options = options or {}
+        self.encode = encode or {}
+        self.decode = decode or {}
+        self.max_time_ms = max_time_ms
+        self.builder_args = [a for a in inspect.signature(builder).parameters if a in self.params]
+
+    def bind(self, **overrides):
+        """Defaults plus overrides, type checked. Unknown names are an error."""
+        unknown = set(overrides) - set(self.params)
+        if unknown:
+            raise ValueError(f"{self.name} has no parameter(s) {', '.join(sorted(unknown))}")
+        return {name: p.parse(overrides.get(name, p.default)) for name, p in self.params.items()}
+
+    def source(self, params):
+        return self.collection(params) if callable(self.collection) else self.collection
+
+
+REGISTRY = {}
+
+
+def register(spec):
+    REGISTRY[spec.name] = spec
+    return spec
+
+
+# (task name, parameter values) -> pipeline; builders are pure, so this never goes stale
+_compiled = {}
+compile_stats = {"hits": 0, "misses": 0}
+
+
+def compile_pipeline(name, params):
+    """The pipeline of task `name` for a bound parameter set, built once and reused."""
+    spec = REGISTRY[name]
+    key = (name, tuple((a, params[a]) for a in spec.builder_args))
+    if key in _compiled:
+        compile_stats["hits"] += 1
+    else:
+        compile_stats["misses"] += 1
+        _compiled[key] = spec.builder(**{a: params[a] for a in spec.builder_args})
+    return _compiled[key]
+
+
+class QueryEngine:
+    """
+    Runs any registered task: binds parameters, reuses compiled pipelines,
+    times the aggregation, caches results per parameter set and renders or
+    exports them. With cache_results=False nothing read from the data is
+    kept between runs: the categorical dictionary and the ratings layout are
+    read again for every run, so a long-lived engine follows reloads. quiet=True only returns the rows. Reads are routed to the
+    analytics members (see DbConnector.analytics_read_preference) unless
+    analytics=False. Every aggregation runs under its task's maxTimeMS (or
+    `max_time_ms`), without spilling to disk unless the task or
+    `allow_disk_use` allows it, tagged with a comment and killed on Ctrl+C.
+    check_cost=True logs the explain() estimate before each run.
+    """
+
+    def __init__(self, quiet=False, fmt="table", export=True, cache_results=True, analytics=True,
+                 max_time_ms=None, allow_disk_use=None, batch_size=budgets.DEFAULT_BATCH_SIZE, check_cost=False):
+        self.connection = DbConnector(quiet=quiet, analytics=analytics)
+        self.db = self.connection.db
+        self.quiet = quiet
+        self.fmt = fmt
+        self.export = export
+        self.cache_results = cache_results
+        self.results = {}
+        self.compact_ratings = None
+        self.dictionary = None
+        self.max_time_ms = max_time_ms
+        self.allow_disk_use = allow_disk_use
+        self.batch_size = batch_size
+        self.check_cost = check_cost
+
+    def refresh(self):
+        """Forget the dictionary and ratings layout read so far, e.g. after a reload or encode()."""
+        self.dictionary = None
+        self.compact_ratings = None
+
+    def categorical(self):
+        if self.dictionary is None:
+            self.dictionary = Dictionary.load(self.db)
+        return self.dictionary
+
+    def encoded(self, spec, params):
+        """Parameters with categorical values replaced by their stored codes."""
+        if not spec.encode:
+            return params
+        d = self.categorical()
+        return {k: d.code(spec.encode[k], v) if k in spec.encode else v for k, v in params.items()}
+
+    def pipeline_for(self, spec, params):
+        pipeline = compile_pipeline(spec.name, params)
+        if spec.source(params) == "ratings":
+            if self.compact_ratings is None:
+                self.compact_ratings = ratings_schema.is_compact(self.db)
+            pipeline = ratings_schema.translate(self.db, pipeline, self.compact_ratings)
+        return pipeline
+
+    def aggregate(self, spec, collection, pipeline):
+        options = {"allowDiskUse": False, **spec.options}
+        if self.allow_disk_use is not None:
+            options["allowDiskUse"] = self.allow_disk_use
+        comment = budgets.comment_for(spec.name)
+        try:
+            cursor = self.db[collection].aggregate(
+                pipeline, maxTimeMS=self.max_time_ms or spec.max_time_ms, batchSize=self.batch_size,
+                comment=comment, **options
+            )
+            return list(cursor)
+        except KeyboardInterrupt:
+            killed = budgets.kill(self.db, comment)
+            logger.warning("%s interrupted; killed server operation(s) %s", spec.name, killed or "none")
+            raise
+
+    def estimate(self, name, **overrides):
+        """explain() cost estimate of a task's pipeline; nothing is executed."""
+        spec = REGISTRY[name]
+        stored = self.encoded(spec, spec.bind(**overrides))
+        return budgets.explain_cost(self.db, spec.source(stored), self.pipeline_for(spec, stored))
+
+    def run(self, name, **overrides):
+        spec = REGISTRY[name]
+        params = spec.bind(**overrides)
+        key = (name, tuple(sorted(params.items())))
+
+        start = time.time()
+        if self.cache_results and key in self.results:
+            rows = self.results[key]
+            logger.info("%s: %d rows from cache", name, len(rows))
+        else:
+            if not self.cache_results:
+                self.refresh()
+            stored = self.encoded(spec, params)
+            if self.check_cost:
+                logger.info("%s cost estimate: %s", name, self.estimate(name, **overrides))
+            docs = self.aggregate(spec, spec.source(stored), self.pipeline_for(spec, stored))
+            rows = spec.reduce(docs, stored) if spec.reduce else docs
+            if spec.decode:
+                rows = self.categorical().decode_rows(rows, spec.decode)
+            logger.info("%s: %d rows in %.2fs", name, len(rows), time.time() - start)
+            if self.cache_results:
+                self.results[key] = rows
+
+        if not self.quiet:
+            changed = {k: v for k, v in params.items() if v != spec.params[k].default}
+            suffix = f" ({', '.join(f'{k}={v}' for k, v in changed.items())})" if changed else ""
+            print(f"\n{spec.title}{suffix}")
+            print("-" * 80)
+            render(rows, self.fmt)
+            if self.export:
+                export_csv(rows, RESULTS / f"{name}.csv")
+        return rows
+
+    def close(self):
+        self.connection.close_connection()
+
+
+def user_stats_rows(docs, params):
+    """Flatten the two query10 leaderboards into rows tagged with their leaderboard."""
+    result = docs[0] if docs else {}
+    rows = []
+    for board in ("top_genre_diverse", "top_variance"):
+        for u in result.get(board, []):
+            rows.append({
+                "leaderboard": board,
+                "userId": u.get("userId"),
+                "rating_count": u.get("rating_count"),
+                "distinct_genres": u.get("distinct_genre_count"),
+                "population_variance": u.get("population_variance"),
+                "example_genres": u.get("example_genres")
+            })
+    return rows
+
+
+register(QuerySpec(
+    "query1", "Top directors by median revenue", query1.build_pipeline,
+    [Param("min_movies", int, 5, "minimum movies per director"), Param("top_n", int, 10),
+     Param("director_job", str, "Director", "crew job counted as director"),
+     Param("median", str, "exact", "exact or approximate (t-digest)")],
+    reduce=lambda docs, p: query1.summarize_directors(docs, p["min_movies"], p["director_job"], p["median"])[:p["top_n"]],
+    encode={"director_job": "job"}
+))
+register(QuerySpec(
+    "query2", "Actor pairs co-starring most often", query2.build_pipeline,
+    [Param("min_movies", int, 3, "minimum shared movies"), Param("limit", int, 20)],
+    reduce=lambda docs, p: query2.count_actor_pairs(docs, p["min_movies"])[:p["limit"]]
+))
+register(QuerySpec(
+    "query3", "Actors with the widest genre range", query3.build_pipeline,
+    [Param("min_movies", int, 10), Param("top_n", int, 10), Param("example_genres", int, 5)]
+))
+register(QuerySpec(
+    "query4", "Top collections by total revenue", query4.build_pipeline,
+    [Param("top_n", int, 10), Param("min_movies", int, 3, "minimum movies per collection"),
+     Param("median", str, "exact", "exact or approximate (server $median, MongoDB 7.0+)")]
+))
+register(QuerySpec(
+    "query5", "Median runtime by decade and primary genre", query5.build_pipeline,
+    [Param("genre_mask", int, 0, "only movies with all these genre bits (see genres.py)"),
+     Param("median", str, "exact", "exact or approximate (server $median, MongoDB 7.0+)")]
+))
+register(QuerySpec(
+    "query6", "Female proportion of the top-billed cast by decade", query6.build_pipeline,
+    [Param("top_cast", int, 5, "top-billed cast members per movie")]
+))
+register(QuerySpec(
+    "query7", "Top noir / neo-noir movies", query7.build_pipeline,
+    [Param("top_n", int, 20), Param("min_votes", int, 50), Param("pattern", str, query7.NOIR_PATTERN, "regex over overview/tagline")]
+))
+register(QuerySpec(
+    "query8", "Top director-actor pairs by mean vote", query8.build_pipeline,
+    [Param("min_collabs", int, 3), Param("top_n", int, 20), Param("min_votes", int, 100),
+     Param("director_job", str, "Director", "crew job counted as director")],
+    encode={"director_job": "job"},
+    # the (director, actor) $group and $sort over every credit pair can outgrow the 100 MB stage limit
+    options={"allowDiskUse": True},
+    max_time_ms=300_000
+))
+register(QuerySpec(
+    "query9", "Top original languages of foreign-language co-productions", query9.build_pipeline,
+    [Param("top_n", int, 10), Param("country", str, "US", "ISO 3166-1 code"),
+     Param("country_name", str, "United States of America"), Param("exclude_language", str, "en")],
+    encode={"country": "country", "exclude_language": "language"},
+    decode={"original_language": "language"}
+))
+register(QuerySpec(
+    "query10", "User rating stats: genre breadth and variance", query10.build_pipeline,
+    [Param("top_n", int, 10), Param("min_ratings_for_variance", int, 20), Param("example_genres", int, 5),
+     Param("bucketed", bool, False, "read the user_ratings buckets")],
+    collection=lambda p: "user_ratings" if p["bucketed"] else "ratings",
+    reduce=user_stats_rows,
+    options={"allowDiskUse": True},
+    max_time_ms=600_000
+))
+register(QuerySpec(
+    "trends_movie", "Rolling rating trend of one movie", trends.movie_pipeline,
+    [Param("tmdb_id", int, 862), Param("start", str, "1995-01-01", "ISO date, inclusive"),
+     Param("end", str, "2018-01-01", "ISO date, exclusive"), Param("unit", str, "month", "period: day, week, month, year"),
+     Param("window", int, 3, "periods in the rolling mean"),
+     Param("timeseries", bool, False, "read the ratings_ts time-series collection")],
+    collection=lambda p: trends.TIMESERIES if p["timeseries"] else "ratings"
+))
+register(QuerySpec(
+    "trends_genre", "Rolling rating trend per genre", trends.genre_pipeline,
+    [Param("start", str, "1995-01-01", "ISO date, inclusive"), Param("end", str, "2018-01-01", "ISO date, exclusive"),
+     Param("unit", str, "year", "period: day, week, month, year"), Param("window", int, 3, "periods in the rolling mean"),
+     Param("genre", str, None, "only this genre"),
+     Param("timeseries", bool, False, "read the ratings_ts time-series collection")],
+    collection=lambda p: trends.TIMESERIES if p["timeseries"] else "ratings",
+    options={"allowDiskUse": True},
+    max_time_ms=300_000
+))
+register(QuerySpec(
+    "similar", "Movies most similar by user ratings", similarity.build_pipeline,
+    [Param("tmdb_id", int, 862), Param("top_n", int, 10)],
+    collection=similarity.COLLECTION
+))
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs or []:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--set expects name=value, got {pair!r}")
+        overrides[name] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run registered analytical queries with parameter overrides.")
+    parser.add_argument("tasks", nargs="*", help="task names (default: list the registry)")
+    parser.add_argument("--set", dest="overrides", action="append", metavar="NAME=VALUE",
+                        help="override a parameter of every given task that has it")
+    parser.add_argument("--format", choices=["table", "csv", "json"], default="table")
+    parser.add_argument("--no-export", action="store_true", help="do not write results/<task>.csv")
+    parser.add_argument("--quiet", action="store_true", help="only log timings")
+    parser.add_argument("--primary", action="store_true", help="read from the primary instead of the analytics members")
+    parser.add_argument("--max-time-ms", type=int, help="server-side time budget of every task (default: per task)")
+    parser.add_argument("--allow-disk-use", action="store_true", help="let every task spill blocking stages to disk")
+    parser.add_argument("--explain", action="store_true", help="print the explain() cost estimate instead of running")
+    args = parser.parse_args()
+    configure_logging()
+
+    if not args.tasks:
+        for spec in REGISTRY.values():
+            params = ", ".join(f"{p.name}={p.default!r}" for p in spec.params.values())
+            print(f"{spec.name:8} {spec.title}")
+            if params:
+                print(f"{'':8}   {params}")
+        return
+
+    overrides = parse_overrides(args.overrides)
+    for name in args.tasks:
+        if name not in REGISTRY:
+            raise SystemExit(f"Unknown task {name!r}; run without arguments to list them")
+    for key in overrides:
+        if not any(key in REGISTRY[name].params for name in args.tasks):
+            raise SystemExit(f"No given task has a parameter {key!r}")
+
+    engine = QueryEngine(quiet=args.quiet, fmt=args.format, export=not args.no_export, analytics=not args.primary,
+                         max_time_ms=args.max_time_ms, allow_disk_use=True if args.allow_disk_use else None)
+    try:
+        for name in args.tasks:
+            spec = REGISTRY[name]
+            task_overrides = {k: v for k, v in overrides.items() if k in spec.params}
+            if args.explain:
+                render([engine.estimate(name, **task_overrides)], args.format)
+                continue
+            try:
+                engine.run(name, **task_overrides)
+            except ExecutionTimeout:
+                logger.error("%s exceeded its %d ms budget and was stopped by the server",
+                             name, engine.max_time_ms or spec.max_time_ms)
+            except OperationFailure as e:
+                if e.code != budgets.QUERY_MEMORY_LIMIT:
+                    raise
+                logger.error("%s exceeded the stage memory limit without disk use; rerun it with --allow-disk-use", name)
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# report.py
+import csv
+import json
+import logging
+import sys
+import time
+from os import getenv
+from env import load_env
+
+logger = logging.getLogger("mongofilm")
+
+
+def configure_logging(level=None):
+    """Log to stderr at `level` (default: LOG_LEVEL env var, else INFO)."""
+    load_env()
+    level = level or getenv("LOG_LEVEL") or "INFO"
+    logging.basicConfig(level=level.upper() if isinstance(level, str) else level,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+
+def columns_of(rows):
+    """Column names in first-seen order across all rows."""
+    columns = {}
+    for row in rows:
+        for key in row:
+            columns.setdefault(key, None)
+    return list(columns)
+
+
+def flatten(value):
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    return value
+
+
+def render(rows, fmt="table", columns=None, out=None):
+    """
+    Write query results to `out` (default stdout) as a table, CSV or JSON.
+    Rendering is kept out of the query code so quiet runs only pay for the data.
+    """
+    out = out or sys.stdout
+    rows = list(rows)
+    columns = columns or columns_of(rows)
+
+    if fmt == "json":
+        json.dump([{c: row.get(c) for c in columns} for row in rows], out, default=str, ensure_ascii=False, indent=2)
+        out.write("\n")
+    elif fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([flatten(row.get(c)) for c in columns])
+    elif fmt == "table":
+        from tabulate import tabulate
+        out.write(tabulate([[flatten(row.get(c)) for c in columns] for row in rows], headers=columns) + "\n")
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+
+def export_csv(rows, path, columns=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        render(rows, "csv", columns, fh)
+    logger.info("Results exported to: %s", path)
+
+
+class ProgressReporter:
+    """
+    Rate-limited throughput logging for long loads: at most one line every
+    `interval` seconds, plus a final summary from finish().
+    """
+
+    def __init__(self, label, total=None, interval=10.0, level=logging.INFO, initial=0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.level = level
+        self.initial = initial
+        self.count = initial
+        self.start = self.last = time.time()
+
+    def update(self, n):
+        self.count += n
+        now = time.time()
+        if now - self.last >= self.interval and logger.isEnabledFor(self.level):
+            self.last = now
+            rate = (self.count - self.initial) / (now - self.start)
+            done = f"{self.count:,}/{self.total:,}" if self.total else f"{self.count:,}"
+            logger.log(self.level, "%s: %s (%.0f docs/s)", self.label, done, rate)
+
+    def finish(self):
+        """Log the summary line and return how many documents this reporter saw."""
+        done = self.count - self.initial
+        elapsed = time.time() - self.start
+        rate = done / elapsed if elapsed > 0 else 0
+        logger.log(self.level, "%s: %s documents in %.2fs (%.0f docs/s)", self.label, f"{done:,}", elapsed, rate)
+        return done
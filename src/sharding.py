@@ -0,0 +1,95 @@
+# sharding.py
+from concurrent.futures import ThreadPoolExecutor
+from bson.min_key import MinKey
+from bson.max_key import MaxKey
+import numpy as np
+import ratings_schema
+from report import logger
+
+
+def shard_key(strategy="hashed", compact=False):
+    user = ratings_schema.field("userId", compact)
+    return {user: "hashed"} if strategy == "hashed" else {user: 1}
+
+
+def zone_bounds(max_user_id, n_zones):
+    """Upper bounds of n_zones contiguous userId ranges covering 1..max_user_id."""
+    return [int(b) for b in np.linspace(0, max_user_id + 1, n_zones + 1)[1:].round()]
+
+
+def shard_ratings(db, strategy="hashed", compact=False, max_user_id=None):
+    """
+    Shard the (empty) ratings collection before the bulk load.
+    - "hashed": hashed userId key. MongoDB pre-splits empty hashed collections
+      across all shards, so the load is spread without a balancer pass.
+    - "zoned": ranged userId key with one zone per shard. Chunks are split at
+      the zone boundaries up front. Returns the upper bounds of the zones, in
+      shard order, so the loader can route each userId range to its own worker.
+    query10 groups by userId first, so either key lets each shard run the
+    $match/$group prefix on its own data and only the merge runs on mongos.
+    """
+    admin = db.client.admin
+    ns = f"{db.name}.ratings"
+    key = shard_key(strategy, compact)
+
+    admin.command("enableSharding", db.name)
+    if strategy == "hashed":
+        admin.command("shardCollection", ns, key=key)
+        logger.info("Sharded %s on %s", ns, key)
+        return None
+
+    if max_user_id is None:
+        raise ValueError("max_user_id is required for zoned sharding")
+    field = next(iter(key))
+    shards = [s["_id"] for s in admin.command("listShards")["shards"]]
+    bounds = zone_bounds(max_user_id, len(shards))
+
+    admin.command("shardCollection", ns, key=key)
+    lower = {field: MinKey()}
+    for i, shard in enumerate(shards):
+        zone = f"ratings_{shard}"
+        upper = {field: bounds[i]} if i < len(shards) - 1 else {field: MaxKey()}
+        admin.command("addShardToZone", shard, zone=zone)
+        admin.command("updateZoneKeyRange", ns, min=lower, max=upper, zone=zone)
+        if i < len(shards) - 1:
+            admin.command("split", ns, middle=upper)
+        lower = upper
+
+    logger.info("Sharded %s on %s with zones at userId bounds %s", ns, key, bounds[:-1])
+    return bounds
+
+
+class ZoneRouter:
+    """
+    Per-shard loader workers: each zone gets its own thread and insert queue,
+    so every batch targets exactly one shard instead of being scattered by mongos.
+    """
+
+    def __init__(self, write, bounds, user_field="userId"):
+        # write(records): the loader's batch writer, e.g. MovieInserter.write_ratings
+        self.write = write
+        self.bounds = np.asarray(bounds)
+        self.user_field = user_field
+        self.pools = [ThreadPoolExecutor(max_workers=1) for _ in bounds]
+        self.pending = []
+
+    def insert(self, frame):
+        """Split a ratings frame by zone and queue one insert_many per zone."""
+        zones = np.searchsorted(self.bounds, frame[self.user_field].to_numpy(), side="right")
+        for zone in np.unique(zones):
+            records = frame[zones == zone].to_dict(orient="records")
+            self.pending.append(self.pools[min(zone, len(self.pools) - 1)].submit(self.write, records))
+        # keep memory bounded: wait once too many batches are in flight
+        if len(self.pending) > 4 * len(self.pools):
+            self.drain()
+        return len(frame)
+
+    def drain(self):
+        for future in self.pending:
+            future.result()
+        self.pending = []
+
+    def close(self):
+        self.drain()
+        for pool in self.pools:
+            pool.shutdown()
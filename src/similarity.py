@@ -0,0 +1,203 @@
+# similarity.py
+import time
+import numpy as np
+from pymongo import ReplaceOne
+import ratings_schema
+from graph import gather, to_csr
+from report import logger
+
+COLLECTION = "similar_movies"
+
+
+def load_ratings(db, batch_size=100_000):
+    """(userIds, tmdbIds, ratings) of every mapped rating as typed arrays, on either layout."""
+    compact = ratings_schema.is_compact(db)
+    user, movie, rating = (ratings_schema.field(name, compact) for name in ("userId", "tmdbId", "rating"))
+    scale = ratings_schema.RATING_SCALE if compact else 1
+
+    size = max(db.ratings.estimated_document_count(), 1)
+    users = np.empty(size, dtype=np.int32)
+    movies = np.empty(size, dtype=np.int32)
+    ratings = np.empty(size, dtype=np.float32)
+    n = 0
+    cursor = db.ratings.find({movie: {"$ne": None}}, {"_id": 0, user: 1, movie: 1, rating: 1}, batch_size=batch_size)
+    for doc in cursor:
+        if n == size:
+            size *= 2
+            users, movies, ratings = (np.resize(a, size) for a in (users, movies, ratings))
+        users[n], movies[n], ratings[n] = doc[user], doc[movie], doc[rating]
+        n += 1
+    return users[:n], movies[:n], ratings[:n] / scale
+
+
+class RatingMatrix:
+    """
+    The user x movie ratings matrix in CSR form, by movie and by user. Each
+    movie column is scaled to unit norm, so the dot product of two columns is
+    their cosine similarity. Movies with fewer than `min_ratings` ratings are
+    left out; center=True subtracts each user's mean first (adjusted cosine).
+    """
+
+    def __init__(self, users, movies, ratings, min_ratings=20, center=False):
+        _, m = np.unique(movies, return_inverse=True)
+        keep = np.bincount(m)[m] >= min_ratings
+        users, movies, ratings = users[keep], movies[keep], ratings[keep].astype(np.float32)
+
+        self.tmdb_ids, m = np.unique(movies, return_inverse=True)
+        self.user_ids, u = np.unique(users, return_inverse=True)
+        self.n_movies, self.n_users = len(self.tmdb_ids), len(self.user_ids)
+
+        if center:
+            means = np.bincount(u, ratings) / np.maximum(np.bincount(u), 1)
+            ratings = ratings - means[u].astype(np.float32)
+        norms = np.sqrt(np.bincount(m, ratings.astype(np.float64) ** 2, minlength=self.n_movies))
+        values = (ratings / np.where(norms > 0, norms, 1)[m]).astype(np.float32)
+
+        self.counts = np.bincount(m, minlength=self.n_movies)
+        self.movie_offsets, self.movie_users, self.movie_values = to_csr(m, u, values, self.n_movies)
+        self.user_offsets, self.user_movies, self.user_values = to_csr(u, m, values, self.n_users)
+
+    def __len__(self):
+        return len(self.movie_users)
+
+    def pair_batches(self, lo, hi, max_pairs):
+        """
+        (block rows, partner movies, products) of movies lo..hi, in batches of
+        at most ~max_pairs co-ratings: one per (rating of a block movie, other
+        rating of the same user).
+        """
+        lengths = np.diff(self.movie_offsets[lo:hi + 1])
+        rows = np.repeat(np.arange(hi - lo, dtype=np.int64), lengths)
+        pos = np.arange(self.movie_offsets[lo], self.movie_offsets[hi])
+        users, weights = self.movie_users[pos], self.movie_values[pos]
+
+        fan_out = (self.user_offsets[users + 1] - self.user_offsets[users]).astype(np.int64)
+        ends = np.cumsum(fan_out)
+        cuts = np.searchsorted(ends, np.arange(max_pairs, ends[-1] if len(ends) else 0, max_pairs), side="right")
+        for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(users)]):
+            if a == b:
+                continue
+            q = gather(self.user_offsets, users[a:b])
+            reps = fan_out[a:b]
+            yield (np.repeat(rows[a:b], reps), self.user_movies[q],
+                   np.repeat(weights[a:b], reps) * self.user_values[q])
+
+    def neighbours(self, k=20, min_common=5, memory_mb=512):
+        """
+        Top-k most similar movies of every movie, one block of movies at a
+        time: similarities of a block against all movies are accumulated in
+        dense rows sized to fit half of `memory_mb` (with the bincount
+        temporaries), co-rating pairs are expanded in batches sized to the
+        other half. Yields (movie index, neighbour indices, scores, co-rating
+        counts).
+        """
+        budget = memory_mb * 2**20 // 2
+        block = int(max(1, min(self.n_movies, budget // (self.n_movies * 32))))
+        max_pairs = int(max(1, budget // 48))
+        k = min(k, self.n_movies - 1)
+
+        for lo in range(0, self.n_movies, block):
+            hi = min(lo + block, self.n_movies)
+            size = (hi - lo) * self.n_movies
+            scores = np.zeros(size)
+            common = np.zeros(size)
+            for rows, partners, products in self.pair_batches(lo, hi, max_pairs):
+                flat = rows * self.n_movies + partners
+                scores += np.bincount(flat, products, minlength=size)
+                common += np.bincount(flat, minlength=size)
+
+            scores = scores.reshape(hi - lo, self.n_movies)
+            common = common.reshape(hi - lo, self.n_movies)
+            scores[common < min_common] = -np.inf
+            scores[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf
+            if k <= 0:
+                continue
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for i, idx in enumerate(top):
+                idx = idx[np.argsort(-scores[i, idx], kind="stable")]
+                idx = idx[np.isfinite(scores[i, idx])]
+                yield lo + i, idx, scores[i, idx], common[i, idx]
+
+
+def build(db, k=20, min_ratings=20, min_common=5, center=False, memory_mb=512, batch_size=1000):
+    """
+    (Re)build similar_movies: one document per movie, _id = tmdbId, with its
+    top-k neighbours by cosine similarity (best first) and their titles.
+    """
+    start = time.time()
+    matrix = RatingMatrix(*load_ratings(db), min_ratings=min_ratings, center=center)
+    logger.info("Ratings matrix: %s users x %s movies, %s ratings in %.2fs",
+                f"{matrix.n_users:,}", f"{matrix.n_movies:,}", f"{len(matrix):,}", time.time() - start)
+
+    titles = {m["tmdbId"]: m.get("title") for m in db.movies.find(
+        {"tmdbId": {"$in": matrix.tmdb_ids.tolist()}}, {"_id": 0, "tmdbId": 1, "title": 1})}
+
+    db[COLLECTION].drop()
+    ops, written = [], 0
+    for i, idx, scores, common in matrix.neighbours(k, min_common, memory_mb):
+        tmdb_id = int(matrix.tmdb_ids[i])
+        ops.append(ReplaceOne({"_id": tmdb_id}, {
+            "_id": tmdb_id,
+            "title": titles.get(tmdb_id),
+            "ratings": int(matrix.counts[i]),
+            "neighbours": [
+                {"tmdbId": int(matrix.tmdb_ids[j]), "title": titles.get(int(matrix.tmdb_ids[j])),
+                 "score": round(float(s), 4), "common": int(c)}
+                for j, s, c in zip(idx, scores, common)
+            ]
+        }, upsert=True))
+        if len(ops) >= batch_size:
+            written += db[COLLECTION].bulk_write(ops, ordered=False).upserted_count
+            ops = []
+    if ops:
+        written += db[COLLECTION].bulk_write(ops, ordered=False).upserted_count
+
+    logger.info("%s: %s movies, top %d neighbours each, in %.2fs", COLLECTION, f"{written:,}", k, time.time() - start)
+    return written
+
+
+def build_pipeline(tmdb_id=862, top_n=10):
+    """Movies like `tmdb_id`: a primary-key lookup of the precomputed neighbours."""
+    return [
+        {"$match": {"_id": tmdb_id}},
+        {"$project": {"_id": 0, "neighbours": {"$slice": ["$neighbours", top_n]}}},
+        {"$unwind": "$neighbours"},
+        {"$replaceWith": "$neighbours"}
+    ]
+
+
+def similar(db, tmdb_id, top_n=10):
+    doc = db[COLLECTION].find_one({"_id": tmdb_id}, {"_id": 0, "neighbours": {"$slice": top_n}})
+    return doc["neighbours"] if doc else []
+
+
+def main():
+    import argparse
+    from DbConnector import DbConnector
+    from report import render, configure_logging
+    parser = argparse.ArgumentParser(description="Item-item movie similarities from the ratings matrix.")
+    parser.add_argument("tmdb_ids", nargs="*", type=int, help="movies to look up (default: rebuild the collection)")
+    parser.add_argument("--k", type=int, default=20, help="neighbours stored per movie")
+    parser.add_argument("--min-ratings", type=int, default=20)
+    parser.add_argument("--min-common", type=int, default=5, help="minimum users who rated both movies")
+    parser.add_argument("--center", action="store_true", help="adjusted cosine (user-mean centered)")
+    parser.add_argument("--memory-mb", type=int, default=512, help="working memory of the blocked product")
+    args = parser.parse_args()
+    configure_logging()
+
+    connection = DbConnector()
+    try:
+        if not args.tmdb_ids:
+            build(connection.db, args.k, args.min_ratings, args.min_common, args.center, args.memory_mb)
+            return
+        for tmdb_id in args.tmdb_ids:
+            start = time.time()
+            rows = similar(connection.db, tmdb_id)
+            print(f"\nMovies like {tmdb_id} ({(time.time() - start) * 1000:.1f} ms)")
+            render(rows)
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
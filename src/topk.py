@@ -0,0 +1,263 @@
+# topk.py
+import heapq
+import math
+import random
+from collections import Counter
+
+_PRIME = (1 << 61) - 1
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter sketch (Metwally et al.).
+    Monitors at most `capacity` items. Every item whose true frequency is
+    greater than n / capacity is guaranteed to be monitored, and each reported
+    count overestimates the true one by at most its `error` (<= n / capacity).
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = int(capacity)
+        self.n = 0
+        self.counts = {}
+        self.errors = {}
+        self.payloads = {}
+        # lazy min-heap of (count, tiebreak, item); stale entries are skipped
+        self._heap = []
+        self._tick = 0
+
+    @classmethod
+    def from_error(cls, epsilon):
+        """Sketch whose overestimation is bounded by epsilon * n."""
+        return cls(math.ceil(1 / epsilon))
+
+    def _push(self, item):
+        self._tick += 1
+        heapq.heappush(self._heap, (self.counts[item], self._tick, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i, it) for i, (it, c) in enumerate(self.counts.items())]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, _, item = heapq.heappop(self._heap)
+            if self.counts.get(item) == count:
+                return item, count
+
+    def offer(self, item, weight=1):
+        """
+        Count `item` and return its payload dict. A fresh (empty) payload is
+        returned whenever the item is (re)admitted, so callers can keep
+        per-item aggregates alongside the count.
+        """
+        self.n += weight
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = weight
+            self.errors[item] = 0
+            self.payloads[item] = {}
+        else:
+            evicted, min_count = self._pop_min()
+            del self.counts[evicted], self.errors[evicted], self.payloads[evicted]
+            self.counts[item] = min_count + weight
+            self.errors[item] = min_count
+            self.payloads[item] = {}
+        self._push(item)
+        return self.payloads[item]
+
+    def error_bound(self):
+        return self.n / self.capacity
+
+    def top(self, k=None):
+        """List of (item, count, error, payload) sorted by count descending."""
+        items = sorted(self.counts, key=lambda it: -self.counts[it])
+        if k is not None:
+            items = items[:k]
+        return [(it, self.counts[it], self.errors[it], self.payloads[it]) for it in items]
+
+
+class CountMinTopK:
+    """
+    Count-Min sketch plus a bounded candidate heap.
+    With width = ceil(e / epsilon) and depth = ceil(ln(1 / delta)), every
+    estimate overestimates the true count by at most epsilon * n with
+    probability >= 1 - delta. Only the `capacity` items with the highest
+    estimates are kept as candidates (with their payloads).
+    """
+
+    def __init__(self, epsilon=1e-4, delta=1e-3, capacity=1000, seed=0):
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.epsilon = epsilon
+        self.delta = delta
+        self.capacity = int(capacity)
+        self.n = 0
+        self.table = [[0] * self.width for _ in range(self.depth)]
+        # pairwise-independent row hashes: ((a * h + b) mod p) mod width
+        rng = random.Random(seed)
+        self.seeds = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(self.depth)]
+        self.counts = {}
+        self.payloads = {}
+        self._heap = []
+        self._tick = 0
+
+    def _columns(self, item):
+        h = hash(item)
+        return [((a * h + b) % _PRIME) % self.width for a, b in self.seeds]
+
+    def _add(self, item, weight):
+        estimate = None
+        for row, j in zip(self.table, self._columns(item)):
+            row[j] += weight
+            estimate = row[j] if estimate is None else min(estimate, row[j])
+        return estimate
+
+    def estimate(self, item):
+        return min(row[j] for row, j in zip(self.table, self._columns(item)))
+
+    def _push(self, item):
+        self._tick += 1
+        heapq.heappush(self._heap, (self.counts[item], self._tick, item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i, it) for i, (it, c) in enumerate(self.counts.items())]
+            heapq.heapify(self._heap)
+
+    def _peek_min(self):
+        while True:
+            count, _, item = self._heap[0]
+            if self.counts.get(item) == count:
+                return item, count
+            heapq.heappop(self._heap)
+
+    def offer(self, item, weight=1):
+        """
+        Count `item`; return its payload dict if it is (or becomes) a
+        candidate, otherwise None.
+        """
+        self.n += weight
+        estimate = self._add(item, weight)
+        if item not in self.counts:
+            if len(self.counts) >= self.capacity:
+                evicted, min_count = self._peek_min()
+                if estimate <= min_count:
+                    return None
+                heapq.heappop(self._heap)
+                del self.counts[evicted], self.payloads[evicted]
+            self.payloads[item] = {}
+        self.counts[item] = estimate
+        self._push(item)
+        return self.payloads[item]
+
+    def error_bound(self):
+        return self.epsilon * self.n
+
+    def top(self, k=None):
+        """List of (item, estimate, error_bound, payload) sorted by estimate descending."""
+        bound = self.error_bound()
+        items = sorted(self.counts, key=lambda it: -self.counts[it])
+        if k is not None:
+            items = items[:k]
+        return [(it, self.counts[it], bound, self.payloads[it]) for it in items]
+
+
+def make_sketch(method="space_saving", epsilon=1e-4, delta=1e-3, capacity=1000):
+    """
+    Build a heavy-hitter sketch.
+    - "space_saving": deterministic, error <= epsilon * n; monitors
+      max(ceil(1 / epsilon), capacity) items
+    - "count_min": probabilistic, error <= epsilon * n with prob. 1 - delta;
+      keeps `capacity` candidates
+    """
+    if method == "space_saving":
+        return SpaceSaving(max(math.ceil(1 / epsilon), capacity))
+    if method == "count_min":
+        return CountMinTopK(epsilon=epsilon, delta=delta, capacity=capacity)
+    raise ValueError(f"Unknown sketch method: {method}")
+
+
+def topk_recall(exact_keys, approx_keys):
+    """Fraction of the exact top-k keys that the approximate run also returned."""
+    exact_keys = list(exact_keys)
+    if not exact_keys:
+        return 1.0
+    return len(set(exact_keys) & set(approx_keys)) / len(exact_keys)
+
+
+def with_ties(rows, k, value):
+    """The first k rows plus any following rows tied with the k-th on `value`(row)."""
+    rows = list(rows)
+    if len(rows) <= k:
+        return rows
+    last = value(rows[k - 1])
+    end = k
+    while end < len(rows) and value(rows[end]) == last:
+        end += 1
+    return rows[:end]
+
+
+def validate(method="space_saving", epsilon=1e-3, k=20, n=200_000, universe=50_000, seed=42):
+    """
+    Check a sketch against exact counts on a Zipf-like stream: the error bound
+    must hold for every reported item and the exact top-k must be recovered.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) ** 1.1 for i in range(universe)]
+    stream = rng.choices(range(universe), weights=weights, k=n)
+
+    exact = Counter(stream)
+    sketch = make_sketch(method, epsilon=epsilon, capacity=10 * k)
+    for item in stream:
+        sketch.offer(item)
+
+    approx = sketch.top(k)
+    bound = sketch.error_bound()
+    max_error = max(count - exact[item] for item, count, _, _ in approx)
+    recall = topk_recall([item for item, _ in exact.most_common(k)], [item for item, *_ in approx])
+
+    assert max_error <= bound, f"{method}: error {max_error} exceeds bound {bound:.1f}"
+    assert all(count >= exact[item] for item, count, _, _ in approx), f"{method}: underestimated count"
+    assert recall == 1.0, f"{method}: top-{k} recall {recall:.2f}"
+    return {"method": method, "max_error": max_error, "error_bound": bound, "recall": recall}
+
+
+def validate_queries(k=20, epsilon=1e-5):
+    """
+    Top-k recall of the approximate query2 and query8 pairs against their
+    exact reducers (count_actor_pairs and the query8 pipeline) on the loaded
+    movies, for both sketches.
+    """
+    from query2 import MovieQueryExecutor
+    from query8 import DirectorActorPairsQuery
+
+    rows = []
+    pairs, directors = MovieQueryExecutor(quiet=True), DirectorActorPairsQuery(quiet=True)
+    try:
+        for method in ("space_saving", "count_min"):
+            rows.append({"query": "query2", "method": method, **pairs.validate_approximate(k, method=method, epsilon=epsilon)})
+            rows.append({"query": "query8", "method": method, **directors.validate_approximate(k, method=method, epsilon=epsilon)})
+    finally:
+        pairs.close()
+        directors.close()
+    return rows
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Check the heavy-hitter sketches against exact counts.")
+    parser.add_argument("--data", action="store_true", help="also compare query2/query8 against the loaded movies")
+    args = parser.parse_args()
+
+    for method in ("space_saving", "count_min"):
+        r = validate(method)
+        print(f"{r['method']:12} | max error {r['max_error']:>5} | bound {r['error_bound']:>7.1f} | top-k recall {r['recall']:.2f}")
+    if args.data:
+        from report import configure_logging
+        configure_logging()
+        for r in validate_queries():
+            print(f"{r['query']:6} {r['method']:12} | top-{r['k']} recall {r['recall']:.2f} | exact {r['exact_s']:.2f}s | approximate {r['approximate_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
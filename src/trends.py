@@ -0,0 +1,156 @@
+# trends.py
+import time
+from datetime import datetime
+import ratings_schema
+from report import logger
+
+TIMESERIES = "ratings_ts"
+
+# "hours" is the coarsest granularity (there is no "days"): buckets span up
+# to 30 days (bucketMaxSpanSeconds 2592000), against 1 hour for "seconds" and
+# 1 day for "minutes". A movie gets a few ratings a day at most, so coarser
+# buckets hold more measurements each over the two decades of ratings.
+GRANULARITY = "hours"
+
+# first server version with $out to a time-series collection
+SERVER_TIMESERIES_OUT = (7, 0, 3)
+
+
+def parse_date(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def fields(timeseries):
+    """(tmdbId, userId) paths: top-level in ratings, under `meta` in ratings_ts."""
+    return ("meta.tmdbId", "meta.userId") if timeseries else ("tmdbId", "userId")
+
+
+def time_match(start, end, extra=None):
+    """Leading $match on a half-open [start, end) timestamp range (uses the time index)."""
+    return {"$match": {**(extra or {}), "timestamp": {"$gte": parse_date(start), "$lt": parse_date(end)}}}
+
+
+def rolling_stages(partition, unit, window):
+    """
+    Rolling count and mean over the current and `window - 1` previous periods.
+    Periods carry (count, total) so the rolling mean weights every rating the
+    same, whatever the number of ratings per period.
+    """
+    spec = {"range": [-(window - 1), 0], "unit": unit}
+    stages = [
+        {
+            "$setWindowFields": {
+                **({"partitionBy": partition} if partition else {}),
+                "sortBy": {"period": 1},
+                "output": {
+                    "rolling_count": {"$sum": "$count", "window": spec},
+                    "rolling_total": {"$sum": "$total", "window": spec},
+                    "previous_mean": {"$shift": {"output": "$mean", "by": -1}}
+                }
+            }
+        },
+        {
+            "$set": {
+                "rolling_mean": {"$round": [{"$divide": ["$rolling_total", "$rolling_count"]}, 3]},
+                "change": {"$cond": [
+                    {"$eq": ["$previous_mean", None]}, None,
+                    {"$round": [{"$subtract": ["$mean", "$previous_mean"]}, 3]}
+                ]}
+            }
+        },
+        {"$unset": ["rolling_total", "previous_mean"]}
+    ]
+    return stages
+
+
+def movie_pipeline(tmdb_id=862, start="1995-01-01", end="2018-01-01", unit="month", window=3, timeseries=False):
+    """Ratings of one movie per `unit`, with a `window`-period rolling mean."""
+    tmdb_field, _ = fields(timeseries)
+    return [
+        time_match(start, end, {tmdb_field: tmdb_id}),
+        {
+            "$group": {
+                "_id": {"$dateTrunc": {"date": "$timestamp", "unit": unit}},
+                "count": {"$sum": 1},
+                "total": {"$sum": "$rating"}
+            }
+        },
+        {"$project": {"_id": 0, "period": "$_id", "count": 1, "total": 1,
+                      "mean": {"$round": [{"$divide": ["$total", "$count"]}, 3]}}},
+        *rolling_stages(None, unit, window),
+        {"$unset": "total"},
+        {"$sort": {"period": 1}}
+    ]
+
+
+def genre_pipeline(start="1995-01-01", end="2018-01-01", unit="year", window=3, genre=None, timeseries=False):
+    """
+    Ratings per genre and `unit` with a rolling mean per genre. Ratings are
+    reduced to (movie, period) before the movies $lookup, so the join runs
+    once per movie and period instead of once per rating.
+    """
+    tmdb_field, _ = fields(timeseries)
+    return [
+        time_match(start, end),
+        {
+            "$group": {
+                "_id": {"tmdbId": f"${tmdb_field}", "period": {"$dateTrunc": {"date": "$timestamp", "unit": unit}}},
+                "count": {"$sum": 1},
+                "total": {"$sum": "$rating"}
+            }
+        },
+        {
+            "$lookup": {
+                "from": "movies",
+                "localField": "_id.tmdbId",
+                "foreignField": "tmdbId",
+                "pipeline": [{"$project": {"_id": 0, "genres.name": 1}}],
+                "as": "movie"
+            }
+        },
+        {"$unwind": "$movie"},
+        {"$unwind": "$movie.genres"},
+        *([{"$match": {"movie.genres.name": genre}}] if genre else []),
+        {
+            "$group": {
+                "_id": {"genre": "$movie.genres.name", "period": "$_id.period"},
+                "count": {"$sum": "$count"},
+                "total": {"$sum": "$total"},
+                "movies": {"$sum": 1}
+            }
+        },
+        {"$project": {"_id": 0, "genre": "$_id.genre", "period": "$_id.period", "count": 1, "total": 1, "movies": 1,
+                      "mean": {"$round": [{"$divide": ["$total", "$count"]}, 3]}}},
+        *rolling_stages("$genre", unit, window),
+        {"$unset": "total"},
+        {"$sort": {"genre": 1, "period": 1}}
+    ]
+
+
+def check_server(db):
+    """Fail early on servers where build_timeseries cannot $out to a time series."""
+    version = tuple(db.client.server_info()["versionArray"][:3])
+    if version < SERVER_TIMESERIES_OUT:
+        raise RuntimeError(f"{TIMESERIES} needs MongoDB {'.'.join(map(str, SERVER_TIMESERIES_OUT))}+ "
+                           f"($out to a time-series collection); the server is {'.'.join(map(str, version))}")
+
+
+def build_timeseries(db, granularity=GRANULARITY):
+    """
+    (Re)build the ratings_ts time-series collection from ratings: timeField
+    `timestamp`, metaField `meta` {userId, tmdbId}. Needs MongoDB 7.0.3+
+    ($out to a time-series collection) and ratings with date timestamps.
+    """
+    check_server(db)
+    start = time.time()
+    pipeline = ratings_schema.translate(db, [
+        {"$match": {"tmdbId": {"$ne": None}}},
+        {"$project": {"_id": 0, "timestamp": 1, "rating": 1, "meta": {"userId": "$userId", "tmdbId": "$tmdbId"}}},
+        {"$out": {"db": db.name, "coll": TIMESERIES,
+                  "timeseries": {"timeField": "timestamp", "metaField": "meta", "granularity": granularity}}}
+    ])
+    db.ratings.aggregate(pipeline, allowDiskUse=True)
+    db[TIMESERIES].create_index([("meta.tmdbId", 1), ("timestamp", 1)])
+    count = db[TIMESERIES].estimated_document_count()
+    logger.info("%s: %s measurements in %.2fs", TIMESERIES, f"{count:,}", time.time() - start)
+    return count
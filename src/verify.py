@@ -0,0 +1,161 @@
+# verify.py
+from statistics import NormalDist
+from math import sqrt
+import time
+import ratings_schema
+from report import logger
+
+COLLECTIONS = ["movies", "ratings", "people", "credits"]
+
+
+def lookup_check(name, from_, local, foreign):
+    """Stages setting `name` to whether `local` matches a document in `from_`."""
+    tmp = f"_{name}"
+    return [
+        {"$lookup": {"from": from_, "localField": local, "foreignField": foreign, "as": tmp}},
+        {"$set": {name: {"$gt": [{"$size": f"${tmp}"}, 0]}}},
+        {"$unset": tmp}
+    ]
+
+
+# collection -> checks run on sampled documents: (name, stages that set `name` to a boolean)
+CHECKS = {
+    "movies": [
+        ("tmdbId_is_int", [{"$set": {"tmdbId_is_int": {"$in": [{"$type": "$tmdbId"}, ["int", "long"]]}}}]),
+        ("has_title", [{"$set": {"has_title": {"$gt": [{"$strLenCP": {"$ifNull": ["$title", ""]}}, 0]}}}])
+    ],
+    "ratings": [
+        ("tmdbId_is_movie", lookup_check("tmdbId_is_movie", "movies", "tmdbId", "tmdbId")),
+        ("rating_in_range", [{"$set": {"rating_in_range": {"$and": [
+            {"$gte": ["$rating", 0.5]}, {"$lte": ["$rating", 5]}
+        ]}}}])
+    ],
+    "credits": [
+        ("person_exists", lookup_check("person_exists", "people", "person_id", "id")),
+        ("tmdbId_is_movie", lookup_check("tmdbId_is_movie", "movies", "tmdbId", "tmdbId"))
+    ]
+}
+
+
+def wilson_interval(passed, n, confidence=0.95):
+    """Wilson score interval for a pass rate of passed/n."""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = passed / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def collection_totals(db, names=COLLECTIONS):
+    """Document counts from collection metadata and sizes from collStats: no scans."""
+    totals = {}
+    for name in names:
+        stats = db.command("collStats", name)
+        totals[name] = {
+            "count": db[name].estimated_document_count(),
+            "size": stats.get("size", 0),
+            "storage_size": stats.get("storageSize", 0),
+            "indexes": stats.get("nindexes", 0)
+        }
+    return totals
+
+
+def sample_checks(db, collection, sample_size=1000, confidence=0.95, compact=False):
+    """
+    Run CHECKS[collection] on `sample_size` random documents in one aggregation.
+    $sample stays the first stage so the server uses its random cursor instead
+    of a collection scan. Returns one row per check with its pass rate and
+    confidence interval.
+    """
+    checks = CHECKS[collection]
+    pipeline = [{"$sample": {"size": sample_size}}]
+    if collection == "ratings" and compact:
+        pipeline.append(ratings_schema.expand_stage())
+    for _, stages in checks:
+        pipeline.extend(stages)
+    group = {"_id": None, "n": {"$sum": 1}}
+    for name, _ in checks:
+        group[name] = {"$sum": {"$cond": [f"${name}", 1, 0]}}
+    pipeline.append({"$group": group})
+
+    result = next(db[collection].aggregate(pipeline), {"n": 0})
+    rows = []
+    for name, _ in checks:
+        passed = result.get(name, 0)
+        low, high = wilson_interval(passed, result["n"], confidence)
+        rows.append({
+            "collection": collection,
+            "check": name,
+            "sampled": result["n"],
+            "passed": passed,
+            "rate": passed / result["n"] if result["n"] else None,
+            "ci_low": low,
+            "ci_high": high
+        })
+    return rows
+
+
+def load_counters(db):
+    """Counts recorded by the loader in load_state while it was writing."""
+    return {doc["_id"]: doc for doc in db.load_state.find()}
+
+
+def verify(db, sample_size=1000, confidence=0.95, compact=None):
+    """
+    Post-load verification in a few round trips: metadata totals compared with
+    the loader's own counters, plus sampled integrity checks per collection.
+    """
+    start = time.time()
+    if compact is None:
+        compact = ratings_schema.is_compact(db)
+    totals = collection_totals(db)
+    counters = load_counters(db)
+
+    counts = []
+    for name, total in totals.items():
+        expected = counters.get(name, {}).get("rows")
+        counts.append({
+            "collection": name,
+            "count": total["count"],
+            "loaded": expected,
+            "matches": None if expected is None else total["count"] == expected,
+            "size_mb": total["size"] / 2**20,
+            "storage_mb": total["storage_size"] / 2**20,
+            "indexes": total["indexes"]
+        })
+
+    samples = []
+    for collection in CHECKS:
+        if totals[collection]["count"]:
+            samples.extend(sample_checks(db, collection, sample_size, confidence, compact))
+
+    elapsed = time.time() - start
+    logger.info("Verification finished in %.2fs", elapsed)
+    return {
+        "counts": counts,
+        "samples": samples,
+        "unmapped_ratings": counters.get("ratings", {}).get("unmapped", 0),
+        "elapsed": elapsed
+    }
+
+
+def main():
+    from DbConnector import DbConnector
+    from report import render, configure_logging
+    configure_logging()
+    connection = DbConnector()
+    try:
+        result = verify(connection.db)
+        render(result["counts"])
+        print()
+        render(result["samples"])
+        print(f"\nRatings without tmdbId (not loaded): {result['unmapped_ratings']:,}")
+    finally:
+        connection.close_connection()
+
+
+if __name__ == "__main__":
+    main()
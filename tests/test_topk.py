@@ -0,0 +1,115 @@
+import random
+from collections import Counter
+
+import pytest
+
+from topk import make_sketch, topk_recall, with_ties
+from query2 import MovieQueryExecutor, count_actor_pairs
+from query8 import DirectorActorPairsQuery
+
+METHODS = ["space_saving", "count_min"]
+
+
+class FakeMovies:
+    def __init__(self, movies):
+        self.movies = movies
+
+    def find(self, *args, **kwargs):
+        return iter(self.movies)
+
+
+class FakeDb:
+    def __init__(self, movies):
+        self.movies = FakeMovies(movies)
+
+
+def synthetic_movies(n=3000, people=2000, seed=7):
+    """Movies whose casts and directors are drawn from a Zipf-like population."""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) ** 1.2 for i in range(people)]
+    movies = []
+    for t in range(n):
+        cast = {p: {"id": p, "name": f"actor {p}"} for p in rng.choices(range(people), weights=weights, k=rng.randint(2, 8))}
+        directors = rng.choices(range(people), weights=weights, k=rng.randint(1, 2))
+        movies.append({
+            "title": f"movie {t}",
+            "vote_average": round(rng.uniform(1, 10), 1),
+            "revenue": rng.randint(0, 10**6),
+            "cast": list(cast.values()),
+            "crew": [{"name": f"director {d}", "job": "Director"} for d in directors]
+        })
+    return movies
+
+
+def actor_pairs(movies):
+    for movie in movies:
+        actors = sorted(a["id"] for a in movie["cast"])
+        for i in range(len(actors)):
+            for j in range(i + 1, len(actors)):
+                yield actors[i], actors[j]
+
+
+def director_pairs(movies):
+    for movie in movies:
+        for director in movie["crew"]:
+            for actor in movie["cast"]:
+                yield director["name"], actor["name"]
+
+
+def executor(cls, movies):
+    query = cls.__new__(cls)
+    query.db = FakeDb(movies)
+    query.quiet = True
+    return query
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("pairs", [actor_pairs, director_pairs])
+def test_sketch_bounds_and_recall(method, pairs):
+    stream = list(pairs(synthetic_movies()))
+    exact = Counter(stream)
+    sketch = make_sketch(method, epsilon=1e-3, capacity=200)
+    for pair in stream:
+        sketch.offer(pair)
+
+    bound = sketch.error_bound()
+    for pair, count, error, _ in sketch.top():
+        assert exact[pair] <= count <= exact[pair] + error
+        assert error <= bound
+
+    k = 20
+    approx = with_ties(sketch.top(), k, lambda row: row[1])
+    expected = with_ties(exact.most_common(), k, lambda row: row[1])[:k]
+    assert topk_recall([pair for pair, _ in expected], [row[0] for row in approx]) == 1.0
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_query2_threshold_uses_lower_bound(method):
+    movies = synthetic_movies()
+    exact = Counter(actor_pairs(movies))
+    # a coarse sketch evicts and readmits pairs, inflating their counts
+    rows = executor(MovieQueryExecutor, movies).query_actor_pairs_approximate(3, method, epsilon=2e-3)
+
+    assert rows
+    for row in rows:
+        true = exact[(row["actor1_id"], row["actor2_id"])]
+        assert true >= row["movies_seen"] >= 3
+        assert true <= row["co_appearances"] <= true + row["count_error"]
+
+    top = count_actor_pairs(movies, 3)[:20]
+    got = {(row["actor1_id"], row["actor2_id"]) for row in rows}
+    assert topk_recall([(r["actor1_id"], r["actor2_id"]) for r in top], got) == 1.0
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_query8_threshold_uses_lower_bound(method):
+    movies = synthetic_movies()
+    exact = Counter(director_pairs(movies))
+    rows = executor(DirectorActorPairsQuery, movies).approximate_director_actor_pairs(
+        3, None, method, epsilon=2e-3, director_job="Director")
+
+    assert rows
+    for row in rows:
+        true = exact[(row["director"], row["actor"])]
+        assert true >= row["films_seen"] >= 3
+        assert true <= row["films_count"] <= true + row["count_error"]